@@ -14,6 +14,9 @@ from zoneinfo import ZoneInfo
 import ffmpeg
 from dotenv import load_dotenv
 
+import deadline
+import ftp_listing
+from ftp_listing import list_directory, normalize_time
 from paths import resolve_path
 from Webcam import (
     MOUNTAIN_TIME,
@@ -28,6 +31,9 @@ load_dotenv(resolve_path("environment.env"))
 
 logger = logging.getLogger(__name__)
 
+# Overlaid by FFmpeg, which reads the file itself
+LOGO_PATH = "overlays/logo-shaded-video.png"
+
 
 class AllskyVideo(Webcam):
     """
@@ -56,12 +62,21 @@ class AllskyVideo(Webcam):
         self.mod_time = None
         self.mod_time_str = ""
         self.upload = None
-        self.processed_today = False
+        # Mountain Time date the video was last seen published; a daemon
+        # lives through midnight, so a plain flag would carry over to tomorrow.
+        self.processed_on = None
 
     def process(self):
         """
         Process video - override parent method to add daily processing check.
         """
+        # A daemon keeps this object for its whole life: last round's video,
+        # uploaded and deleted from the FTP server since, must not be offered
+        # to upload_image() again.
+        self.available = False
+        self.file_buffer = io.BytesIO()
+        self.logoed = io.BytesIO()
+
         logger.info(f"{self.name}: Checking if video already processed today...")
 
         try:
@@ -87,44 +102,71 @@ class AllskyVideo(Webcam):
         if the output file exists on the upload server.
 
         "Today" is a Mountain Time day, which is when the overnight video
-        arrives and is watched; `now` is injectable for tests.
+        arrives and is watched; `now` is injectable for tests. Existence and
+        modification time come from the round's listing of the upload account
+        (see ftp_listing); MDTM is asked only if the listing has no time.
         """
+        today = (now or datetime.now(MOUNTAIN_TIME)).date()
+        ftp = None
         try:
-            # Connect to the upload FTP server
-            ftp = connect_ftp(
-                os.getenv("server"), os.getenv("username"), os.getenv("password")
+            listing, ftp = self._round_listing(
+                os.getenv("username"), os.getenv("password")
             )
+            entry = listing.get(f"{self.name}.mp4") if listing else None
 
-            try:
-                # Check if our processed video file exists
-                files = ftp.nlst()
-                video_exists = f"{self.name}.mp4" in files
-
-                if video_exists:
-                    # Check if it was modified today by getting its modification time
-                    try:
+            if entry is not None:
+                # Check if it was modified today by getting its modification time
+                try:
+                    mod_time_str = entry.modify
+                    if not mod_time_str:
+                        if ftp is None:
+                            ftp = connect_ftp(
+                                os.getenv("server"),
+                                os.getenv("username"),
+                                os.getenv("password"),
+                            )
                         mod_time_str = ftp.voidcmd(f"MDTM {self.name}.mp4")[4:]
-                        # MDTM replies are UTC; convert before comparing dates,
-                        # or every evening upload looks like tomorrow's.
-                        mod_time = (
-                            datetime.strptime(mod_time_str.strip(), "%Y%m%d%H%M%S")
-                            .replace(tzinfo=ZoneInfo("UTC"))
-                            .astimezone(MOUNTAIN_TIME)
-                        )
-                        today = (now or datetime.now(MOUNTAIN_TIME)).date()
-
-                        self.processed_today = mod_time.date() == today
-                    except Exception:
-                        # If we can't get mod time, assume it's processed if file exists
-                        self.processed_today = True
+                    # MDTM replies are UTC; convert before comparing dates,
+                    # or every evening upload looks like tomorrow's.
+                    mod_time = (
+                        datetime.strptime(normalize_time(mod_time_str), "%Y%m%d%H%M%S")
+                        .replace(tzinfo=ZoneInfo("UTC"))
+                        .astimezone(MOUNTAIN_TIME)
+                    )
+                    if mod_time.date() == today:
+                        self.processed_on = today
+                except Exception:
+                    # If we can't get mod time, assume it's processed if file exists
+                    self.processed_on = today
 
-                return self.processed_today
-            finally:
-                close_ftp(ftp)
+            return self.processed_on == today
 
         except Exception:
             # If we can't connect or check, assume not processed to be safe
             return False
+        finally:
+            close_ftp(ftp)
+
+    def _round_listing(self, user, password):
+        """This round's directory listing for `user`, and any connection opened.
+
+        Returns (listing, ftp): `ftp` is the connection this call opened to
+        fetch the listing, for the caller to reuse and close, or None if the
+        listing came from another thread (a camera on the same account, most
+        mornings) and no connection was needed.
+        """
+        opened = []
+
+        def fetch():
+            opened.append(connect_ftp(os.getenv("server"), user, password))
+            return list_directory(opened[0])
+
+        try:
+            listing = ftp_listing.snapshot((os.getenv("server"), user), fetch)
+        except BaseException:
+            close_ftp(opened[0] if opened else None)
+            raise
+        return listing, (opened[0] if opened else None)
 
     def get(self, max_retries=3, retry_delay=2):
         """
@@ -146,6 +188,7 @@ class AllskyVideo(Webcam):
                 self.file_buffer = io.BytesIO()  # Discard any partial read
                 if attempt < max_retries - 1:
                     delay = retry_delay_for(retry_delay, attempt, e)
+                    deadline.check(f"{self.name} video download", delay)
                     logger.info(f"{self.name}: retrying download in {delay:.1f}s...")
                     sleep(delay)
                 else:
@@ -159,20 +202,26 @@ class AllskyVideo(Webcam):
         One download attempt: check the file exists on the server, pull it into
         the buffer, save it to disk and record its modification time.
         Sets self.available to True if video is found and downloaded successfully.
+
+        The existence check reads the round's listing, so on the many rounds
+        with no video waiting no connection is opened at all.
         """
-        # Connect to the FTP server
-        ftp = connect_ftp(os.getenv("server"), self.username, self.password)
+        listing, ftp = self._round_listing(self.username, self.password)
 
         try:
             # Check if file is there, if it's not we don't need to do anything else
-            # with this object on this round.
-            if self.file_name_on_server not in ftp.nlst():
+            # with this object on this round. A server that gives no listing
+            # gets a RETR regardless, and a 550 if there is nothing.
+            entry = listing.get(self.file_name_on_server) if listing else None
+            if listing is not None and entry is None:
                 return
+            if ftp is None:
+                ftp = connect_ftp(os.getenv("server"), self.username, self.password)
 
             # Save the file into the buffer. The file can disappear between the
-            # nlst() check above and this RETR (an overlapping cron run deletes
-            # it after processing), so treat a failed download as "not
-            # available" instead of letting the 550 crash the run.
+            # listing above and this RETR (an overlapping cron run deletes it
+            # after processing), so treat a failed download as "not available"
+            # instead of letting the 550 crash the run.
             try:
                 ftp.retrbinary(
                     f"RETR {self.file_name_on_server}", self.file_buffer.write
@@ -182,7 +231,11 @@ class AllskyVideo(Webcam):
                 return
             self.file_buffer.seek(0)
 
-            self._set_modification_time(ftp)  # Set the file modification time.
+            # Set the file modification time.
+            if entry is not None and entry.modify:
+                self._record_mdtm(entry.modify)
+            else:
+                self._set_modification_time(ftp)
 
             # Save the video to disk
             with open(self.raw_video_path, "wb") as allsky:
@@ -194,6 +247,14 @@ class AllskyVideo(Webcam):
         finally:
             close_ftp(ftp)
 
+    def preload(self):
+        """Check the logo is on disk; FFmpeg decodes it, so nothing is cached.
+
+        Raises OSError if it is missing, found at startup rather than after the
+        night's video has been downloaded.
+        """
+        os.stat(resolve_path(LOGO_PATH))
+
     def add_logo(self):
         """
         Apply logo overlay to the downloaded video using FFmpeg.
@@ -218,7 +279,7 @@ class AllskyVideo(Webcam):
 
         # Set up the input and output streams
         input_stream = ffmpeg.input(self.raw_video_path)
-        logo_stream = ffmpeg.input(resolve_path("overlays/logo-shaded-video.png"))
+        logo_stream = ffmpeg.input(resolve_path(LOGO_PATH))
         output_stream = ffmpeg.output(
             input_stream.overlay(
                 logo_stream, x=self.logo_place[0], y=self.logo_place[1]
@@ -295,9 +356,13 @@ class AllskyVideo(Webcam):
         ftp = connect_ftp(os.getenv("server"), self.username, self.password)
 
         try:
-            # Remove the allsky video
-            if self.file_name_on_server in ftp.nlst():
-                ftp.delete(self.file_name_on_server)
+            # Remove the allsky video. Deleted without listing first: a 550
+            # just means an overlapping run got there already.
+            ftp.delete(self.file_name_on_server)
+        except error_perm as e:
+            if not str(e).startswith("550"):
+                raise
+            logger.debug(f"{self.name}: video already gone from the FTP server")
         finally:
             close_ftp(ftp)
 
@@ -13,6 +13,7 @@ from time import sleep
 
 import requests
 
+import deadline
 from Overlays import USER_AGENT
 from Webcam import Webcam, retry_delay_for
 
@@ -34,12 +35,23 @@ class HttpWebcam(Webcam):
     them every few hours, and the pipeline polls twice a minute.
     """
 
-    def __init__(self, name, url, logo_placements=None, blackout=False, timeout=20):
+    def __init__(
+        self,
+        name,
+        url,
+        logo_placements=None,
+        blackout=False,
+        jpeg_splice=False,
+        timeout=20,
+        priority="normal",
+    ):
         super().__init__(
             name,
             file_name_on_server=None,
             logo_placements=logo_placements,
             blackout=blackout,
+            jpeg_splice=jpeg_splice,
+            priority=priority,
         )
         self.url = url
         self.timeout = timeout
@@ -47,6 +59,13 @@ class HttpWebcam(Webcam):
         # on-disk record once that frame has been uploaded.
         self._pending_validators = None
 
+    def is_source_error(self, error):
+        """Whether a failed download's `error` is this camera's source's fault.
+
+        Each HTTP camera has a URL of its own, so any failure to fetch it is.
+        """
+        return isinstance(error, requests.RequestException)
+
     def _download_image(self, max_retries=3, retry_delay=2):
         """Fetch the source image over HTTP with retry logic."""
         self.source_unchanged = False
@@ -54,15 +73,23 @@ class HttpWebcam(Webcam):
         headers = {"User-Agent": USER_AGENT, **self._conditional_headers()}
 
         for attempt in range(max_retries):
+            # A stalled server is waited on no longer than the round has left
+            deadline.check(f"{self.name} download")
+            left = deadline.remaining()
+            timeout = self.timeout if left is None else min(self.timeout, left)
             try:
-                response = requests.get(self.url, headers=headers, timeout=self.timeout)
+                response = requests.get(self.url, headers=headers, timeout=timeout)
                 response.raise_for_status()
             except requests.RequestException as e:
+                if isinstance(e, requests.Timeout) and timeout < self.timeout:
+                    # Cut short by the deadline, not the server's fault
+                    deadline.check(f"{self.name} download", timeout)
                 logger.warning(
                     f"  {self.name}: Download failed (attempt {attempt + 1}): {e}"
                 )
                 if attempt < max_retries - 1:
                     delay = retry_delay_for(retry_delay, attempt, e)
+                    deadline.check(f"{self.name} download", delay)
                     logger.info(f"  {self.name}: Retrying download in {delay:.1f}s...")
                     sleep(delay)
                     continue
@@ -86,15 +113,15 @@ class HttpWebcam(Webcam):
             logger.debug(f"  {self.name}: Download successful")
             return
 
-    def upload_image(self, max_retries=3, retry_delay=2):
-        """Upload as `Webcam` does, then remember which frame was published.
+    def _promote_source_stamp(self):
+        """Remember which frame was published, as `Webcam` does, by validators.
 
-        The validators are recorded only after a successful upload: a frame
-        that was fetched but never made it to glacier.org must be fetched
-        again next run, not skipped as already seen.
+        Only called after a successful upload: a frame that was fetched but
+        never made it to glacier.org must be fetched again next run, not
+        skipped as already seen.
         """
-        super().upload_image(max_retries=max_retries, retry_delay=retry_delay)
-        if self._pending_validators and not self.source_unchanged:
+        super()._promote_source_stamp()
+        if self._pending_validators:
             self._write_validators(self._pending_validators)
 
     # -- conditional-request bookkeeping -------------------------------------
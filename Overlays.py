@@ -2,6 +2,7 @@
 Overlay classes for webcam image processing.
 """
 
+import fcntl
 import io
 import json
 import logging
@@ -12,11 +13,14 @@ import tempfile
 import threading
 import time
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 
 import requests
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, JpegImagePlugin
 
-from paths import resolve_path
+import compositing
+from asset_cache import LRUCache, load_font, load_image
+from jpeg_splice import splice_jpeg
 
 logger = logging.getLogger(__name__)
 
@@ -31,14 +35,71 @@ USER_AGENT = "GNPC-webcams/1.0 (+https://glacier.org/webcam)"
 JPEG_QUALITY = 90
 
 
+def decode_jpeg(buffer):
+    """Decode a source JPEG to RGB, remembering how it was encoded.
+
+    The quantization tables and chroma subsampling ride along in the frame's
+    `info`, so a feed set to `quality: keep` can re-encode with them.
+    """
+    with Image.open(buffer) as source:
+        frame = source.convert("RGB")
+        if getattr(source, "quantization", None):
+            frame.info["source_tables"] = {
+                "qtables": source.quantization,
+                "subsampling": JpegImagePlugin.get_sampling(source),
+            }
+    return frame
+
+
+def jpeg_save_options(encoding, image):
+    """Pillow `save()` arguments for a feed's `encoding` block.
+
+    With no block this is just `quality=JPEG_QUALITY`, as every feed has always
+    been encoded. `quality: keep` reuses the source's own quantization tables
+    (and, unless told otherwise, its subsampling), so the re-encode adds as
+    little loss as a re-encode can; a source whose tables are unknown gets
+    JPEG_QUALITY instead.
+    """
+    encoding = encoding or {}
+    source = image.info.get("source_tables")
+    options = {}
+
+    quality = encoding.get("quality", JPEG_QUALITY)
+    if quality == "keep" and source:
+        options["qtables"] = source["qtables"]
+    else:
+        options["quality"] = JPEG_QUALITY if quality == "keep" else int(quality)
+
+    subsampling = encoding.get("subsampling")
+    if subsampling is None and quality == "keep":
+        subsampling = "keep"
+    if subsampling == "keep":
+        if source and source["subsampling"] != -1:
+            options["subsampling"] = source["subsampling"]
+    elif subsampling is not None:
+        options["subsampling"] = subsampling
+
+    for flag in ("optimize", "progressive"):
+        if encoding.get(flag):
+            options[flag] = True
+    for marker in ("restart_marker_blocks", "restart_marker_rows"):
+        if encoding.get(marker):
+            options[marker] = int(encoding[marker])
+    return options
+
+
 class Overlay(ABC):
     """Abstract base class for image overlays."""
 
-    def __init__(self, place, size, subname=None):
+    def __init__(self, place, size, subname=None, encoding=None, priority=None):
         self.place = place
         self.size = size
         self.subname = subname
-        self.overlayed = io.BytesIO()
+        # How this feed is encoded; see jpeg_save_options.
+        self.encoding = dict(encoding) if encoding else {}
+        # "high", "normal" or "low" for this feed's place in the upload order;
+        # None leaves it to the camera's priority (see pipeline.py).
+        self.priority = priority
 
     @abstractmethod
     def apply(self, image, mod_time_str=""):
@@ -50,19 +111,46 @@ class Overlay(ABC):
         place.
         """
 
+    def preload(self):
+        """Load the images and fonts this overlay draws with into the caches.
+
+        Called while the config is loaded, so the parsing happens once on the
+        main thread instead of in the first camera thread to need each asset.
+        """
+
     def add_overlay(self, image, mod_time_str=""):
-        """Apply the overlay to a JPEG buffer, leaving the result in `overlayed`."""
-        self.overlayed = io.BytesIO()
-        with Image.open(image) as source:
-            # convert() returns a fresh copy, so the caller's buffer is untouched.
-            result = self.apply(source.convert("RGB"), mod_time_str)
-        result.save(self.overlayed, format="JPEG", quality=JPEG_QUALITY)
-        self.overlayed.seek(0)
+        """Apply the overlay to a JPEG buffer and return the encoded result."""
+        # decode_jpeg() returns a fresh copy, so the caller's buffer is untouched.
+        return self.encode(self.apply(decode_jpeg(image), mod_time_str))
+
+    def render(self, frame, mod_time_str="", source_jpeg=None):
+        """Apply the overlay to an already decoded frame and return the encoded
+        JPEG as a rewound BytesIO.
+
+        Nothing is kept on the instance, so a camera can render its feeds on
+        several threads at once. The frame is copied before drawing, so one
+        decode can be shared by every feed of a camera without any of them
+        seeing another's overlay. Given the frame's `source_jpeg` bytes, only
+        the blocks the overlay changed are re-encoded (see jpeg_splice); a
+        source that can't be spliced is encoded in full as usual.
+        """
+        result = self.apply(frame.copy(), mod_time_str)
+        if source_jpeg is not None:
+            spliced = splice_jpeg(source_jpeg, frame, result)
+            if spliced is not None:
+                return io.BytesIO(spliced)
+        return self.encode(result)
+
+    def encode(self, result):
+        """Encode a drawn frame with this feed's `encoding` settings."""
+        output = io.BytesIO()
+        result.save(output, format="JPEG", **jpeg_save_options(self.encoding, result))
+        output.seek(0)
+        return output
 
-    def get_overlayed_img(self, name):
-        """Get the overlayed image with appropriate filename."""
-        name += f"_{self.subname}.jpg" if self.subname else ".jpg"
-        return self.overlayed, name
+    def file_name(self, name):
+        """The published file name of this feed of camera `name`."""
+        return name + (f"_{self.subname}.jpg" if self.subname else ".jpg")
 
 
 class Logo(Overlay):
@@ -82,8 +170,10 @@ class Logo(Overlay):
         cover_date_text_position=(4, 3),
         cover_date_text_color=(255, 255, 255),
         cover_date_text_scale=1.0,
+        encoding=None,
+        priority=None,
     ):
-        super().__init__(place, size, subname)
+        super().__init__(place, size, subname, encoding, priority)
         self.logo_img = img
         self.cover_date = cover_date
         self.cover_date_img = cover_date_img
@@ -96,67 +186,137 @@ class Logo(Overlay):
         self.cover_date_text_color = cover_date_text_color
         self.cover_date_text_scale = cover_date_text_scale
 
+    def preload(self):
+        load_image(self.logo_img, self.size)
+        if not self.cover_date:
+            return
+        if self.cover_date_bg_color is None:
+            load_image(self.cover_date_img)
+        load_font(self.cover_date_font_path, self.cover_date_font_size)
+        scale = self.cover_date_text_scale
+        if scale and scale != 1.0 and self.cover_date_size is not None:
+            load_font(
+                self.cover_date_font_path,
+                max(1, int(round(self.cover_date_font_size * scale))),
+            )
+
     def apply(self, image, mod_time_str=""):
-        with Image.open(resolve_path(self.logo_img)) as logo_file:
-            logo = logo_file.resize(self.size)
+        # Decoded and resized once per process, not once per frame; shared, so
+        # only ever pasted from.
+        logo = load_image(self.logo_img, self.size)
 
         # Paste logo onto cam at the specified location
-        image.paste(logo, self.place, logo)
+        compositing.paste(image, logo, self.place)
 
         # Cover old datetime
         if self.cover_date:
-            position = tuple(self.cover_date_position)
-            if self.cover_date_bg_color is not None:
-                cover = Image.new(
-                    "RGBA", tuple(self.cover_date_size), tuple(self.cover_date_bg_color)
-                )
-            else:
-                with Image.open(resolve_path(self.cover_date_img)) as cover_file:
-                    cover = cover_file.convert("RGBA")
-            image.paste(cover, position, cover)
-
-            # Add datetime
-            text_color = tuple(self.cover_date_text_color)
-            text_xy = (
-                position[0] + self.cover_date_text_position[0],
-                position[1] + self.cover_date_text_position[1],
-            )
-            scale = self.cover_date_text_scale
-            if scale and scale != 1.0 and self.cover_date_size is not None:
-                # Render text on a downscaled transparent canvas, then upscale —
-                # gives the text a softer/chunkier look matching JPEG camera output.
-                cover_w, cover_h = self.cover_date_size
-                small_w = max(1, int(round(cover_w * scale)))
-                small_h = max(1, int(round(cover_h * scale)))
-                small_font = ImageFont.truetype(
-                    resolve_path(self.cover_date_font_path),
-                    max(1, int(round(self.cover_date_font_size * scale))),
-                )
-                small_canvas = Image.new("RGBA", (small_w, small_h), (0, 0, 0, 0))
-                small_draw = ImageDraw.Draw(small_canvas)
-                small_draw.text(
-                    (
-                        int(round(self.cover_date_text_position[0] * scale)),
-                        int(round(self.cover_date_text_position[1] * scale)),
-                    ),
-                    mod_time_str,
-                    font=small_font,
-                    fill=text_color,
-                )
-                upscaled = small_canvas.resize((cover_w, cover_h), Image.BILINEAR)
-                image.paste(upscaled, position, upscaled)
-            else:
-                draw = ImageDraw.Draw(image)
-                font = ImageFont.truetype(
-                    resolve_path(self.cover_date_font_path), self.cover_date_font_size
-                )
-                draw.text(text_xy, mod_time_str, font=font, fill=text_color)
+            patch = self._cover_date_patch(mod_time_str)
+            compositing.paste(image, patch, tuple(self.cover_date_position))
 
         return image
 
+    def _cover_date_patch(self, mod_time_str):
+        """The cover with the timestamp drawn on it, rendered once per minute.
+
+        The stamp only changes when the minute does, and both dark_sky feeds
+        show the same one, so every repeat frame and sibling feed pastes the
+        cached patch. The patch is shared and must not be drawn on.
+        """
+        key = (
+            mod_time_str,
+            None if self.cover_date_bg_color is not None else self.cover_date_img,
+            _as_tuple(self.cover_date_bg_color),
+            _as_tuple(self.cover_date_size),
+            self.cover_date_font_path,
+            self.cover_date_font_size,
+            _as_tuple(self.cover_date_text_position),
+            _as_tuple(self.cover_date_text_color),
+            self.cover_date_text_scale,
+        )
+        return cover_date_cache.get_or_create(
+            key, lambda: self._draw_cover_date_patch(mod_time_str)
+        )
+
+    def _draw_cover_date_patch(self, mod_time_str):
+        if self.cover_date_bg_color is not None:
+            cover = Image.new(
+                "RGBA", tuple(self.cover_date_size), tuple(self.cover_date_bg_color)
+            )
+        else:
+            cover = load_image(self.cover_date_img)
+
+        text_color = tuple(self.cover_date_text_color)
+        scale = self.cover_date_text_scale
+        if scale and scale != 1.0 and self.cover_date_size is not None:
+            # Render text on a downscaled transparent canvas, then upscale —
+            # gives the text a softer/chunkier look matching JPEG camera output.
+            cover_w, cover_h = self.cover_date_size
+            small_w = max(1, int(round(cover_w * scale)))
+            small_h = max(1, int(round(cover_h * scale)))
+            small_font = load_font(
+                self.cover_date_font_path,
+                max(1, int(round(self.cover_date_font_size * scale))),
+            )
+            small_canvas = Image.new("RGBA", (small_w, small_h), (0, 0, 0, 0))
+            small_draw = ImageDraw.Draw(small_canvas)
+            small_draw.text(
+                (
+                    int(round(self.cover_date_text_position[0] * scale)),
+                    int(round(self.cover_date_text_position[1] * scale)),
+                ),
+                mod_time_str,
+                font=small_font,
+                fill=text_color,
+            )
+            upscaled = small_canvas.resize((cover_w, cover_h), Image.BILINEAR)
+            patch = Image.new("RGBA", _union_size(cover.size, upscaled.size))
+            patch.paste(cover, (0, 0))
+            return Image.alpha_composite(patch, upscaled.crop((0, 0, *patch.size)))
+
+        font = load_font(self.cover_date_font_path, self.cover_date_font_size)
+        text_xy = tuple(self.cover_date_text_position)
+        # Text that runs past the cover still shows, as it did when drawn
+        # straight onto the frame.
+        text_box = ImageDraw.Draw(cover).textbbox(text_xy, mod_time_str, font=font)
+        patch = Image.new("RGBA", _union_size(cover.size, text_box[2:]))
+        patch.paste(cover, (0, 0))
+        if patch.getchannel("A").getextrema() == (255, 255):
+            # Opaque throughout, so drawing on the patch blends exactly as
+            # drawing on the frame would.
+            ImageDraw.Draw(patch).text(
+                text_xy, mod_time_str, font=font, fill=text_color
+            )
+            return patch
+        # Over a translucent cover the text has to be composited, or its
+        # anti-aliased edges would take the cover's transparency.
+        text = Image.new("RGBA", patch.size, (0, 0, 0, 0))
+        ImageDraw.Draw(text).text(text_xy, mod_time_str, font=font, fill=text_color)
+        return Image.alpha_composite(patch, text)
+
+
+def _as_tuple(value):
+    """YAML hands back lists; cache keys need something hashable."""
+    return tuple(value) if value is not None else None
+
+
+def _union_size(*sizes):
+    return (
+        max(int(math.ceil(size[0])) for size in sizes),
+        max(int(math.ceil(size[1])) for size in sizes),
+    )
+
+
+# Rendered cover-date patches. Each is good for one minute of one camera, so a
+# small bound is all it takes for old timestamps to fall out on their own.
+cover_date_cache = LRUCache(max_entries=16)
+
 
 PURPLE_AIR_SENSOR_URL = "https://api.purpleair.com/v1/sensors/{sensor_index}"
 
+# The badge is drawn this many times larger than it is published, then
+# downsampled, because PIL's drawing primitives are not anti-aliased.
+BADGE_SUPERSAMPLE = 4
+
 # Marks "no reading was passed in" for pm25()/temperature(), which must treat
 # an explicit None (the sensor gave nothing) differently from no argument.
 _UNFETCHED = object()
@@ -191,6 +351,37 @@ AQI_CATEGORIES = (
 _purple_air_cache_lock = threading.Lock()
 
 
+@contextmanager
+def _purple_air_cache_locked():
+    """Hold the PurpleAir cache against other threads and other processes.
+
+    The thread lock alone leaves render worker processes (RENDER_ENGINE=
+    processes) free to miss the cache together and each buy the same reading,
+    so the cache is also guarded by a flock on a file beside it. The kernel
+    drops a flock when its process dies, so a killed worker can't wedge it.
+    """
+    with _purple_air_cache_lock:
+        lock_path = os.path.join(tempfile.gettempdir(), "gnpc-purpleair.lock")
+        try:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            logger.warning(f"Could not lock the PurpleAir cache: {e}")
+            yield
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # Drops the flock
+
+
+# Finished badges, keyed on exactly what they show and how they are styled. The
+# eight west-side cameras share one sensor and a reading lasts ten minutes, so
+# one render serves every camera on it for both rounds of many runs. Entries
+# are shared between threads and must only be pasted from.
+badge_cache = LRUCache(max_entries=64)
+
+
 def pm25_to_aqi(pm25):
     """Convert a PM2.5 concentration (µg/m³) to a US EPA AQI value."""
     # The EPA formula operates on the concentration truncated to one decimal.
@@ -350,8 +541,10 @@ class AirQuality(Overlay):
         miss_cache_seconds=300,
         max_reading_age=3600,
         timeout=10,
+        encoding=None,
+        priority=None,
     ):
-        super().__init__(place or (0, 0), size or (0, 0), subname)
+        super().__init__(place or (0, 0), size or (0, 0), subname, encoding, priority)
         self.place_auto = place is None
         self.sensor_index = sensor_index
         self.fallback_sensors = tuple(fallback_sensors)
@@ -468,7 +661,7 @@ class AirQuality(Overlay):
             )
             return None
 
-        with _purple_air_cache_lock:
+        with _purple_air_cache_locked():
             fetched = False
             for sensor_index in (self.sensor_index, *self.fallback_sensors):
                 reading, from_cache = self._sensor_reading(sensor_index, api_key)
@@ -611,8 +804,12 @@ class AirQuality(Overlay):
             logger.warning(f"Error fetching temperature: {e}")
             return None
 
+    def preload(self):
+        for size in (self.font_size, self.label_font_size, self.category_font_size):
+            self._font(size, BADGE_SUPERSAMPLE)
+
     def _font(self, size, scale):
-        return ImageFont.truetype(resolve_path(self.font_path), int(size * scale))
+        return load_font(self.font_path, int(size * scale))
 
     def _render_reading(self, value_text, unit_text, scale):
         """The number and its unit label, cropped to their own ink.
@@ -852,15 +1049,53 @@ class AirQuality(Overlay):
         divisor = supersample / self.scale
         return (max(1, int(width // divisor)), max(1, int(height // divisor)))
 
+    def _style_key(self):
+        """Every setting that changes how a given reading is drawn."""
+        return (
+            self.font_path,
+            self.font_size,
+            self.label,
+            self.label_font_size,
+            self.category_font_size,
+            self.category_tracking,
+            self.line_gap,
+            self.divider_color,
+            self.bg_color,
+            self.text_color,
+            self.dot_radius,
+            self.dot_outline_color,
+            self.padding,
+            self.gap,
+            self.corner_radius,
+            self.temperature_label,
+            self.scale,
+        )
+
     def _render_widget(
         self, value_text, color, category_text=None, temperature_text=None
+    ):
+        """The finished badge for these values, drawn once and then reused.
+
+        The returned image is shared with every other badge showing the same
+        thing, so it must not be drawn on.
+        """
+        key = (value_text, color, category_text, temperature_text, self._style_key())
+        return badge_cache.get_or_create(
+            key,
+            lambda: self._draw_widget(
+                value_text, color, category_text, temperature_text
+            ),
+        )
+
+    def _draw_widget(
+        self, value_text, color, category_text=None, temperature_text=None
     ):
         """Draw the badge on a transparent canvas sized to its contents.
 
         Rendered at 4x and downscaled so the dot and rounded corners come out
         smooth — PIL's drawing primitives are not anti-aliased.
         """
-        scale = 4
+        scale = BADGE_SUPERSAMPLE
         pad_x, pad_y = (self.padding[0] * scale, self.padding[1] * scale)
 
         if value_text is not None and temperature_text is not None:
@@ -925,12 +1160,14 @@ class AirQuality(Overlay):
             return image
 
         widget = self._render_widget(value_text, color, category, temperature_text)
-        self.size = widget.size
-
-        if self.place_auto:
-            self.place = self._anchored_place(image.size, widget.size)
-
-        image.paste(widget, self.place, widget)
+        # Worked out per frame, not stored: the same overlay renders on
+        # several threads at once (see Overlay.render).
+        place = (
+            self._anchored_place(image.size, widget.size)
+            if self.place_auto
+            else self.place
+        )
+        compositing.paste(image, widget, place)
         return image
 
 
@@ -940,12 +1177,24 @@ class CompositeOverlay(Overlay):
     to create a single output image.
     """
 
-    def __init__(self, overlays, subname=None):
-        # Use the first overlay's subname if no composite subname provided
+    def __init__(self, overlays, subname=None, encoding=None, priority=None):
+        # Use the first overlay's subname (encoding, priority) if the composite
+        # is given none of its own: the group is one feed, named, encoded and
+        # uploaded once.
         if subname is None and overlays:
             subname = getattr(overlays[0], "subname", None)
-
-        super().__init__(place=(0, 0), size=(0, 0), subname=subname)
+        if encoding is None and overlays:
+            encoding = getattr(overlays[0], "encoding", None)
+        if priority is None and overlays:
+            priority = getattr(overlays[0], "priority", None)
+
+        super().__init__(
+            place=(0, 0),
+            size=(0, 0),
+            subname=subname,
+            encoding=encoding,
+            priority=priority,
+        )
         self.overlays = overlays
 
     def apply(self, image, mod_time_str=""):
@@ -957,3 +1206,7 @@ class CompositeOverlay(Overlay):
         for overlay in self.overlays:
             image = overlay.apply(image, mod_time_str)
         return image
+
+    def preload(self):
+        for overlay in self.overlays:
+            overlay.preload()
@@ -2,22 +2,34 @@
 Custom class to represent an individual webcam.
 """
 
+import hashlib
 import io
 import logging
 import os
 import random
 import socket
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from ftplib import FTP, FTP_TLS, error_perm, error_temp
-from time import sleep
+from ftplib import FTP, error_perm, error_temp
+from time import perf_counter, sleep
 from zoneinfo import ZoneInfo
 
 from dotenv import load_dotenv
 from PIL import Image, UnidentifiedImageError
 
-from Overlays import CompositeOverlay
+import deadline
+import ftp_listing
+import render_engine
+from asset_cache import LRUCache
+from ftp_budget import ConnectionBudget
+from ftp_listing import normalize_time
+from ftp_pool import FTPPool
+from ftp_tls import ResumingFTP_TLS
+from jpeg_header import jpeg_size
+from Overlays import CompositeOverlay, decode_jpeg
 from paths import resolve_path
+from state_files import read_state, state_path, write_state
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +37,37 @@ load_dotenv(resolve_path("environment.env"))
 
 MOUNTAIN_TIME = ZoneInfo("America/Denver")
 
+# Black frames for blacked-out cameras, encoded once per (size, quality). The
+# quality is Pillow's default, which black frames have always gone out at: a
+# flat frame compresses to almost nothing either way.
+BLACK_FRAME_QUALITY = 75
+_black_frames = LRUCache(max_entries=8)
+
+
+def black_frame(size, quality=BLACK_FRAME_QUALITY):
+    """The JPEG bytes of an all-black frame of `size`."""
+
+    def encode():
+        buffer = io.BytesIO()
+        Image.new("RGB", size, (0, 0, 0)).save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue()
+
+    return _black_frames.get_or_create((tuple(size), quality), encode)
+
+
+# A camera's feeds render in parallel: Pillow releases the GIL while it copies,
+# composites and encodes, so the NPS and GNPC feeds of one frame can use two
+# cores. The pool is shared by every camera thread, keeping the whole process
+# at one render per core however many cameras are mid-round.
+RENDER_WORKERS = max(1, int(os.getenv("RENDER_WORKERS") or os.cpu_count() or 1))
+_render_pool = ThreadPoolExecutor(
+    max_workers=RENDER_WORKERS, thread_name_prefix="render"
+)
+
+# A camera's or feed's `priority` in webcams.yaml, first to publish first. When
+# a round runs late the low feeds are the first to wait for the next round.
+PRIORITIES = ("high", "normal", "low")
+
 
 # The server allows only a handful of simultaneous connections per IP, so every
 # socket this process opens has to be accounted for. Once a connect attempt tells
@@ -32,6 +75,11 @@ MOUNTAIN_TIME = ZoneInfo("America/Denver")
 # every connect would double the sockets opened by each camera thread.
 _ftps_supported = None
 
+# Every session this process opens, from any component, takes a slot from one
+# budget sized to the server's per-IP cap (see ftp_budget.py).
+FTP_MAX_CONNECTIONS = max(2, int(os.getenv("FTP_MAX_CONNECTIONS") or 4))
+connection_budget = ConnectionBudget(FTP_MAX_CONNECTIONS)
+
 
 def close_ftp(ftp):
     """Release an FTP connection, sending QUIT if the server is still listening.
@@ -48,6 +96,8 @@ def close_ftp(ftp):
             ftp.close()
         except Exception:
             pass
+    finally:
+        connection_budget.detach(ftp)
 
 
 def _is_connection_limit_error(error):
@@ -64,6 +114,12 @@ def _is_connection_limit_error(error):
 # connection dies between uses.
 RETRYABLE_FTP_ERRORS = (OSError, EOFError, error_temp)
 
+# Seconds another camera's directory listing stands in for a source's own
+# MDTM and SIZE. Cameras fetched together read it; one fetched later (queued
+# behind the rest, or after a phase wait for its swap) may RETR a frame newer
+# than the listing, and would stamp it with the old frame's time.
+LISTING_MAX_AGE = 2.0
+
 
 def retry_delay_for(base_delay, attempt, error):
     """How long to wait before the next FTP retry.
@@ -83,13 +139,33 @@ def connect_ftp(server, user, password):
     """
     Connect over FTPS (explicit TLS) when the server supports it, falling back
     to plain FTP so credentials are encrypted whenever possible.
+
+    Waits for a slot in the connection budget first; the session holds it until
+    close_ftp().
     """
+    # Not past the round's deadline. Running out of round isn't a server
+    # fault, so it gives up like a retry would rather than fail the camera.
+    try:
+        connection_budget.acquire(timeout=deadline.remaining())
+    except ConnectionError:
+        deadline.check("FTP connection")
+        raise
+    try:
+        ftp = _open_ftp(server, user, password)
+    except BaseException:
+        connection_budget.release()
+        raise
+    connection_budget.hold(ftp)
+    return ftp
+
+
+def _open_ftp(server, user, password):
     global _ftps_supported
 
     if _ftps_supported is not False:
         ftps = None
         try:
-            ftps = FTP_TLS(server, timeout=30)
+            ftps = ResumingFTP_TLS(server, timeout=30)
             ftps.login(user, password)
             ftps.prot_p()  # Encrypt the data channel too
             _ftps_supported = True
@@ -113,23 +189,83 @@ def connect_ftp(server, user, password):
     return ftp
 
 
+def _connect_download():
+    logger.debug("    Creating new download FTP connection...")
+    try:
+        ftp = connect_ftp(
+            os.getenv("server"),
+            os.getenv("ftp_get_user"),
+            os.getenv("ftp_get_pwd"),
+        )
+    except deadline.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"    Failed to create download connection: {e}")
+        raise ConnectionError(f"Failed to create download FTP connection: {e}") from e
+    logger.debug("    Download FTP connection established")
+    return ftp
+
+
+def _connect_upload():
+    try:
+        return connect_ftp(
+            os.getenv("server"),
+            os.getenv("username"),
+            os.getenv("password"),
+        )
+    except deadline.DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise ConnectionError(f"Failed to create upload FTP connection: {e}") from e
+
+
+def _pool_size(variable, default):
+    """Connections for one pool from `variable`, at most the whole budget."""
+    size = max(1, int(os.getenv(variable) or default))
+    if size > FTP_MAX_CONNECTIONS:
+        logger.warning(
+            f"{variable}={size} exceeds FTP_MAX_CONNECTIONS={FTP_MAX_CONNECTIONS}; "
+            f"using {FTP_MAX_CONNECTIONS}"
+        )
+    return min(size, FTP_MAX_CONNECTIONS)
+
+
+# Downloads and uploads each share a small pool of connections, so one camera's
+# transfer doesn't wait behind another's. The budget keeps their sum, plus the
+# overnight video's connections, within FTP_MAX_CONNECTIONS; a pool that wants
+# more waits its turn, and pools give up idle sessions while anyone is waiting.
+DOWNLOAD_CONNECTIONS = _pool_size("FTP_DOWNLOAD_CONNECTIONS", 2)
+UPLOAD_CONNECTIONS = _pool_size("FTP_UPLOAD_CONNECTIONS", 2)
+
+
 class Webcam:
-    # Shared FTP connections for all webcam instances. Subclasses assign through
+    # Shared FTP connections for all webcam instances. Always reached through
     # `Webcam`, never `cls`/`self.__class__`: a subclass attribute would shadow
     # these and quietly open a second pool that main.py's _close_connections()
     # never releases.
-    _download_ftp = None
-    _upload_ftp = None
-    _download_lock = threading.Lock()
-    _upload_lock = threading.Lock()
+    _download_pool = FTPPool(
+        _connect_download, close_ftp, DOWNLOAD_CONNECTIONS, connection_budget
+    )
+    _upload_pool = FTPPool(
+        _connect_upload, close_ftp, UPLOAD_CONNECTIONS, connection_budget
+    )
 
     def __init__(
-        self, name, file_name_on_server=None, logo_placements=None, blackout=False
+        self,
+        name,
+        file_name_on_server=None,
+        logo_placements=None,
+        blackout=False,
+        jpeg_splice=False,
+        priority="normal",
     ):
         self.name = name
         self.file_buffer = io.BytesIO()
         self.file_name_on_server = file_name_on_server
         self.blackout = blackout
+        # Re-encode only the blocks the overlays touch, copying the rest of the
+        # source JPEG losslessly; falls back to a full encode when it can't.
+        self.jpeg_splice = jpeg_splice
 
         # Process logo_placements (supports both single overlays and grouped overlays)
         overlay_list = logo_placements or []
@@ -144,30 +280,74 @@ class Webcam:
                     self.overlays.append(CompositeOverlay(group))
         else:
             self.overlays = overlay_list
+        # Place in the upload order, for every feed that doesn't set its own
+        self.priority = priority
 
         self.mod_time = None
         self.mod_time_str = ""
         self.upload = []
+        # (file name, encoded JPEG) for each feed, rendered this round
+        self.outputs = []
+        # Feeds uploaded this round, and those already on glacier.org as is
+        self.uploads_sent = 0
+        self.uploads_skipped = 0
+        # Wall-clock seconds spent rendering this round's feeds
+        self.render_seconds = 0.0
+        # Source decodes this round; every feed draws on a copy of one decode,
+        # so this stays at 1 however many feeds the camera publishes.
+        self.frames_decoded = 0
         # Set by a download that learns the source has not changed since the
         # frame was last published; process() and upload_image() then do
         # nothing, as there is nothing new to draw on or send.
         self.source_unchanged = False
+        # (MDTM, SIZE) of the frame in file_buffer, promoted to the on-disk
+        # record once that frame has been uploaded.
+        self._pending_stamp = None
+        # RETRs this round that landed in the upstream's swap and got a 550
+        self.not_found_retries = 0
+        # Published-file digests read by begin_upload(), and those uploaded
+        # since; guarded, with the counts above, by _results_lock
+        self._published = {}
+        self._uploaded = {}
+        self._results_lock = threading.Lock()
+
+    def is_source_error(self, error):
+        """Whether a failed download's `error` is this camera's source's fault.
+
+        A missing or refused file is; network faults and 421s come from the
+        FTP server every camera shares, and say nothing about this one.
+        """
+        return isinstance(error, (FileNotFoundError, error_perm))
 
     def _download_image(self, max_retries=3, retry_delay=2):
         """Download image using shared FTP connection with retry logic."""
 
+        self.source_unchanged = False
+        self._pending_stamp = None
+        self.not_found_retries = 0
+        published = self._read_source_stamp()
+
         def download_attempt():
-            # Hold the lock only while talking to the server so retry sleeps
-            # don't stall the other cameras' downloads.
-            logger.debug(f"  {self.name}: Waiting for download lock...")
-            with self._download_lock:
-                logger.debug(f"  {self.name}: Got download lock...")
-                ftp = self._get_download_connection()
+            # Hold a connection only while talking to the server so retry
+            # sleeps don't keep it from the other cameras. A network error
+            # evicts it from the pool; the retry below borrows a fresh one.
+            logger.debug(f"  {self.name}: Waiting for a download connection...")
+            with Webcam._download_pool.connection() as ftp:
+                logger.debug(f"  {self.name}: Got a download connection...")
+                # Stamped before the RETR, never after: if the file is swapped
+                # in between, the record undersells the frame and the next
+                # round fetches it again, rather than overselling it and
+                # skipping a frame that was never published.
+                stamp = self._source_stamp(ftp)
+                if published and stamp == published:
+                    logger.debug(f"  {self.name}: Not modified since last publish")
+                    self.source_unchanged = True
+                    return
                 ftp.retrbinary(
                     f"RETR {self.file_name_on_server}", self.file_buffer.write
                 )
                 self.file_buffer.seek(0)
-                self._set_modification_time(ftp)
+                self._pending_stamp = stamp
 
         # Try to download the image with connection retry logic
         for attempt in range(max_retries):
@@ -187,7 +367,9 @@ class Webcam:
                 # budget on more attempts rather than one long wait: two rounds
                 # plus main's ROUND_INTERVAL have to fit inside a cron minute.
                 self.file_buffer = io.BytesIO()  # Discard any partial read
+                self.not_found_retries += 1
                 if attempt < max_retries - 1:
+                    deadline.check(f"{self.name} download", retry_delay)
                     logger.info(
                         f"  {self.name}: File not found, "
                         f"retrying in {retry_delay:.1f}s..."
@@ -203,16 +385,12 @@ class Webcam:
                 logger.warning(
                     f"  {self.name}: Download failed (attempt {attempt + 1}): {e}"
                 )
-                # Reset connection on error, closing it so the server releases
-                # its slot instead of holding the session until it times out.
-                # Closed while holding the lock so the slot is given back before
-                # another camera thread opens its replacement.
-                with self._download_lock:
-                    stale, Webcam._download_ftp = Webcam._download_ftp, None
-                    close_ftp(stale)
+                # The pool has already QUIT the failed connection, so the server
+                # releases its slot instead of holding it until a timeout.
                 self.file_buffer = io.BytesIO()  # Reset buffer
                 if attempt < max_retries - 1:
                     delay = retry_delay_for(retry_delay, attempt, e)
+                    deadline.check(f"{self.name} download", delay)
                     logger.info(f"  {self.name}: Retrying download in {delay:.1f}s...")
                     sleep(delay)
                 else:
@@ -227,95 +405,254 @@ class Webcam:
         Used to override a feed (e.g. when a camera has been bumped or aimed
         somewhere it shouldn't be). No overlays (including the logo) are applied
         in blackout mode, so every output feed is a bare black frame.
+
+        The size comes from the JPEG's frame header, not a decode, and the
+        black frame itself is encoded once per size for the life of the
+        process.
         """
         logger.info(f"  {self.name}: Blackout enabled, replacing with black frame")
-        self.file_buffer.seek(0)
-        with Image.open(self.file_buffer) as img:
-            size = img.size
-        black = Image.new("RGB", size, (0, 0, 0))
-        self.file_buffer = io.BytesIO()
-        black.save(self.file_buffer, format="JPEG")
-        self.file_buffer.seek(0)
-
-    def _apply_overlays(self):
+        try:
+            size = jpeg_size(self.file_buffer.getbuffer())
+        except ValueError:
+            # Let Pillow have a go (or raise the error process() retries on)
+            self.file_buffer.seek(0)
+            with Image.open(self.file_buffer) as img:
+                size = img.size
+        self.file_buffer = io.BytesIO(black_frame(size))
+
+    def _apply_overlays(self, on_output=None):
         """Add all overlays to the image.
 
         In blackout mode the logo is skipped: each feed's output is just the
         black frame, but the per-feed filenames (via each overlay's subname)
         are preserved so the same set of images is published.
+
+        `outputs` keeps the overlays' order; `on_output(file_name, output)`,
+        if given, hears of each feed as soon as it is encoded.
         """
+        emit = on_output or (lambda file_name, output: None)
         if self.blackout:
             logger.debug(f"  {self.name}: Blackout mode, skipping logo overlays")
-            for overlay in self.overlays:
-                self.file_buffer.seek(0)
-                overlay.overlayed = io.BytesIO()
-                overlay.overlayed.write(self.file_buffer.read())
-                overlay.overlayed.seek(0)
+            # One bytes object behind every feed's buffer; a BytesIO made from
+            # bytes shares them until written to.
+            black = self.file_buffer.getvalue()
+            self.outputs = [
+                (overlay.file_name(self.name), io.BytesIO(black))
+                for overlay in self.overlays
+            ]
+            for file_name, output in self.outputs:
+                emit(file_name, output)
             return
 
         logger.debug(f"  {self.name}: Applying {len(self.overlays)} overlays...")
-        for i, overlay in enumerate(self.overlays):
-            logger.debug(
-                f"  {self.name}: Processing overlay {i + 1}/{len(self.overlays)}..."
-            )
-            overlay.add_overlay(self.file_buffer, self.mod_time_str)
-        logger.debug(f"  {self.name}: Finished applying overlays")
+        engine = render_engine.current()
+        if engine is not None and engine.serves(self.name):
+            self._render_in_worker(engine)
+            for file_name, output in self.outputs:
+                emit(file_name, output)
+            return
+
+        frame = self._decode_frame()
+        source_jpeg = self.file_buffer.getvalue() if self.jpeg_splice else None
+
+        def render(overlay):
+            started = perf_counter()
+            output = overlay.render(frame, self.mod_time_str, source_jpeg)
+            return output, perf_counter() - started
+
+        started = perf_counter()
+        if len(self.overlays) > 1:
+            futures = [
+                _render_pool.submit(render, overlay) for overlay in self.overlays
+            ]
+            file_names = {
+                future: overlay.file_name(self.name)
+                for future, overlay in zip(futures, self.overlays)
+            }
+            for future in as_completed(futures):
+                emit(file_names[future], future.result()[0])
+            rendered = [future.result() for future in futures]
+        else:
+            rendered = []
+            for overlay in self.overlays:
+                rendered.append(render(overlay))
+                emit(overlay.file_name(self.name), rendered[-1][0])
+        self.render_seconds = perf_counter() - started
+
+        self.outputs = [
+            (overlay.file_name(self.name), output)
+            for overlay, (output, _) in zip(self.overlays, rendered)
+        ]
+        # Time the feeds would have taken one after another, against the wall
+        # clock they took side by side.
+        serial_seconds = sum(seconds for _, seconds in rendered)
+        logger.info(
+            f"  {self.name}: Rendered {len(rendered)} feeds in "
+            f"{self.render_seconds * 1000:.0f} ms "
+            f"({serial_seconds * 1000:.0f} ms of rendering, "
+            f"{serial_seconds / max(self.render_seconds, 1e-9):.1f}x)"
+        )
+
+    def preload(self):
+        """Load the images and fonts this camera's overlays draw with."""
+        for overlay in self.overlays:
+            overlay.preload()
+
+    def _render_in_worker(self, engine):
+        """Hand the whole frame to a worker process (RENDER_ENGINE=processes)."""
+        started = perf_counter()
+        outputs = engine.render(
+            self.name,
+            self.file_buffer.getvalue(),
+            self.mod_time_str,
+            self.jpeg_splice,
+        )
+        self.frames_decoded += 1  # Once, in a worker or after a broken pool here
+        self.render_seconds = perf_counter() - started
+        self.outputs = [
+            (overlay.file_name(self.name), output)
+            for overlay, output in zip(self.overlays, outputs)
+        ]
+        logger.info(
+            f"  {self.name}: Rendered {len(outputs)} feeds in a worker process "
+            f"in {self.render_seconds * 1000:.0f} ms"
+        )
+
+    def _decode_frame(self):
+        """Decode the downloaded JPEG once for all of this camera's feeds.
+
+        An NPS and a GNPC feed of one camera are drawn from the same source, so
+        decoding it per feed would repeat the most expensive step of the round.
+        """
+        self.file_buffer.seek(0)
+        frame = decode_jpeg(self.file_buffer)
+        self.frames_decoded += 1
+        return frame
 
     def upload_image(self, max_retries=3, retry_delay=2):
-        """Upload processed images using shared FTP connection with retry logic."""
-        self.upload = []
+        """Upload processed images over the shared upload pool, with retries.
+
+        Each file borrows a connection for its own STOR and RENAME only, so
+        cameras upload side by side and a retry's sleep holds up nobody else.
+
+        A feed whose bytes are identical to what was last published under its
+        file name is not sent again (see `upload_output`).
+        """
+        self.begin_upload()
         if self.source_unchanged:
             return
-        with self._upload_lock:
+        succeeded = False
+        try:
+            self._process_overlay_files(
+                lambda output, file_name: self.upload_output(
+                    output, file_name, max_retries, retry_delay
+                )
+            )
+            succeeded = True
+        finally:
+            self.finish_upload(succeeded)
 
-            def upload_file(overlayed, file_name):
-                for attempt in range(max_retries):
-                    try:
-                        ftp = self._get_upload_connection()
-                        overlayed.seek(0)  # Reset buffer position
+    def _upload_file(self, overlayed, file_name, max_retries, retry_delay):
+        for attempt in range(max_retries):
+            try:
+                # One file per checkout, so cameras take turns on the pool
+                # file by file instead of camera by camera.
+                with Webcam._upload_pool.connection() as ftp:
+                    overlayed.seek(0)  # Reset buffer position
 
-                        # Atomic file replacement: upload to temporary file first.
-                        # PID in the name so overlapping cron runs don't rename
-                        # each other's temp files out from under them.
-                        temp_name = f"{file_name}.{os.getpid()}.tmp"
-                        ftp.storbinary("STOR " + temp_name, overlayed)
+                    # Atomic file replacement: upload to temporary file first.
+                    # PID in the name so overlapping cron runs don't rename
+                    # each other's temp files out from under them.
+                    temp_name = f"{file_name}.{os.getpid()}.tmp"
+                    ftp.storbinary("STOR " + temp_name, overlayed)
 
+                    try:
+                        # Atomically rename to final name
+                        ftp.rename(temp_name, file_name)
+                    except Exception as rename_error:
+                        # Clean up temp file if rename fails
                         try:
-                            # Atomically rename to final name
-                            ftp.rename(temp_name, file_name)
-                        except Exception as rename_error:
-                            # Clean up temp file if rename fails
-                            try:
-                                ftp.delete(temp_name)
-                            except Exception:
-                                pass  # Ignore cleanup errors
-                            raise rename_error
-
-                        self.upload += [f"https://glacier.org/webcam/{file_name}"]
-                        return  # Success - exit retry loop
-                    except RETRYABLE_FTP_ERRORS as e:
-                        logger.warning(
-                            f"  {self.name}: Upload failed for {file_name} "
-                            f"(attempt {attempt + 1}): {e}"
-                        )
-                        # Reset connection on error, closing it so the server
-                        # releases its slot instead of holding the session until
-                        # it times out.
-                        stale, Webcam._upload_ftp = Webcam._upload_ftp, None
-                        close_ftp(stale)
-                        if attempt < max_retries - 1:
-                            delay = retry_delay_for(retry_delay, attempt, e)
-                            logger.info(
-                                f"  {self.name}: Retrying upload in {delay:.1f}s..."
-                            )
-                            sleep(delay)
-                        else:
-                            logger.error(
-                                f"  {self.name}: Upload failed after {max_retries}x"
-                            )
-                            raise
-
-            self._process_overlay_files(upload_file)
+                            ftp.delete(temp_name)
+                        except Exception:
+                            pass  # Ignore cleanup errors
+                        raise rename_error
+                return  # Success - exit retry loop
+            except RETRYABLE_FTP_ERRORS as e:
+                logger.warning(
+                    f"  {self.name}: Upload failed for {file_name} "
+                    f"(attempt {attempt + 1}): {e}"
+                )
+                # The pool has already QUIT the failed connection, and the
+                # sleep below holds none, so other cameras keep uploading.
+                if attempt < max_retries - 1:
+                    delay = retry_delay_for(retry_delay, attempt, e)
+                    deadline.check(f"{self.name} upload of {file_name}", delay)
+                    logger.info(f"  {self.name}: Retrying upload in {delay:.1f}s...")
+                    sleep(delay)
+                else:
+                    logger.error(f"  {self.name}: Upload failed after {max_retries}x")
+                    raise
+
+    # -- publish deduplication -----------------------------------------------
+
+    def priority_rank(self, file_name=None):
+        """Index in PRIORITIES of feed `file_name`, or of the camera if None."""
+        priority = self.priority
+        for overlay in self.overlays if file_name else ():
+            if overlay.file_name(self.name) == file_name:
+                priority = overlay.priority or priority
+                break
+        return PRIORITIES.index(priority)
+
+    def begin_upload(self):
+        """Reset this round's upload results and read what glacier.org has.
+
+        A blacked-out camera, a stuck camera's night frames and the second
+        round's re-poll all produce outputs byte-identical to the file already
+        published; skipping them saves the STOR, the RENAME and the transfer on
+        the upload pool. The SHA-256 of each published file is recorded after
+        its upload, so a feed that failed to upload is sent again next time.
+        """
+        self.upload = []
+        self.uploads_sent = 0
+        self.uploads_skipped = 0
+        published = read_state(state_path("published", self.name))
+        self._published = published if isinstance(published, dict) else {}
+        self._uploaded = {}
+
+    def upload_output(self, output, file_name, max_retries=3, retry_delay=2):
+        """Upload one rendered feed unless glacier.org already has its bytes.
+
+        Call `begin_upload()` first. Feeds of one camera may be uploaded from
+        several threads at once, as the staged pipeline does (pipeline.py).
+        """
+        digest = hashlib.sha256(output.getbuffer()).hexdigest()
+        if self._published.get(file_name) == digest:
+            logger.debug(f"  {self.name}: {file_name} unchanged, not re-sent")
+            with self._results_lock:
+                self.uploads_skipped += 1
+            return
+        self._upload_file(output, file_name, max_retries, retry_delay)
+        with self._results_lock:
+            self._uploaded[file_name] = digest
+            self.uploads_sent += 1
+            self.upload.append(f"https://glacier.org/webcam/{file_name}")
+
+    def finish_upload(self, succeeded=True):
+        """Record the feeds uploaded since `begin_upload()`.
+
+        The source is remembered as published only if every feed made it.
+        """
+        self._record_published()
+        if succeeded and not self.source_unchanged:
+            self._promote_source_stamp()
+
+    def _record_published(self):
+        if self._uploaded:
+            write_state(
+                state_path("published", self.name),
+                {**self._published, **self._uploaded},
+            )
 
     def _record_mod_time(self, mod_time_utc: datetime):
         """Store when the source image was taken, in Mountain Time.
@@ -334,19 +671,26 @@ class Webcam:
             .replace("PM", "pm")
         )
 
+    def _record_mdtm(self, time_str):
+        """Record the modification time from an MDTM-style UTC stamp."""
+        self._record_mod_time(
+            datetime.strptime(time_str, "%Y%m%d%H%M%S").replace(tzinfo=ZoneInfo("UTC"))
+        )
+
     def _set_modification_time(self, ftp: FTP):
+        """Record the source's modification time; returns the raw MDTM stamp.
+
+        The stamp is None when the server won't say.
+        """
         # Send the MDTM command to the FTP server
         try:
             response = ftp.sendcmd(f"MDTM {self.file_name_on_server}")
 
             # The response will be in the format: '213 YYYYMMDDHHMMSS'
             if response.startswith("213"):
-                time_str = response[4:].strip()
-                self._record_mod_time(
-                    datetime.strptime(time_str, "%Y%m%d%H%M%S").replace(
-                        tzinfo=ZoneInfo("UTC")
-                    )
-                )
+                time_str = normalize_time(response[4:])
+                self._record_mdtm(time_str)
+                return time_str
 
         except error_perm as e:
             # 550 errors can be ignored, but the image then goes out
@@ -359,11 +703,88 @@ class Webcam:
             else:
                 raise
 
+    # -- skip-unchanged bookkeeping -------------------------------------------
+
+    def _source_stamp(self, ftp: FTP):
+        """The (MDTM, SIZE) of the source file, as a record, or None.
+
+        Read from the round's directory listing when it has the file with a
+        precise time; otherwise asked for with MDTM and SIZE. Also records the
+        modification time for the cover date. A server that answers neither
+        gives no stamp, and the frame is fetched every round as before.
+        """
+        entry = self._listed_entry(ftp)
+        if entry is not None and entry.modify:
+            self._record_mdtm(entry.modify)
+            return {
+                "file": self.file_name_on_server,
+                "mdtm": entry.modify,
+                "size": entry.size,
+            }
+
+        mdtm = self._set_modification_time(ftp)
+        size = None
+        try:
+            # SIZE is refused in ASCII mode by many servers; a fresh connection
+            # has not been switched to binary by a RETR yet.
+            ftp.sendcmd("TYPE I")
+            response = ftp.sendcmd(f"SIZE {self.file_name_on_server}")
+            if response.startswith("213"):
+                size = int(response[4:].strip())
+        except (error_perm, ValueError):
+            pass  # Unsupported; the modification time alone has to do
+        if mdtm is None:
+            return None
+        return {"file": self.file_name_on_server, "mdtm": mdtm, "size": size}
+
+    def _listed_entry(self, ftp: FTP):
+        """The source file's entry in this round's listing of the source account.
+
+        The first camera of the round to get here lists the directory over the
+        shared connection it already holds; the rest read that listing while it
+        is at most LISTING_MAX_AGE old, and ask MDTM and SIZE once it isn't.
+        """
+        listing = ftp_listing.snapshot(
+            (os.getenv("server"), os.getenv("ftp_get_user")),
+            lambda: ftp_listing.list_directory(ftp),
+            max_age=LISTING_MAX_AGE,
+        )
+        return listing.get(self.file_name_on_server) if listing else None
+
+    def _source_stamp_path(self):
+        return state_path("ftp-source", self.name)
+
+    def _read_source_stamp(self):
+        """The stamp of the source frame last published, or None.
+
+        Ignored if recorded against a different file, so re-pointing a camera
+        in the config can never make its first fetch look unchanged.
+        """
+        stamp = read_state(self._source_stamp_path())
+        if not isinstance(stamp, dict) or stamp.get("file") != self.file_name_on_server:
+            return None
+        return stamp
+
+    def _promote_source_stamp(self):
+        """Remember the frame just uploaded as the one glacier.org has.
+
+        Only called once the upload succeeded: a frame that was fetched but
+        never published must be fetched again next round, not skipped.
+        """
+        if self._pending_stamp:
+            write_state(self._source_stamp_path(), self._pending_stamp)
+            self._pending_stamp = None
+
     def _process_overlay_files(self, action_func):
-        """Process each overlay file with the given action function."""
-        for overlay in self.overlays:
-            overlayed, file_name = overlay.get_overlayed_img(self.name)
-            action_func(overlayed, file_name)
+        """Process each rendered feed with the given action function.
+
+        Highest priority first, so the front-page feeds publish before the
+        rest; feeds of one priority keep their overlay order.
+        """
+        for file_name, output in sorted(
+            self.outputs, key=lambda feed: self.priority_rank(feed[0])
+        ):
+            action_func(output, file_name)
 
     def save_debug_images(self):
         """Save processed images to debug-images folder for debugging purposes."""
@@ -380,97 +801,65 @@ class Webcam:
 
     def process(self, max_retries=3, retry_delay=1.5):
         """Download and process webcam image with overlays."""
+        self.fetch()
+        if not self.source_unchanged:
+            self.render(max_retries=max_retries, retry_delay=retry_delay)
+
+    def fetch(self, max_retries=3):
+        """Download the source frame: the first stage of `process()`.
+
+        Sets `source_unchanged` when there is nothing new to render.
+        `max_retries` of 1 is a single attempt, as a breaker's probe makes.
+        """
+        self.frames_decoded = 0
+        self.outputs = []
+        # Clear buffer from any previous attempts
+        self.file_buffer = io.BytesIO()
+        self._download_image(max_retries=max_retries)
+        if self.source_unchanged:
+            logger.info(f"{self.name}: Source unchanged since last publish")
+
+    def render(self, on_output=None, max_retries=3, retry_delay=1.5):
+        """Draw every feed of the fetched frame: the second stage of `process()`.
+
+        `on_output(file_name, output)` is called for each feed as soon as it
+        is encoded. A corrupt or truncated source is fetched again and the
+        render retried.
+        """
         for attempt in range(max_retries):
             try:
-                # Clear buffer from any previous attempts
-                self.file_buffer = io.BytesIO()
-
-                # Download and process image
-                self._download_image()
-                if self.source_unchanged:
-                    logger.info(f"{self.name}: Source unchanged since last publish")
-                    return
                 if self.blackout:
                     self._apply_blackout()
-                self._apply_overlays()
+                self._apply_overlays(on_output)
                 return  # Success - exit early
 
             except (OSError, UnidentifiedImageError) as e:
                 # Check if it's a truncated image error or unidentified image
-                if (
+                if not (
                     "image file is truncated" in str(e).lower()
                     or "broken data stream" in str(e).lower()
                     or "cannot identify image file" in str(e).lower()
                 ):
-                    if attempt < max_retries - 1:  # Not the last attempt
-                        logger.info(
-                            f"{self.name}: Corrupted/truncated image detected "
-                            f"(attempt {attempt + 1}), retrying in {retry_delay}s..."
-                        )
-                        sleep(retry_delay)
-                        continue
-                    else:
-                        logger.error(
-                            f"{self.name}: Image still corrupted after "
-                            f"{max_retries} attempts"
-                        )
-                        raise
-                else:
                     # Different OSError, re-raise immediately
                     raise
-
-    @classmethod
-    def _get_download_connection(cls):
-        """
-        Get shared FTP connection for downloading images.
-        Must be called with _download_lock held.
-        """
-        if cls._download_ftp is None:
-            logger.debug("    Creating new download FTP connection...")
-            try:
-                Webcam._download_ftp = connect_ftp(
-                    os.getenv("server"),
-                    os.getenv("ftp_get_user"),
-                    os.getenv("ftp_get_pwd"),
-                )
-                logger.debug("    Download FTP connection established")
-            except Exception as e:
-                logger.error(f"    Failed to create download connection: {e}")
-                Webcam._download_ftp = None
-                raise ConnectionError(
-                    f"Failed to create download FTP connection: {e}"
-                ) from e
-        else:
-            logger.debug("    Reusing existing download FTP connection")
-        return Webcam._download_ftp
-
-    @classmethod
-    def _get_upload_connection(cls):
-        """
-        Get shared FTP connection for uploading images.
-        Must be called with _upload_lock held.
-        """
-        if cls._upload_ftp is None:
-            try:
-                Webcam._upload_ftp = connect_ftp(
-                    os.getenv("server"),
-                    os.getenv("username"),
-                    os.getenv("password"),
+                if attempt == max_retries - 1:
+                    logger.error(
+                        f"{self.name}: Image still corrupted after "
+                        f"{max_retries} attempts"
+                    )
+                    raise
+                deadline.check(f"{self.name} render", retry_delay)
+                logger.info(
+                    f"{self.name}: Corrupted/truncated image detected "
+                    f"(attempt {attempt + 1}), retrying in {retry_delay}s..."
                 )
-            except Exception as e:
-                Webcam._upload_ftp = None
-                raise ConnectionError(
-                    f"Failed to create upload FTP connection: {e}"
-                ) from e
-        return Webcam._upload_ftp
+                sleep(retry_delay)
+                self.fetch()
+                if self.source_unchanged:
+                    return
 
     @classmethod
     def _close_connections(cls):
         """Close all shared FTP connections."""
-        with cls._download_lock:
-            close_ftp(Webcam._download_ftp)
-            Webcam._download_ftp = None
-
-        with cls._upload_lock:
-            close_ftp(Webcam._upload_ftp)
-            Webcam._upload_ftp = None
+        Webcam._download_pool.close_all()
+        Webcam._upload_pool.close_all()
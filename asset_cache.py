@@ -0,0 +1,142 @@
+"""
+Process-wide caches of the decoded images and parsed fonts the overlays draw with.
+
+Every feed of every camera pastes the same logo PNG at one of a handful of
+sizes and sets its text in the same two typefaces, so decoding, resizing and
+parsing them per frame repeats identical work dozens of times a run. The caches
+hand out one copy per distinct asset, shared by every overlay in every thread.
+
+Cached images are shared, so callers must treat them as read-only — paste them,
+never draw on them.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageFont
+
+from paths import resolve_path
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """A bounded, thread-safe least-recently-used cache that counts its use.
+
+    Values are built by a factory on a miss. Two threads missing on the same
+    key at once build it only once: the second waits for the first rather than
+    repeating the work, which matters at the start of a round when every camera
+    thread asks for the same logo within a few milliseconds.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, factory):
+        """The value cached under `key`, building it with `factory()` if absent."""
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                building = self._building.get(key)
+                if building is None:
+                    building = self._building[key] = threading.Event()
+                    break
+            # Another thread is building this key; wait, then look again. If
+            # its factory raised, the entry is still missing and this thread
+            # takes its own turn.
+            building.wait()
+
+        try:
+            value = factory()
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                del self._building[key]
+            building.set()
+
+    def stats(self):
+        """Hit and miss counts since `new_round()`, and current size, for logging."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+    def new_round(self):
+        """Start counting hits and misses afresh, keeping the entries."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+# A few logo sizes per frame size, a cover rectangle and the video logo; 32 is
+# comfortably more than the config uses, and bounded in case it ever grows.
+image_cache = LRUCache(max_entries=32)
+
+
+def load_image(path, size=None, mode="RGBA"):
+    """A decoded copy of the image at `path`, converted and resized once.
+
+    Keyed on the file's mtime as well as its path, so replacing an overlay PNG
+    on disk takes effect without restarting anything. The returned image is
+    shared with every other caller and must not be modified.
+    """
+    path = resolve_path(path)
+    size = tuple(size) if size is not None else None
+    key = (path, size, mode, os.stat(path).st_mtime_ns)
+
+    def build():
+        logger.debug(f"Decoding overlay asset {path} at {size}")
+        with Image.open(path) as source:
+            image = source.convert(mode)
+        if size is not None and image.size != size:
+            image = image.resize(size)
+        return image
+
+    return image_cache.get_or_create(key, build)
+
+
+# Each AirQuality badge draws three sizes of one face at 4x, and a cover date
+# one or two sizes of another; a few dozen entries covers any plausible config.
+font_cache = LRUCache(max_entries=64)
+
+
+def load_font(path, size):
+    """The TrueType face at `path` in `size` pixels, parsed once per process.
+
+    The font is shared with every other caller.
+    """
+    path = resolve_path(path)
+    key = (path, int(size))
+
+    def build():
+        logger.debug(f"Parsing font {path} at {size}px")
+        return ImageFont.truetype(path, int(size))
+
+    return font_cache.get_or_create(key, build)
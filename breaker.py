@@ -0,0 +1,142 @@
+"""
+Stop polling a camera whose source keeps failing, and check back now and then.
+
+A camera whose FTP file is gone, or whose NPS URL times out, used to spend its
+whole retry ladder every round: three attempts and their backoff, and for an
+HTTP camera up to 20 s of timeout each, holding a download worker and, over
+FTP, a connection slot. Each camera's `CircuitBreaker` counts its consecutive
+failed downloads, of those that are the source's own fault
+(Webcam.is_source_error): a missing file, a URL that errors or times out. A
+421 or a dropped connection to the FTP server every camera shares doesn't
+count, or an outage of that server would open every FTP camera's breaker at
+once and leave them dark well after it came back. After FAILURES_TO_OPEN in
+a row the breaker opens, and the camera is left out of the round altogether.
+Once FIRST_PROBE seconds have passed it is let back in for a probe: a single
+download attempt, no retries. A probe that fails doubles the wait for the
+next, up to MAX_PROBE_INTERVAL; one that succeeds closes the breaker and the
+camera is polled as usual again.
+
+Opening and closing are logged once each, as warnings, when they happen; the
+failure that opens the breaker is reported like any other, but failed probes
+and skipped rounds are not, so a camera that is down for a week doesn't email
+cron's errors twice a minute. The state is kept per camera in the state
+directory (state_files.py), so it carries from one cron run to the next.
+`stats()` counts, since `new_round()`, the cameras left out and the probes.
+"""
+
+import logging
+import os
+import threading
+
+from state_files import read_state, state_path, write_state
+
+logger = logging.getLogger(__name__)
+
+# Consecutive failed downloads that open a camera's breaker
+FAILURES_TO_OPEN = int(os.getenv("BREAKER_FAILURES") or 5)
+# Seconds from opening to the first probe; each failed probe doubles it
+FIRST_PROBE = 60.0
+# Longest a camera with an open breaker goes between probes
+MAX_PROBE_INTERVAL = 3600.0
+
+_lock = threading.Lock()
+_round = {"skipped": 0, "probes": 0}
+
+
+def new_round():
+    """Start counting afresh."""
+    with _lock:
+        _round.update(skipped=0, probes=0)
+
+
+def stats():
+    """This round's {"skipped", "probes"}: cameras left out and cameras probed."""
+    with _lock:
+        return dict(_round)
+
+
+class CircuitBreaker:
+    """One camera's run of failures, and whether to poll it."""
+
+    def __init__(self, name):
+        self.name = name
+        self._path = state_path("breaker", name)
+        state = read_state(self._path)
+        if not isinstance(state, dict):
+            state = {}
+        try:
+            self.failures = int(state.get("failures") or 0)
+            self.probes = int(state.get("probes") or 0)
+            next_probe = state.get("next_probe")
+            self.next_probe = None if next_probe is None else float(next_probe)
+        except (TypeError, ValueError):
+            # A record this code didn't write: start closed
+            self.failures, self.probes, self.next_probe = 0, 0, None
+
+    @property
+    def open(self):
+        return self.next_probe is not None
+
+    def allows(self, now):
+        """Whether the camera is polled this round: closed, or due a probe.
+
+        A camera left out, or let in to probe, is counted in `stats()`.
+        """
+        if not self.open:
+            return True
+        if now >= self.next_probe:
+            with _lock:
+                _round["probes"] += 1
+            logger.debug(f"{self.name}: Probing source after {self.failures} failures")
+            return True
+        with _lock:
+            _round["skipped"] += 1
+        logger.debug(f"{self.name}: Breaker open, not polled")
+        return False
+
+    def record_success(self):
+        """Note a download that worked; closes an open breaker."""
+        if self.open:
+            logger.warning(
+                f"{self.name}: Source is back after {self.failures} failures; "
+                f"polling it again"
+            )
+        elif not self.failures:
+            return  # Nothing to record: the usual case, kept off the disk
+        self.failures, self.probes, self.next_probe = 0, 0, None
+        self._save()
+
+    def record_failure(self, now):
+        """Note a failed download at `now`; returns whether to report it.
+
+        Only failures while closed are reported, the one that opens the
+        breaker included; failed probes are expected.
+        """
+        was_open = self.open
+        self.failures += 1
+        if was_open:
+            self.probes += 1
+        elif self.failures < FAILURES_TO_OPEN:
+            self._save()
+            return True
+        wait = min(FIRST_PROBE * 2**self.probes, MAX_PROBE_INTERVAL)
+        self.next_probe = now + wait
+        if was_open:
+            logger.debug(f"{self.name}: Probe failed; next in {wait:.0f}s")
+        else:
+            logger.warning(
+                f"{self.name}: Failed {self.failures} times running; not "
+                f"polling it until a probe in {wait:.0f}s succeeds"
+            )
+        self._save()
+        return not was_open
+
+    def _save(self):
+        write_state(
+            self._path,
+            {
+                "failures": self.failures,
+                "probes": self.probes,
+                "next_probe": self.next_probe,
+            },
+        )
@@ -0,0 +1,201 @@
+"""
+Poll each camera about as often as its source actually changes.
+
+Every camera used to be polled every round, twice a minute, though some sources
+refresh every few minutes and one every few hours. Each camera's `Cadence`
+keeps the last few modification times its source reported (MDTM, the listing,
+or Last-Modified) and learns the typical gap between them. A camera whose
+source changes no faster than every MIN_LEARNED_INTERVAL is then left alone
+until its next change is due, and polled every round from then until the
+change shows up. However regular a source looks, a camera is never left
+unpolled for longer than MAX_STALENESS, so a source that speeds up is noticed.
+
+A source's times are compared with this machine's clock, so a skewed upstream
+clock shifts when a camera is polled; EARLY_POLL absorbs a little of that, and
+MAX_STALENESS bounds the rest.
+
+The same history locks fast sources' fetches to their publish phase. The
+upstream replaces most frames every half minute or so, at a steady offset
+within the minute, and the swap isn't atomic; a round at an arbitrary phase
+sees each new frame up to a period late and now and then RETRs mid-swap for a
+550. For a source whose changes keep a steady phase, `fetch_delay()` says how
+long to wait so the fetch lands SWAP_GUARD seconds after the next expected
+swap, if that is within PHASE_MAX_WAIT; otherwise the camera fetches at once.
+
+The history is kept per camera in the state directory (state_files.py), so
+it survives from one cron run to the next. `stats()` covers the round since
+`new_round()`: the polls skipped and the time those polls took when last run,
+the seconds spent waiting for a phase, and the median age of the new frames
+seen, from the source's change to the fetch.
+"""
+
+import cmath
+import logging
+import math
+import os
+import statistics
+import threading
+
+from state_files import read_state, state_path, write_state
+
+logger = logging.getLogger(__name__)
+
+# Seconds a camera may go unpolled however slowly its source changes
+MAX_STALENESS = float(os.getenv("MAX_STALENESS") or 300)
+# Sources that change faster than this are polled every round
+MIN_LEARNED_INTERVAL = 120.0
+# How long before a change is due polling starts again
+EARLY_POLL = 30.0
+# Changes remembered per camera; the interval is their median gap
+HISTORY = 8
+# Longest a camera waits for its source's next swap. Under cron both rounds and
+# the gap between them have to fit in the minute, so keep this well short of
+# the half-minute period; a daemon can afford up to a whole period.
+PHASE_MAX_WAIT = float(os.getenv("PHASE_MAX_WAIT") or 10)
+# Seconds after the expected swap to fetch: past the upstream's delete-and-
+# replace gap, and MDTM's one-second resolution
+SWAP_GUARD = 2.0
+# How tightly changes must cluster at one phase to lock to it, from 0 (spread
+# evenly around the period) to 1 (all at the same offset)
+MIN_PHASE_LOCK = 0.8
+
+_lock = threading.Lock()
+_round = {"polls": 0, "seconds": 0.0, "waited": 0.0, "ages": []}
+
+
+def new_round():
+    """Start counting afresh."""
+    with _lock:
+        _round.update(polls=0, seconds=0.0, waited=0.0, ages=[])
+
+
+def stats():
+    """This round's {"polls", "seconds", "waited", "median_age"}.
+
+    "polls" were skipped as not due, and last took "seconds" between them.
+    "median_age" is None when no camera saw a new frame.
+    """
+    with _lock:
+        ages = _round["ages"]
+        return {
+            "polls": _round["polls"],
+            "seconds": _round["seconds"],
+            "waited": _round["waited"],
+            "median_age": statistics.median(ages) if ages else None,
+        }
+
+
+class Cadence:
+    """One camera's change history and polling decision."""
+
+    def __init__(self, name, max_staleness=None):
+        self.name = name
+        self.max_staleness = MAX_STALENESS if max_staleness is None else max_staleness
+        self._path = state_path("cadence", name)
+        state = read_state(self._path)
+        if not isinstance(state, dict):
+            state = {}
+        try:
+            self.changes = [float(t) for t in state.get("changes", [])][-HISTORY:]
+            last_poll = state.get("last_poll")
+            self.last_poll = None if last_poll is None else float(last_poll)
+            self.poll_seconds = float(state.get("poll_seconds") or 0)
+        except (TypeError, ValueError):
+            # A record this code didn't write: start learning from scratch
+            self.changes, self.last_poll, self.poll_seconds = [], None, 0.0
+
+    def interval(self):
+        """The typical seconds between source changes, or None if not known yet."""
+        if len(self.changes) < 3:
+            return None
+        gaps = [
+            later - earlier for earlier, later in zip(self.changes, self.changes[1:])
+        ]
+        return statistics.median(gaps)
+
+    def due(self, now):
+        """Whether the camera should be polled this round.
+
+        A poll found not due is counted in `stats()`.
+        """
+        if self._due(now):
+            return True
+        with _lock:
+            _round["polls"] += 1
+            _round["seconds"] += self.poll_seconds
+        logger.debug(f"{self.name}: Not due until its source's next change")
+        return False
+
+    def _due(self, now):
+        if self.last_poll is None or now - self.last_poll >= self.max_staleness:
+            return True
+        interval = self.interval()
+        if interval is None or interval < MIN_LEARNED_INTERVAL:
+            return True
+        return now >= self.changes[-1] + interval - EARLY_POLL
+
+    def phase(self):
+        """Seconds into each period at which the source changes, or None.
+
+        None until the interval is known, and for a source whose changes don't
+        keep to one offset: those are fetched whenever the round gets to them.
+        """
+        interval = self.interval()
+        if interval is None or interval <= 0:
+            return None
+        # Average the changes as points on a circle one period round, so
+        # offsets either side of the wrap (29s and 1s) average to 0, not 15
+        mean = sum(
+            cmath.exp(2j * math.pi * (changed % interval) / interval)
+            for changed in self.changes
+        ) / len(self.changes)
+        if abs(mean) < MIN_PHASE_LOCK:
+            return None
+        return (cmath.phase(mean) / (2 * math.pi) % 1) * interval
+
+    def fetch_delay(self, now, limit=None):
+        """Seconds to wait so the fetch lands just after the next expected swap.
+
+        0 when the source has no steady phase, or its next swap is further off
+        than PHASE_MAX_WAIT or than `limit` seconds, if given. Time waited is
+        counted in `stats()`.
+        """
+        phase = self.phase()
+        if phase is None:
+            return 0.0
+        interval = self.interval()
+        # The first expected swap, plus guard, that is still ahead of now
+        target = math.floor(now / interval) * interval + phase + SWAP_GUARD
+        while target <= now:
+            target += interval
+        delay = target - now
+        if delay > PHASE_MAX_WAIT or (limit is not None and delay > limit):
+            return 0.0
+        with _lock:
+            _round["waited"] += delay
+        return delay
+
+    def record_poll(self, now, mod_time, seconds):
+        """Note a completed poll, fetched at `now`, that saw the source's `mod_time`.
+
+        `mod_time` is an aware datetime, or None when the source didn't say;
+        `seconds` is how long the poll took.
+        """
+        self.last_poll = now
+        self.poll_seconds = seconds
+        if mod_time is not None:
+            changed = mod_time.timestamp()
+            if self.changes and changed > self.changes[-1]:
+                # A change seen since the last poll: how long it sat unseen
+                with _lock:
+                    _round["ages"].append(max(0.0, now - changed))
+            if not self.changes or changed > self.changes[-1]:
+                self.changes = (self.changes + [changed])[-HISTORY:]
+        write_state(
+            self._path,
+            {
+                "changes": self.changes,
+                "last_poll": self.last_poll,
+                "poll_seconds": self.poll_seconds,
+            },
+        )
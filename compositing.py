@@ -0,0 +1,59 @@
+"""
+Alpha compositing of overlay layers onto a decoded frame.
+
+`Image.paste(layer, place, layer)` blends every pixel of the layer's rectangle,
+including any fully transparent margin around what is actually drawn. A layer
+is prepared once — trimmed to its alpha bounding box — and reused across
+feeds, so each paste blends only the pixels that can change, with Pillow's own
+C blend.
+"""
+
+from asset_cache import LRUCache
+
+
+class Layer:
+    """An RGBA overlay trimmed to its visible pixels, ready to blend.
+
+    `offset` is where the trimmed image sits within the original, so pasting
+    at `place + offset` lands every pixel where the untrimmed paste would.
+    """
+
+    def __init__(self, image):
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        bbox = image.getchannel("A").getbbox()
+        self.offset = bbox[:2] if bbox else (0, 0)
+        self.image = image.crop(bbox) if bbox else None
+
+
+# Prepared layers for the long-lived shared images (cached logos, cached
+# badges), looked up by identity. Each entry holds its image, so an id can't be
+# reused by another object while its entry is alive.
+_layers = LRUCache(max_entries=128)
+
+
+def prepare(image):
+    """The prepared Layer for a shared, never-modified RGBA image."""
+    cached_image, layer = _layers.get_or_create(
+        id(image), lambda: (image, Layer(image))
+    )
+    if cached_image is not image:  # pragma: no cover - guarded by the cache
+        return Layer(image)
+    return layer
+
+
+def paste(image, overlay, place):
+    """Alpha-composite `overlay` onto `image` at `place`, in place.
+
+    Gives the same pixels as `image.paste(overlay, place, overlay)`. `overlay`
+    must be an image that is never modified afterwards (its preparation is
+    cached), or an already prepared Layer.
+    """
+    layer = overlay if isinstance(overlay, Layer) else prepare(overlay)
+    if layer.image is None:
+        return image  # Fully transparent: nothing to draw
+
+    x = int(place[0]) + layer.offset[0]
+    y = int(place[1]) + layer.offset[1]
+    image.paste(layer.image, (x, y), layer.image)
+    return image
@@ -13,11 +13,78 @@ from AllskyVideo import AllskyVideo
 from HttpWebcam import HttpWebcam
 from Overlays import AirQuality, Logo
 from paths import resolve_path
-from Webcam import Webcam
+from Webcam import PRIORITIES, Webcam
 
 logger = logging.getLogger(__name__)
 
 
+SUBSAMPLINGS = (None, "keep", "4:4:4", "4:2:2", "4:2:0")
+
+
+# Keys that describe a whole feed: a group of overlays takes them from its
+# first overlay only (see CompositeOverlay)
+FEED_KEYS = ("subname", "encoding", "priority")
+
+
+def check_group(group, owner):
+    """Reject feed keys set on any but the first overlay of a group.
+
+    They would be silently ignored there, so a `priority: low` added to a
+    badge would leave its feed at the camera's priority without a word.
+    """
+    for overlay_config in group[1:]:
+        for key in FEED_KEYS:
+            if getattr(overlay_config, key, None) is not None:
+                raise ValueError(
+                    f"{owner}: {key} belongs on the first overlay of a group, "
+                    f"which sets it for the whole feed"
+                )
+
+
+def check_priority(priority, owner):
+    """Reject a `priority` that isn't one of PRIORITIES (None is allowed)."""
+    if priority is not None and priority not in PRIORITIES:
+        raise ValueError(
+            f"{owner} priority must be one of {', '.join(PRIORITIES)}, not {priority!r}"
+        )
+
+
+@dataclass
+class EncodingConfig:
+    """How one feed's JPEG is encoded; the defaults are the historical q=90.
+
+    See Overlays.jpeg_save_options for how each field reaches Pillow.
+    """
+
+    # 1-100 (above 95 mostly adds bytes), or "keep" for the source's tables
+    quality: Union[int, str] = 90
+    # "4:4:4", "4:2:2", "4:2:0" or "keep" (quote them in YAML); None is
+    # Pillow's 4:2:0, or the source's subsampling under quality "keep"
+    subsampling: Optional[str] = None
+    optimize: bool = False
+    progressive: bool = False
+    # At most one: a restart marker every N MCU blocks, or every N MCU rows
+    restart_marker_blocks: Optional[int] = None
+    restart_marker_rows: Optional[int] = None
+
+    def __post_init__(self):
+        if self.quality != "keep" and not (
+            isinstance(self.quality, int) and 1 <= self.quality <= 100
+        ):
+            raise ValueError(
+                f"encoding quality must be 1-100 or 'keep', not {self.quality!r}"
+            )
+        if self.subsampling not in SUBSAMPLINGS:
+            raise ValueError(
+                f"encoding subsampling must be one of "
+                f"{', '.join(s for s in SUBSAMPLINGS if s)}, not {self.subsampling!r}"
+            )
+        if self.restart_marker_blocks and self.restart_marker_rows:
+            raise ValueError(
+                "encoding takes restart_marker_blocks or restart_marker_rows, not both"
+            )
+
+
 @dataclass
 class LogoConfig:
     """Configuration for a Logo overlay."""
@@ -36,6 +103,12 @@ class LogoConfig:
     cover_date_text_position: Tuple[int, int] = (4, 3)
     cover_date_text_color: Tuple[int, int, int] = (255, 255, 255)
     cover_date_text_scale: float = 1.0
+    encoding: Optional[EncodingConfig] = None
+    # Overrides the camera's priority for this feed
+    priority: Optional[str] = None
+
+    def __post_init__(self):
+        check_priority(self.priority, "logo")
 
 
 @dataclass
@@ -84,6 +157,12 @@ class AirQualityConfig:
     miss_cache_seconds: int = 300
     max_reading_age: int = 3600
     timeout: int = 10
+    encoding: Optional[EncodingConfig] = None
+    # Overrides the camera's priority for this feed
+    priority: Optional[str] = None
+
+    def __post_init__(self):
+        check_priority(self.priority, "air_quality")
 
 
 OverlayConfig = Union[LogoConfig, AirQualityConfig]
@@ -102,8 +181,16 @@ class WebcamConfig:
     file_name_on_server: Optional[str] = None
     url: Optional[str] = None
     blackout: bool = False
+    # Re-encode only the overlaid blocks of the source JPEG (needs jpegtran).
+    jpeg_splice: bool = False
+    # Upload order when a round runs late: "high", "normal" or "low"
+    priority: str = "normal"
 
     def __post_init__(self):
+        check_priority(self.priority, f"Webcam {self.name!r}")
+        for placement in self.logo_placements:
+            if isinstance(placement, list):
+                check_group(placement, f"Webcam {self.name!r}")
         if bool(self.file_name_on_server) == bool(self.url):
             raise ValueError(
                 f"Webcam {self.name!r} needs exactly one source: "
@@ -141,7 +228,10 @@ def parse_overlay(overlay_data: dict) -> OverlayConfig:
     config_class = OVERLAY_CONFIG_TYPES.get(overlay_type)
     if config_class is None:
         raise ValueError(f"Unknown overlay type: {overlay_type!r}")
-    return config_class(**{k: v for k, v in overlay_data.items() if k != "type"})
+    options = {k: v for k, v in overlay_data.items() if k != "type"}
+    if options.get("encoding") is not None:
+        options["encoding"] = EncodingConfig(**options["encoding"])
+    return config_class(**options)
 
 
 def load_config(config_file: str = "webcams.yaml") -> AppConfig:
@@ -179,6 +269,8 @@ def load_config(config_file: str = "webcams.yaml") -> AppConfig:
             url=webcam_data.get("url"),
             logo_placements=logo_placements,
             blackout=webcam_data.get("blackout", False),
+            jpeg_splice=webcam_data.get("jpeg_splice", False),
+            priority=webcam_data.get("priority", "normal"),
         )
         webcams.append(webcam)
 
@@ -198,6 +290,23 @@ def load_config(config_file: str = "webcams.yaml") -> AppConfig:
     return config
 
 
+def preload_overlay_assets(cams):
+    """Parse every font and decode every image the cameras' overlays draw with.
+
+    Given the cameras built from the config, so the overlays warmed are the
+    very ones that will render. Runs on the main thread before any camera
+    thread starts, so they find the shared caches already warm instead of each
+    paying for the first parse. A missing asset is only logged here; the
+    camera that needs it will fail in its own round, where the error is
+    reported.
+    """
+    for cam in cams:
+        try:
+            cam.preload()
+        except OSError as e:
+            logger.warning(f"Could not preload overlay assets for {cam.name}: {e}")
+
+
 def create_overlay_from_config(overlay_config: OverlayConfig):
     """Create an overlay object from configuration."""
 
@@ -229,6 +338,8 @@ def create_webcam_from_config(webcam_config: WebcamConfig):
             url=webcam_config.url,
             logo_placements=logo_placements,
             blackout=webcam_config.blackout,
+            jpeg_splice=webcam_config.jpeg_splice,
+            priority=webcam_config.priority,
         )
 
     return Webcam(
@@ -236,6 +347,8 @@ def create_webcam_from_config(webcam_config: WebcamConfig):
         file_name_on_server=webcam_config.file_name_on_server,
         logo_placements=logo_placements,
         blackout=webcam_config.blackout,
+        jpeg_splice=webcam_config.jpeg_splice,
+        priority=webcam_config.priority,
     )
 
 
@@ -0,0 +1,74 @@
+"""
+Run rounds on a wall-clock schedule in one long-lived process.
+
+Under cron every minute starts a fresh interpreter: Pillow, requests, yaml and
+ffmpeg are imported again, webcams.yaml is parsed and every overlay rebuilt,
+and the in-memory caches start cold. `main.py --daemon` stays resident instead
+and calls `run_forever`, which starts a round at every multiple of the round
+period on the wall clock — :00 and :30 for the default 30 seconds — so the
+published frames keep the same rhythm cron gave them however long the process
+has been up.
+
+A round that overruns its slot is not followed by a burst of catch-up rounds:
+the next one starts at the next boundary still ahead. SIGTERM (systemd's stop)
+and SIGINT let the round in progress finish, then end the loop, so the caller's
+cleanup still closes FTP sessions and stops any render workers.
+"""
+
+import logging
+import math
+import signal
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+def next_start(now, period):
+    """The first multiple of `period` seconds since the epoch after `now`."""
+    return (math.floor(now / period) + 1) * period
+
+
+def stop_on_signals(stop, signals=(signal.SIGTERM, signal.SIGINT)):
+    """Set the `stop` event, rather than dying mid-upload, on any of `signals`.
+
+    Must be called from the main thread.
+    """
+
+    def request_stop(signum, frame):
+        logger.info(
+            f"Received {signal.Signals(signum).name}; stopping after this round"
+        )
+        stop.set()
+
+    for signum in signals:
+        signal.signal(signum, request_stop)
+
+
+def run_forever(round_fn, period, stop, between_rounds=None, clock=time):
+    """Call `round_fn()` now and then at each `period` boundary until `stop` is set.
+
+    `between_rounds()` runs after every round, before the wait. A round that
+    raises is logged and the schedule carries on.
+    """
+    slot = clock()
+    while not stop.is_set():
+        try:
+            round_fn()
+        except Exception:
+            logger.exception("Round failed")
+        if between_rounds is not None:
+            between_rounds()
+
+        now = clock()
+        start = next_start(now, period)
+        # Boundaries passed since this round's slot began: each was a round
+        missed = math.floor(now / period) - math.floor(slot / period)
+        if missed:
+            logger.warning(
+                f"Round overran its slot; skipping {missed} round(s) of {period}s"
+            )
+        slot = start
+        # Returns early, and True, when a signal sets `stop`
+        if stop.wait(max(0.0, start - now)):
+            break
+    logger.info("Daemon stopped")
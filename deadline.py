@@ -0,0 +1,87 @@
+"""
+The time a round has left, for every retry loop to consult.
+
+Downloads, renders and uploads each retry on their own schedule, backing off
+up to 4x when the server refuses connections (Webcam.retry_delay_for), and none
+of them used to know how much of the round was left. One unlucky camera could
+carry a cron run past its minute, and SingleInstance then skips the next tick
+altogether. `main()` now starts each round with `new_round(seconds)`, and every
+retry loop calls `check()` before it sleeps: a wait that would reach the
+deadline raises DeadlineExceeded instead, since the retry after it would start
+with nothing left. The camera fails cleanly — its source isn't
+marked published, so the next round picks it up — and no thread sleeps past
+the round. Waiting for a connection is bounded the same way (connect_ftp).
+
+DeadlineExceeded is deliberately not an OSError, so the retry loops, which
+retry OSErrors, let it through rather than retrying it.
+
+`stats()` counts the work given up this round, and the rounds since the
+process started that gave any up, which for a daemon is the running tally.
+"""
+
+import logging
+import threading
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# perf_counter() time the round should be done by; None places no limit
+_expires = None
+_round = {"hits": 0}
+_totals = {"rounds": 0, "rounds_hit": 0}
+
+
+class DeadlineExceeded(Exception):
+    """Raised in place of a retry the round no longer has time for."""
+
+
+def new_round(seconds=None):
+    """Start a round that should be done within `seconds` (None: no limit)."""
+    global _expires
+    with _lock:
+        _expires = None if seconds is None else perf_counter() + seconds
+        _round["hits"] = 0
+        _totals["rounds"] += 1
+
+
+def remaining():
+    """Seconds left in the round, never below 0, or None if it has no limit."""
+    with _lock:
+        expires = _expires
+    if expires is None:
+        return None
+    return max(0.0, expires - perf_counter())
+
+
+def record_hit(what):
+    """Count `what` as work the round gave up for its deadline."""
+    with _lock:
+        if not _round["hits"]:
+            _totals["rounds_hit"] += 1
+        _round["hits"] += 1
+    logger.warning(f"{what}: Left for the next round, to meet the deadline")
+
+
+def check(what, wait=0.0):
+    """Raise DeadlineExceeded unless `what` can wait `wait` seconds first.
+
+    It can if the wait ends before the round's deadline. With no wait, this
+    just asks whether the round has any time left, and raises once none is.
+    """
+    left = remaining()
+    if left is not None and wait >= left:
+        record_hit(what)
+        raise DeadlineExceeded(
+            f"{what}: {left:.1f}s left in the round, not enough for a {wait:.1f}s wait"
+        )
+
+
+def stats():
+    """This round's {"hits"}, and {"rounds", "rounds_hit"} since process start.
+
+    "hits" is the work given up for the deadline; "rounds_hit" the rounds that
+    gave up any.
+    """
+    with _lock:
+        return {"hits": _round["hits"], **_totals}
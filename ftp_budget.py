@@ -0,0 +1,119 @@
+"""
+One budget for every FTP session this process opens.
+
+The server's "421 Too many connections" cap counts sessions per IP, whatever
+opened them: the download pool, the upload pool, and the overnight video's own
+connections on two accounts. Each of those used to size itself as if it were
+alone. Instead, `connect_ftp` takes a slot from this budget before it dials and
+`close_ftp` gives it back, so the process as a whole never holds more than
+FTP_MAX_CONNECTIONS sessions, and the pools can be sized for throughput rather
+than carved out of the cap by hand.
+
+Threads that find the budget spent queue in arrival order, so a burst of
+camera retries can't starve the one thread that has been waiting longest.
+While anyone is queued, the connection pools close idle sessions rather than
+keep them (see `FTPPool`), which is what lets a waiter through.
+"""
+
+import logging
+import threading
+import weakref
+from collections import deque
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionBudget:
+    """At most `limit` FTP sessions open at once, handed out first come first served."""
+
+    def __init__(self, limit):
+        self.limit = max(1, int(limit))
+        self._open = 0
+        self._peak = 0
+        self._queue = deque()
+        self._changed = threading.Condition()
+        # Sessions holding a slot, each with a finalizer that returns the slot
+        # should the session be dropped without close_ftp (its socket closes
+        # when it is collected, and the server frees the session then too).
+        self._holders = weakref.WeakKeyDictionary()
+        self._reclaimers = []
+
+    @property
+    def waiting(self):
+        """Threads queued for a slot."""
+        with self._changed:
+            return len(self._queue)
+
+    def usage(self):
+        """{"open", "waiting", "peak", "limit"}: slots in use now, and at most
+        since `new_round()`."""
+        with self._changed:
+            return {
+                "open": self._open,
+                "waiting": len(self._queue),
+                "peak": self._peak,
+                "limit": self.limit,
+            }
+
+    def new_round(self):
+        """Start a round's peak from the sessions still open going into it."""
+        with self._changed:
+            self._peak = self._open
+
+    def add_reclaimer(self, reclaim):
+        """Register `reclaim()`, called when the budget is spent, to close an idle
+        session somewhere; it returns True if it closed one."""
+        self._reclaimers.append(reclaim)
+
+    def acquire(self, timeout=None):
+        """Wait in line for a slot. Raises ConnectionError after `timeout` seconds."""
+        deadline = None if timeout is None else monotonic() + timeout
+        ticket = object()
+        with self._changed:
+            self._queue.append(ticket)
+            spent = self._open >= self.limit
+        if spent:
+            logger.debug(f"FTP connection budget of {self.limit} spent; waiting")
+            self._reclaim()
+        with self._changed:
+            try:
+                while self._queue[0] is not ticket or self._open >= self.limit:
+                    remaining = None if deadline is None else deadline - monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise ConnectionError(
+                            f"No FTP connection free within {timeout:.0f}s "
+                            f"({self._open} of {self.limit} open)"
+                        )
+                    self._changed.wait(remaining)
+            finally:
+                self._queue.remove(ticket)
+                # The next in line may be able to go too, or, if this waiter
+                # gave up, may now be at the head.
+                self._changed.notify_all()
+            self._open += 1
+            self._peak = max(self._peak, self._open)
+
+    def release(self):
+        """Give back a slot taken by `acquire()`."""
+        with self._changed:
+            self._open -= 1
+            self._changed.notify_all()
+
+    def hold(self, ftp):
+        """Tie the slot just acquired to `ftp`, to be returned by `detach(ftp)`."""
+        self._holders[ftp] = weakref.finalize(ftp, self.release)
+
+    def detach(self, ftp):
+        """Return `ftp`'s slot, if it holds one; a no-op for any other object."""
+        try:
+            finalizer = self._holders.pop(ftp)
+        except (KeyError, TypeError):  # Not held, or not weak-referenceable
+            return
+        if finalizer.detach() is not None:
+            self.release()
+
+    def _reclaim(self):
+        for reclaim in self._reclaimers:
+            if reclaim():
+                return
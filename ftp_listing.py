@@ -0,0 +1,132 @@
+"""
+One directory listing per FTP account per round, shared by every camera.
+
+Change detection and existence checks all ask the same question of the same
+directory: what is there, how big is it, when was it written. Asking it per
+file costs an MDTM and a SIZE for every camera and an NLST plus MDTM for each
+step of the overnight video. Instead, the first thread to need an account's
+directory fetches it with a single MLSD — or, on a server without MLSD, a LIST
+whose Unix-style lines are parsed — and everyone else in the round reads that
+snapshot. main.py starts each round with `new_round()`, so a snapshot is never
+older than the round that uses it.
+
+An entry's `modify` is None when the server didn't give a precise time (LIST
+gives minutes at best), and callers fall back to asking for that one file.
+
+A snapshot only says what was there when it was taken. A camera fetched some
+seconds later — behind others in the download queue, or after a phase wait
+timed for the very swap the snapshot came before — may RETR a newer frame
+than it lists, so `snapshot()` takes a `max_age` past which a caller would
+rather ask for its one file than trust the listing.
+"""
+
+import logging
+from ftplib import error_perm
+from time import monotonic
+from typing import NamedTuple, Optional
+
+from asset_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryEntry(NamedTuple):
+    name: str
+    size: Optional[int]
+    # "YYYYMMDDHHMMSS" in UTC, as MDTM gives it, or None
+    modify: Optional[str]
+
+
+# Snapshots by account; a handful of accounts at most. A snapshot the server
+# couldn't give is cached as None, so a round asks at most once.
+_snapshots = LRUCache(max_entries=8)
+
+
+def new_round():
+    """Forget every snapshot; the next lookup in each account lists afresh."""
+    _snapshots.clear()
+
+
+def snapshot(account, fetch, max_age=None):
+    """This round's listing of `account`, calling `fetch()` for the first one.
+
+    `fetch` returns a listing from `list_directory`. Concurrent first lookups
+    share one fetch. A fetch that raises is not cached, so the caller's own
+    retry can try again. A listing taken more than `max_age` seconds ago is
+    not returned: the caller gets None, as from a server that gives none, and
+    asks about its file directly.
+    """
+    listing, taken = _snapshots.get_or_create(account, lambda: (fetch(), monotonic()))
+    if max_age is not None and monotonic() - taken > max_age:
+        return None
+    return listing
+
+
+def stats():
+    """Listings fetched this round, and lookups they served."""
+    counts = _snapshots.stats()
+    return {"fetched": counts["misses"], "served": counts["hits"]}
+
+
+def normalize_time(stamp):
+    """An MDTM or MLSD timestamp down to whole seconds ("YYYYMMDDHHMMSS")."""
+    return stamp.strip()[:14] if stamp else None
+
+
+def list_directory(ftp):
+    """The current directory as {name: DirectoryEntry}, or None.
+
+    MLSD first, then LIST, then bare NLST names. None means the server would
+    give no listing at all, and callers go back to asking per file. Network
+    errors are left to the caller's retry handling.
+    """
+    try:
+        entries = {}
+        for name, facts in ftp.mlsd(facts=["type", "size", "modify"]):
+            if facts.get("type", "file") != "file":
+                continue
+            size = facts.get("size")
+            entries[name] = DirectoryEntry(
+                name,
+                int(size) if size and size.isdigit() else None,
+                normalize_time(facts.get("modify")),
+            )
+        return entries
+    except error_perm as e:
+        logger.debug(f"MLSD unavailable ({e}); parsing LIST")
+
+    lines = []
+    try:
+        ftp.retrlines("LIST", lines.append)
+    except error_perm as e:
+        logger.debug(f"LIST unavailable ({e})")
+    else:
+        entries = parse_list(lines)
+        if entries is not None:
+            return entries
+
+    try:
+        return {name: DirectoryEntry(name, None, None) for name in ftp.nlst()}
+    except error_perm as e:
+        logger.warning(f"Server gave no directory listing ({e})")
+        return None
+
+
+def parse_list(lines):
+    """Entries from Unix `ls -l` style LIST lines, or None if any won't parse.
+
+    Sizes are read; times are not, as LIST gives them in the server's local
+    zone and to the minute at best.
+    """
+    entries = {}
+    for line in lines:
+        if not line or line.startswith("total "):
+            continue
+        parts = line.split(None, 8)
+        if len(parts) < 9 or not parts[4].isdigit():
+            return None  # Not a format worth guessing at; fall back to NLST
+        if not line.startswith("-"):
+            continue  # Directories, links and devices
+        name = parts[8]
+        entries[name] = DirectoryEntry(name, int(parts[4]), None)
+    return entries
@@ -0,0 +1,132 @@
+"""
+A bounded pool of FTP connections to one account.
+
+The glacier.org server caps simultaneous connections per IP at a handful, so
+one connection for every camera is too many, but a single shared connection
+makes every camera's transfers wait in line behind the others'. The pool opens up to
+`max_connections` sessions on demand, lends each to one thread at a time, and
+keeps returned sessions open for the next borrower. A thread that finds every
+session lent out waits for one to come back rather than opening another.
+
+A session that fails with anything but a permanent (5xx) reply is evicted —
+QUIT and forgotten — since there is no telling what state a broken control
+connection is in; the caller's retry then borrows a fresh one. `close_all()`
+sends QUIT on every idle session, for between rounds.
+
+A pool given the process's ConnectionBudget (ftp_budget.py) also stops keeping
+idle sessions while another thread is queued for a slot: a returned session is
+closed instead, and the budget can ask for an idle one to be closed, so a
+waiter for another pool or the overnight video gets through.
+
+A thread waiting for a session waits no longer than the round has left
+(deadline.py), and then gives up with DeadlineExceeded.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from ftplib import error_perm
+
+import deadline
+
+logger = logging.getLogger(__name__)
+
+
+class FTPPool:
+    """Up to `max_connections` FTP sessions, opened by `connect()` as needed.
+
+    `close(ftp)` releases a session for good (Webcam's close_ftp).
+    """
+
+    def __init__(self, connect, close, max_connections, budget=None):
+        self._connect = connect
+        self._close = close
+        self.max_connections = max(1, int(max_connections))
+        self._idle = []
+        self._open = 0
+        self._available = threading.Condition()
+        self._budget = budget
+        if budget is not None:
+            budget.add_reclaimer(self.close_idle)
+
+    @property
+    def open_connections(self):
+        """Sessions currently open, lent out or idle."""
+        with self._available:
+            return self._open
+
+    @contextmanager
+    def connection(self):
+        """Borrow a session for the `with` block.
+
+        It goes back to the pool when the block ends normally or with a
+        permanent FTP error (a 550 says nothing about the session), and is
+        evicted on anything else.
+        """
+        ftp = self._checkout()
+        try:
+            yield ftp
+        except error_perm:
+            self._checkin(ftp)
+            raise
+        except BaseException:
+            self.evict(ftp)
+            raise
+        else:
+            self._checkin(ftp)
+
+    def _checkout(self):
+        with self._available:
+            while not self._idle and self._open >= self.max_connections:
+                left = deadline.remaining()
+                if left is not None and left <= 0:
+                    deadline.check("Waiting for a pooled FTP connection")
+                self._available.wait(left)
+            if self._idle:
+                # Most recently returned first: the likeliest to still be alive
+                return self._idle.pop()
+            self._open += 1  # Claim the slot before connecting, outside the lock
+        try:
+            return self._connect()
+        except BaseException:
+            with self._available:
+                self._open -= 1
+                self._available.notify()
+            raise
+
+    def _checkin(self, ftp):
+        if self._budget is not None and self._budget.waiting:
+            self.evict(ftp)  # Its slot is wanted elsewhere
+            return
+        with self._available:
+            self._idle.append(ftp)
+            self._available.notify()
+
+    def evict(self, ftp):
+        """QUIT a session for good, freeing its slot for a fresh one."""
+        self._close(ftp)
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    def close_idle(self):
+        """QUIT the longest-idle session, if any; True if one was closed."""
+        with self._available:
+            if not self._idle:
+                return False
+            ftp = self._idle.pop(0)
+            self._open -= 1
+            self._available.notify()
+        self._close(ftp)
+        return True
+
+    def close_all(self):
+        """QUIT every idle session. Sessions lent out are unaffected."""
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._available.notify_all()
+        for ftp in idle:
+            self._close(ftp)
+        if idle:
+            logger.debug(f"Closed {len(idle)} pooled FTP connections")
@@ -0,0 +1,107 @@
+"""
+FTPS with TLS session resumption.
+
+With PROT P every RETR and STOR opens a new TLS data connection, and ftplib's
+FTP_TLS gives each one a full handshake; so does every reconnect after a
+dropped control connection. On the Pi the key exchange is a real share of a
+round's CPU. `ResumingFTP_TLS` resumes instead of renegotiating:
+
+- a data connection resumes the TLS session of its control connection, which
+  is also what servers that require session reuse on the data channel (vsftpd's
+  require_ssl_reuse, for one) insist on; and
+- a new control connection resumes the last session negotiated with the same
+  server, kept in a small per-host cache.
+
+A server that declines to resume simply does a full handshake, as before.
+main.py starts each round with `new_round()` and logs `stats()`, the full and
+resumed handshakes since.
+"""
+
+import ssl
+import threading
+from ftplib import FTP, FTP_TLS
+
+_lock = threading.Lock()
+_sessions = {}  # host -> the last control-channel ssl.SSLSession
+_handshakes = {"full": 0, "resumed": 0}
+_context = None
+
+
+def _shared_context():
+    """One SSLContext for every connection: sessions only resume within one.
+
+    Configured as ftplib's own default (no certificate check), which is what
+    connect_ftp has always connected with.
+    """
+    global _context
+    with _lock:
+        if _context is None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            _context = context
+        return _context
+
+
+def _count(sock):
+    with _lock:
+        _handshakes["resumed" if sock.session_reused else "full"] += 1
+
+
+def new_round():
+    """Start counting handshakes afresh; the session cache is kept."""
+    with _lock:
+        _handshakes.update(full=0, resumed=0)
+
+
+def stats():
+    """Handshakes since the last `new_round()`: {"full", "resumed"}."""
+    with _lock:
+        return dict(_handshakes)
+
+
+class ResumingFTP_TLS(FTP_TLS):
+    """FTP_TLS that resumes TLS sessions on data channels and reconnects."""
+
+    def __init__(self, host="", *args, context=None, **kwargs):
+        super().__init__(host, *args, context=context or _shared_context(), **kwargs)
+
+    def auth(self):
+        """Secure the control connection, resuming this server's last session."""
+        if isinstance(self.sock, ssl.SSLSocket):
+            raise ValueError("Already using TLS")
+        resp = self.voidcmd("AUTH TLS")
+        with _lock:
+            # A session only resumes within the context that made it
+            shared = self.context is _context
+            session = _sessions.get(self.host) if shared else None
+        self.sock = self.context.wrap_socket(
+            self.sock, server_hostname=self.host, session=session
+        )
+        self.file = self.sock.makefile(mode="r", encoding=self.encoding)
+        _count(self.sock)
+        return resp
+
+    def login(self, *args, **kwargs):
+        resp = super().login(*args, **kwargs)
+        self._remember_session()
+        return resp
+
+    def ntransfercmd(self, cmd, rest=None):
+        """Open a data connection that resumes the control connection's session."""
+        conn, size = FTP.ntransfercmd(self, cmd, rest)
+        if self._prot_p:
+            conn = self.context.wrap_socket(
+                conn, server_hostname=self.host, session=self.sock.session
+            )
+            _count(conn)
+        return conn, size
+
+    def _remember_session(self):
+        # TLS 1.3 delivers session tickets after the handshake, so the session
+        # is read once the login replies have come back, not straight after
+        # AUTH.
+        session = getattr(self.sock, "session", None)
+        if session is not None:
+            with _lock:
+                _sessions[self.host] = session
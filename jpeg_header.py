@@ -0,0 +1,52 @@
+"""
+Reading a JPEG's dimensions straight from its frame header.
+
+Pillow's `Image.open` is lazy about pixels but still parses every marker up to
+the scan, builds tables and allocates a decoder. When all a caller needs is the
+width and height, walking the marker segments to the start-of-frame costs a
+few dozen bytes of reading.
+"""
+
+import struct
+
+# Start-of-frame markers, every coding process: SOF0-SOF3, SOF5-SOF7,
+# SOF9-SOF11, SOF13-SOF15. 0xC4 (DHT), 0xC8 (JPG) and 0xCC (DAC) share the
+# range but are not frame headers.
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# Markers that stand alone, with no length field after them
+STANDALONE_MARKERS = frozenset(range(0xD0, 0xD8)) | {0x01}
+
+
+def jpeg_size(data):
+    """The (width, height) in a JPEG's frame header, without decoding it.
+
+    Raises ValueError for data that isn't a JPEG or ends before its frame
+    header; callers can fall back to Pillow for a fuller diagnosis.
+    """
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("not a JPEG (no SOI marker)")
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise ValueError(f"expected a marker at byte {position}")
+        marker = data[position + 1]
+        if marker == 0xFF:  # Fill byte before a marker
+            position += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            position += 2
+            continue
+        if marker in (0xD9, 0xDA):  # EOI, or the scan began with no frame header
+            break
+        (length,) = struct.unpack_from(">H", data, position + 2)
+        if marker in SOF_MARKERS:
+            if position + 9 > len(data):
+                break
+            height, width = struct.unpack_from(">HH", data, position + 5)
+            if not height:
+                # Height deferred to a DNL marker after the first scan
+                raise ValueError("frame height is defined after the scan")
+            return width, height
+        position += 2 + length
+    raise ValueError("no frame header before the scan")
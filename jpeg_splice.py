@@ -0,0 +1,130 @@
+"""
+Lossless splicing of an overlay into the source JPEG.
+
+A logo touches a 612x137 strip at the bottom of a 1920x1080 frame, yet the
+normal path re-encodes every block of the frame, paying the encode CPU for all
+of it and a generation of loss on pixels nothing drew on. Splicing re-encodes
+only the MCU blocks the overlay changed and copies every other block's DCT data
+straight from the source, using `jpegtran -drop` from libjpeg(-turbo).
+
+The changed strip is encoded with the source's own quantization tables and
+chroma subsampling, so jpegtran drops it in without requantizing. Anything the
+splice can't handle exactly — a progressive or non-YCbCr source, unusual
+sampling factors, no jpegtran on the PATH, jpegtran refusing the job — returns
+None and the caller falls back to a full encode.
+"""
+
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from PIL import Image, ImageChops, JpegImagePlugin
+
+logger = logging.getLogger(__name__)
+
+JPEGTRAN = "jpegtran"
+
+
+def mcu_size(source):
+    """Width and height in pixels of one MCU of a decoded-header JPEG."""
+    horizontal = max(component[1] for component in source.layer)
+    vertical = max(component[2] for component in source.layer)
+    return 8 * horizontal, 8 * vertical
+
+
+def align_to_mcu(box, mcu, image_size):
+    """Grow a (left, top, right, bottom) box outward onto the MCU grid.
+
+    The right and bottom edges stop at the frame, which need not be a whole
+    number of MCUs (1080 is 67.5 rows of 16).
+    """
+    mcu_w, mcu_h = mcu
+    left, top, right, bottom = box
+    return (
+        left - left % mcu_w,
+        top - top % mcu_h,
+        min(image_size[0], -(-right // mcu_w) * mcu_w),
+        min(image_size[1], -(-bottom // mcu_h) * mcu_h),
+    )
+
+
+def _spliceable(source):
+    """Why this source can't be spliced, or None if it can."""
+    if source.format != "JPEG":
+        return "not a JPEG"
+    if source.info.get("progressive") or source.info.get("progression"):
+        return "progressive"
+    if source.mode != "RGB" or len(source.layer) != 3:
+        return f"{source.mode} colorspace"
+    if JpegImagePlugin.get_sampling(source) == -1:
+        return "unusual chroma subsampling"
+    if shutil.which(JPEGTRAN) is None:
+        return f"{JPEGTRAN} is not installed"
+    return None
+
+
+def splice_jpeg(source_jpeg, before, after):
+    """The source JPEG with `after`'s changes dropped in, as bytes, or None.
+
+    `before` is the decoded source and `after` the same frame with the overlay
+    drawn on; only the MCU-aligned bounding box of their difference is
+    re-encoded. A frame the overlay left untouched comes back as the source
+    bytes themselves.
+    """
+    with Image.open(io.BytesIO(source_jpeg)) as source:
+        reason = _spliceable(source)
+        if reason is not None:
+            logger.debug(f"Not splicing: {reason}")
+            return None
+        if source.size != before.size:
+            return None
+        mcu = mcu_size(source)
+        qtables = source.quantization
+        subsampling = JpegImagePlugin.get_sampling(source)
+
+    changed = ImageChops.difference(before, after).getbbox()
+    if changed is None:
+        return source_jpeg
+
+    box = align_to_mcu(changed, mcu, after.size)
+    strip = io.BytesIO()
+    after.crop(box).save(strip, format="JPEG", qtables=qtables, subsampling=subsampling)
+
+    # jpegtran reads the drop image from a file, not a pipe.
+    fd, strip_path = tempfile.mkstemp(prefix="gnpc-splice-", suffix=".jpg")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(strip.getvalue())
+        result = subprocess.run(
+            [
+                JPEGTRAN,
+                "-copy",
+                "none",
+                "-drop",
+                f"+{box[0]}+{box[1]}",
+                strip_path,
+            ],
+            input=source_jpeg,
+            capture_output=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"JPEG splice failed ({e}); re-encoding the whole frame")
+        return None
+    finally:
+        try:
+            os.remove(strip_path)
+        except OSError:
+            pass
+
+    if result.returncode != 0 or not result.stdout:
+        logger.warning(
+            "JPEG splice failed "
+            f"({result.stderr.decode(errors='replace').strip()}); "
+            "re-encoding the whole frame"
+        )
+        return None
+    return result.stdout
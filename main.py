@@ -5,7 +5,9 @@ Controls the operation of the program to add logos to and upload webcam photos
 and videos from the glacier.org FTP server to HTML server.
 """
 
+import argparse
 import logging
+import os
 import sys
 import threading
 import traceback
@@ -20,13 +22,28 @@ load_dotenv(resolve_path("environment.env"))
 setup_logging()
 logger = logging.getLogger(__name__)
 
+import breaker
+import cadence
+import daemon
+import deadline
+import ftp_listing
+import ftp_tls
+import pipeline
+import render_engine
 from config import (
     create_allsky_video_from_config,
     create_webcam_from_config,
     load_config,
+    preload_overlay_assets,
 )
+from Overlays import badge_cache
 from single_instance import AlreadyRunning, SingleInstance
-from Webcam import Webcam
+from Webcam import (
+    RENDER_WORKERS,
+    UPLOAD_CONNECTIONS,
+    Webcam,
+    connection_budget,
+)
 
 # Load configuration from YAML
 app_config = load_config("webcams.yaml")
@@ -42,37 +59,133 @@ allsky_videos = [
 
 # Combine all cameras
 cams = webcams + allsky_videos
+# Fonts and logos parsed once, here, before any camera thread needs them
+preload_overlay_assets(cams)
 
 # Seconds to idle between the two rounds of a run. Cron fires every minute and
 # only one run executes at a time, so a run has to finish inside its minute or
 # the next tick is skipped by the lock. Two rounds plus this gap must leave room
 # for the slowest round.
 ROUND_INTERVAL = 25
+# What each of those rounds has, then: the minute less the gap, shared. Retries
+# give up rather than wait past it (deadline.py), and low-priority feeds are the
+# first to slip as a round nears it (pipeline.py).
+CRON_ROUND_SECONDS = (60 - ROUND_INTERVAL) / 2
+
+# Seconds between round starts in --daemon mode, aligned to the wall clock: the
+# default starts rounds at :00 and :30 of every minute, about what cron's two
+# rounds a run gave.
+ROUND_SECONDS = float(os.getenv("ROUND_SECONDS") or 30)
+
+# Cameras fetched at once in each round's download stage (pipeline.py). FTP
+# sources also queue for the download pool's connections; HTTP sources don't.
+DOWNLOAD_WORKERS = max(1, int(os.getenv("DOWNLOAD_WORKERS") or 4))
 
+# "threads" renders every camera in this process; "processes" hands each frame
+# to a pool of worker processes, one per core (see render_engine.py).
+RENDER_ENGINE = os.getenv("RENDER_ENGINE", "threads").lower()
 
-def handle_cam(cam: Webcam):
+
+def handle_cam(cam):
+    logger.info(f"Starting processing for {cam.name}...")
     try:
-        logger.info(f"Starting processing for {cam.name}...")
         cam.process()
         cam.upload_image()
         logger.info(f"Completed {cam.name}")
 
+    except deadline.DeadlineExceeded:
+        return None  # Logged and counted; the next round tries again
     except Exception:
         return f"{cam.name} failed. {traceback.format_exc()}"
 
 
-def main():
+def main(seconds=ROUND_SECONDS):
+    """One round, due to be done within `seconds`."""
+    # Every retry loop gives up rather than wait past this (deadline.py)
+    deadline.new_round(seconds)
+    # Before any camera thread starts: a broken render pool is forked afresh
+    render_engine.new_round()
     threads = []
     errors = []
-
-    for cam in cams:
+    # Directory listings are shared within a round, never across rounds
+    ftp_listing.new_round()
+    ftp_tls.new_round()
+    cadence.new_round()
+    breaker.new_round()
+    # Badges are reused across rounds; only the counts start over
+    badge_cache.new_round()
+    connection_budget.new_round()
+    # Still webcams only: the overnight video keeps its own once-a-day check
+    # on a thread of its own, beside the pipeline
+    schedules = {cam.name: cadence.Cadence(cam.name) for cam in webcams}
+    breakers = {cam.name: breaker.CircuitBreaker(cam.name) for cam in webcams}
+
+    for cam in allsky_videos:
         thread = threading.Thread(target=lambda cam=cam: errors.append(handle_cam(cam)))
         threads.append(thread)
         thread.start()
 
+    rounds = pipeline.Pipeline(
+        downloaders=DOWNLOAD_WORKERS,
+        renderers=RENDER_WORKERS,
+        uploaders=UPLOAD_CONNECTIONS,
+    )
+    errors.extend(rounds.run(webcams, schedules, breakers))
+
     for thread in threads:
         thread.join()
 
+    sent = sum(getattr(cam, "uploads_sent", 0) for cam in cams)
+    skipped = sum(getattr(cam, "uploads_skipped", 0) for cam in cams)
+    logger.info(f"Feeds: {sent} uploaded, {skipped} already published")
+
+    polling = cadence.stats()
+    logger.info(
+        f"Polls: {polling['polls']} skipped as not due, "
+        f"~{polling['seconds']:.1f}s of polling saved"
+    )
+    age = polling["median_age"]
+    misses = sum(getattr(cam, "not_found_retries", 0) for cam in cams)
+    logger.info(
+        f"New frames: median {'-' if age is None else f'{age:.0f}s'} old when "
+        f"fetched, {polling['waited']:.1f}s waited for swaps, {misses} RETRs "
+        f"caught mid-swap"
+    )
+
+    tripped = breaker.stats()
+    if tripped["skipped"] or tripped["probes"]:
+        logger.info(
+            f"Failing sources: {tripped['skipped']} left out, "
+            f"{tripped['probes']} probed"
+        )
+
+    listings = ftp_listing.stats()
+    logger.info(
+        f"Directory listings: {listings['fetched']} fetched, "
+        f"{listings['served']} reused"
+    )
+
+    handshakes = ftp_tls.stats()
+    logger.info(
+        f"TLS handshakes: {handshakes['full']} full, {handshakes['resumed']} resumed"
+    )
+
+    budget = connection_budget.usage()
+    logger.info(f"FTP connections: at most {budget['peak']} of {budget['limit']} open")
+
+    renders = badge_cache.stats()
+    logger.info(
+        f"Conditions badges: {renders['misses']} drawn, {renders['hits']} reused"
+    )
+
+    overruns = deadline.stats()
+    if overruns["hits"]:
+        logger.warning(
+            f"Deadline: {overruns['hits']} retries or feeds left for the next "
+            f"round; {overruns['rounds_hit']} of {overruns['rounds']} rounds "
+            f"so far have hit it"
+        )
+
     errors = [item for item in errors if item is not None]
     if errors:
         error_message = "\n\n".join(errors)
@@ -80,21 +193,60 @@ def main():
         print(error_message, file=sys.stderr)
 
 
+def run_once():
+    """Two rounds, for one cron tick."""
+    for i in range(2):
+        if i:
+            # Idle between rounds without holding FTP sessions. The server
+            # allows only a few connections per IP, so a process that sits on
+            # its connections while sleeping starves anything else using them.
+            Webcam._close_connections()
+            sleep(ROUND_INTERVAL)
+        main(CRON_ROUND_SECONDS)
+
+
+def run_daemon():
+    """Rounds every ROUND_SECONDS until SIGTERM or SIGINT (see daemon.py)."""
+    stop = threading.Event()
+    daemon.stop_on_signals(stop)
+    logger.info(f"Running as a daemon, a round every {ROUND_SECONDS:g}s")
+    # FTP sessions are closed between rounds, as in a cron run
+    daemon.run_forever(
+        main, ROUND_SECONDS, stop, between_rounds=Webcam._close_connections
+    )
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="stay resident and run rounds on a wall-clock schedule instead of "
+        "two rounds per cron invocation",
+    )
+    args = parser.parse_args()
+
     try:
+        # Held for the whole life of the process, daemon or not
         with SingleInstance():
             try:
-                for i in range(2):
-                    if i:
-                        # Idle between rounds without holding FTP sessions. The
-                        # server allows only a few connections per IP, so a
-                        # process that sits on its connections while sleeping
-                        # starves anything else using them.
-                        Webcam._close_connections()
-                        sleep(ROUND_INTERVAL)
-                    main()
+                if RENDER_ENGINE == "processes":
+                    # Before any camera thread starts, so the workers fork
+                    # from a process with only the one thread.
+                    render_engine.start(
+                        overlays={cam.name: cam.overlays for cam in webcams}
+                    )
+                elif RENDER_ENGINE not in render_engine.ENGINES:
+                    logger.warning(
+                        f"Unknown RENDER_ENGINE {RENDER_ENGINE!r}; rendering in threads"
+                    )
+                if args.daemon:
+                    run_daemon()
+                else:
+                    run_once()
             finally:
                 Webcam._close_connections()
+                render_engine.shutdown()
     except AlreadyRunning as e:
         # Not an error: the previous run is still working and the next cron tick
         # will cover this cycle. Stays off stderr so cron doesn't email it.
@@ -0,0 +1,369 @@
+"""
+A round as three stages: download, render, upload.
+
+Each camera thread used to run its own download, render and upload in turn, so
+one camera's feeds couldn't start uploading until all of them were drawn, and
+rendering on the CPU overlapped other cameras' transfers only by luck. Here a
+round is a pipeline instead. Download workers fetch frames, render workers
+draw them, and upload workers publish them. Each pair of stages is joined by a
+bounded queue, and every feed is queued for upload the moment it is encoded.
+When a stage falls behind, the queue feeding it fills and the stage before
+waits, so a slow upload server holds back rendering rather than letting
+encoded frames pile up in memory.
+
+A camera that isn't due this round (cadence.py), or whose source is failing
+so persistently that its breaker is open (breaker.py), never enters the
+pipeline; one due a breaker probe downloads with a single attempt. One
+whose source keeps a steady phase enters the download queue only once its
+expected swap has passed, so a worker is never tied up waiting for it, unless
+waiting would leave it too little of the round to publish its feeds.
+
+Every queue is ordered by priority (Webcam.PRIORITIES): the front-page feeds
+of high-priority cameras are fetched, drawn and published before the rest, and
+items of one priority keep their arrival order. Nearing the round's deadline
+(deadline.py), the upload stage lets feeds slip to the next round rather than
+run the round long: low-priority feeds once less than LOW_PRIORITY_SLACK
+seconds remain, normal ones once the deadline has passed. High-priority feeds
+are never slipped, though their retries and any wait for a connection still
+stop at the deadline. A slipped feed leaves its camera's source unpublished,
+so the next round renders it again and sends just the feeds that didn't go
+(see Webcam.upload_output). A camera whose retries give up for the deadline is
+treated the same way, and isn't reported as a failure.
+
+Every stage keeps count of the items through it, the deepest its queue got,
+and how long items waited in the queue; `Pipeline.run()` logs them with the
+round summary.
+"""
+
+import itertools
+import logging
+import os
+import queue
+import sys
+import threading
+import traceback
+from time import perf_counter, sleep, time
+
+import deadline
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the round's deadline that low-priority feeds stop uploading
+LOW_PRIORITY_SLACK = float(os.getenv("LOW_PRIORITY_SLACK") or 5)
+# Seconds of deadline each priority rank needs left to upload: high always,
+# normal until the deadline, low until LOW_PRIORITY_SLACK before it
+_SLIP_SLACK = (None, 0.0, LOW_PRIORITY_SLACK)
+
+# Marks the end of the work for one worker; sorts after every real item
+_DONE = object()
+_LAST = float("inf")
+
+
+def _phase_limit(schedule):
+    """The longest phase wait that leaves a camera time to publish every feed.
+
+    After the wait, its fetch, render and upload (about as long as its last
+    poll took) have to finish before its low-priority feeds start slipping.
+    A wait that can't fit is skipped: otherwise the same camera would wait,
+    slip its NPS feeds, stay unpublished and wait again, round after round.
+    None with no round deadline.
+    """
+    left = deadline.remaining()
+    if left is None:
+        return None
+    return left - LOW_PRIORITY_SLACK - schedule.poll_seconds
+
+
+class Stage:
+    """A bounded queue and the workers that take from it.
+
+    `rank(item)` orders the queue, lowest first; items of equal rank, or all
+    items without a `rank`, are taken in the order they were put.
+    """
+
+    def __init__(self, name, workers, handle, maxsize=0, rank=None):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self._handle = handle
+        self._rank = rank or (lambda item: 0)
+        self._queue = queue.PriorityQueue(maxsize)
+        self._order = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.items = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"{self.name}-{number}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item):
+        """Queue `item`, waiting for room if the stage is behind."""
+        self._queue.put((self._rank(item), next(self._order), perf_counter(), item))
+        depth = self._queue.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+
+    def close(self):
+        """Let the workers finish what is queued, then stop them."""
+        for _ in self._threads:
+            self._queue.put((_LAST, next(self._order), perf_counter(), _DONE))
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "items": self.items,
+                "max_depth": self.max_depth,
+                "mean_wait": self.total_wait / self.items if self.items else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def _work(self):
+        while True:
+            _, _, queued, item = self._queue.get()
+            if item is _DONE:
+                return
+            waited = perf_counter() - queued
+            with self._lock:
+                self.items += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            self._handle(item)
+
+
+class _Job:
+    """One camera's trip through the pipeline."""
+
+    def __init__(self, cam, schedule, breaker=None):
+        self.cam = cam
+        self.schedule = schedule
+        self.breaker = breaker
+        # A probe of a source whose breaker is open: one attempt, no retries
+        self.probe = breaker is not None and breaker.open
+        self.fetched_at = None
+        self.started = None
+        self.error = None
+        # Feeds left for the next round because the deadline was near
+        self.slipped = 0
+        # Set when a retry gave up for the deadline
+        self.abandoned = False
+        self._lock = threading.Lock()
+        self._rendered = False
+        self._queued = 0
+        self._uploaded = 0
+        self._finished = False
+
+
+class Pipeline:
+    """Run a round of cameras through download, render and upload stages."""
+
+    def __init__(self, downloaders, renderers, uploaders):
+        def camera_rank(job):
+            return job.cam.priority_rank()
+
+        def feed_rank(item):
+            job, file_name, _ = item
+            return job.cam.priority_rank(file_name)
+
+        self.download = Stage("download", downloaders, self._download, rank=camera_rank)
+        # One frame waiting per render worker, two feeds per upload worker:
+        # enough to keep every worker busy, little enough to hold in memory.
+        self.render = Stage(
+            "render", renderers, self._render, maxsize=renderers, rank=camera_rank
+        )
+        self.upload = Stage(
+            "upload", uploaders, self._upload, maxsize=2 * uploaders, rank=feed_rank
+        )
+        self.slipped = 0
+        self.errors = []
+        self._errors_lock = threading.Lock()
+        self._pending = 0
+        self._all_done = threading.Condition()
+
+    def run(self, cams, schedules=None, breakers=None):
+        """Take every camera through the round; returns the failures' tracebacks.
+
+        `schedules` and `breakers` map camera names to their Cadence and
+        CircuitBreaker, if any.
+        """
+        schedules = schedules or {}
+        breakers = breakers or {}
+        stages = (self.download, self.render, self.upload)
+        for stage in stages:
+            stage.start()
+
+        now = time()
+        releases = []
+        for cam in cams:
+            schedule = schedules.get(cam.name)
+            breaker = breakers.get(cam.name)
+            # Due first: a camera the cadence skips anyway mustn't be counted
+            # as probed, or as left out, by its breaker
+            if (schedule is not None and not schedule.due(now)) or (
+                breaker is not None and not breaker.allows(now)
+            ):
+                # A resident process keeps its cameras: don't report last
+                # round's feeds
+                cam.uploads_sent = cam.uploads_skipped = cam.not_found_retries = 0
+                continue
+            delay = (
+                schedule.fetch_delay(now, _phase_limit(schedule))
+                if schedule is not None
+                else 0
+            )
+            releases.append((now + delay, _Job(cam, schedule, breaker)))
+        self._pending = len(releases)
+
+        # Each camera enters the download queue once its phase wait is over
+        for release, job in sorted(
+            releases, key=lambda entry: (entry[0], entry[1].cam.priority_rank())
+        ):
+            wait = release - time()
+            left = deadline.remaining()
+            if left is not None:
+                wait = min(wait, left)
+            if wait > 0:
+                sleep(wait)
+            self.download.put(job)
+
+        with self._all_done:
+            self._all_done.wait_for(lambda: self._pending == 0)
+        for stage in stages:
+            stage.close()
+        self.log_stats()
+        return self.errors
+
+    def log_stats(self):
+        for stage in (self.download, self.render, self.upload):
+            counts = stage.stats()
+            logger.info(
+                f"Pipeline {stage.name}: {counts['items']} items, queue at most "
+                f"{counts['max_depth']} deep, waits {counts['mean_wait']:.2f}s "
+                f"mean, {counts['max_wait']:.2f}s max"
+            )
+
+    # -- stage handlers -------------------------------------------------------
+
+    def _download(self, job):
+        job.fetched_at = time()
+        job.started = perf_counter()
+        try:
+            logger.info(f"Starting processing for {job.cam.name}...")
+            job.cam.begin_upload()
+            if job.probe:
+                job.cam.fetch(max_retries=1)
+            else:
+                job.cam.fetch()
+        except Exception:
+            self._fetch_failed(job)
+            self._finish(job)
+            return
+        if job.breaker is not None:
+            job.breaker.record_success()
+        if job.cam.source_unchanged:
+            self._finish(job)
+        else:
+            self.render.put(job)
+
+    def _render(self, job):
+        def queue_upload(file_name, output):
+            with job._lock:
+                job._queued += 1
+            self.upload.put((job, file_name, output))
+
+        try:
+            job.cam.render(on_output=queue_upload)
+        except Exception:
+            self._fail(job)
+        with job._lock:
+            job._rendered = True
+            done = job._uploaded == job._queued
+        if done:
+            self._finish(job)
+
+    def _upload(self, item):
+        job, file_name, output = item
+        try:
+            if job.error is None and not job.abandoned:
+                if self._slips(job.cam.priority_rank(file_name)):
+                    deadline.record_hit(f"{job.cam.name} upload of {file_name}")
+                    with job._lock:
+                        job.slipped += 1
+                    with self._errors_lock:
+                        self.slipped += 1
+                else:
+                    job.cam.upload_output(output, file_name)
+        except Exception:
+            self._fail(job)
+        with job._lock:
+            job._uploaded += 1
+            done = job._rendered and job._uploaded == job._queued
+        if done:
+            self._finish(job)
+
+    def _slips(self, rank):
+        """Whether a feed of priority `rank` should wait for the next round."""
+        slack = _SLIP_SLACK[rank]
+        left = deadline.remaining()
+        if left is None or slack is None:
+            return False
+        return left <= slack
+
+    def _fetch_failed(self, job):
+        error = sys.exc_info()[1]
+        if (
+            job.breaker is None
+            or isinstance(error, deadline.DeadlineExceeded)
+            # A fault of the shared server says nothing about this source
+            or not job.cam.is_source_error(error)
+            or job.breaker.record_failure(time())
+        ):
+            self._fail(job)
+        else:
+            # A failed probe: expected, so logged by the breaker, not reported
+            with job._lock:
+                job.abandoned = True
+
+    def _fail(self, job):
+        if isinstance(sys.exc_info()[1], deadline.DeadlineExceeded):
+            # Already logged and counted; the next round takes the camera up
+            with job._lock:
+                job.abandoned = True
+            return
+        with job._lock:
+            if job.error is None:
+                job.error = f"{job.cam.name} failed. {traceback.format_exc()}"
+
+    def _finish(self, job):
+        with job._lock:
+            if job._finished:
+                return
+            job._finished = True
+        cam = job.cam
+        try:
+            cam.finish_upload(succeeded=not (job.error or job.slipped or job.abandoned))
+            # A slipped feed goes out next round, so the poll isn't recorded
+            # as done: the cadence would otherwise skip the camera until its
+            # source's next change.
+            if job.error is None and not (job.abandoned or job.slipped):
+                if job.schedule is not None:
+                    job.schedule.record_poll(
+                        job.fetched_at, cam.mod_time, perf_counter() - job.started
+                    )
+                logger.info(f"Completed {cam.name}")
+        except Exception:
+            self._fail(job)
+        if job.error is not None:
+            with self._errors_lock:
+                self.errors.append(job.error)
+        with self._all_done:
+            self._pending -= 1
+            self._all_done.notify_all()
@@ -0,0 +1,282 @@
+"""
+Optional process-pool engine for decoding, overlaying and encoding frames.
+
+By default every camera renders in threads of the one process, which is enough
+while the work is in Pillow's C code but serializes whatever holds the GIL:
+drawing badge text glyph by glyph, the Python around each paste. With
+RENDER_ENGINE=processes, main.py starts a pool of worker processes, one per
+core, and each camera hands its frame to a worker instead. Downloads and
+uploads stay in the camera threads of the main process.
+
+Frames cross the process boundary through `multiprocessing.shared_memory`
+rather than as pickled arguments: the camera writes the source JPEG into a
+block, the worker writes each encoded feed into a block of its own, and only
+the block names travel through the pool's pipe. Whoever reads a block last
+unlinks it, so nothing is left behind in /dev/shm when a job fails.
+
+Each camera's overlays go to the workers once, when the pool starts, and a job
+names its camera instead of pickling the overlays again for every frame. Each
+worker keeps its own asset and badge caches, warmed on its first frame;
+main.py's badge count covers only renders done in the main process.
+
+A worker that dies mid-job (the OOM killer, a crash in a C library) breaks the
+whole pool, and a hung one would hold its camera past the round. Waiting on a
+worker is bounded by the round's deadline (deadline.py); a job whose pool broke
+or that ran out of time is rendered in the main process instead. The pool
+isn't replaced there and then: forking while camera threads are mid-step
+would hand the new workers whatever locks those threads held (the PurpleAir
+cache's, held across an HTTP request; the caches'). Instead the rest of the
+round renders in threads, and `new_round()`, called by main.py before the
+next round starts any, stops the old workers and forks fresh ones.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+
+import deadline
+from Overlays import decode_jpeg
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("threads", "processes")
+
+# The running ProcessEngine, or None when frames are rendered in threads
+_engine = None
+
+# In a worker: each camera's overlays by camera name, set once by _init_worker
+_overlays = {}
+
+
+def _to_shared(data):
+    """Copy bytes into a new shared memory block; returns (name, size)."""
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    try:
+        block.buf[: len(data)] = data
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    block.close()
+    return block.name, len(data)
+
+
+def _read_shared(name, size, unlink=False):
+    """The bytes in a shared memory block, unlinking it if this is its last read."""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:size])
+    finally:
+        block.close()
+        if unlink:
+            block.unlink()
+
+
+def _unlink_shared(name):
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def _init_worker(overlays):
+    global _overlays
+    _overlays = overlays
+
+
+def _render_feeds(overlays, source_jpeg, mod_time_str, jpeg_splice):
+    """Decode one frame and yield each feed's encoded BytesIO, in order."""
+    frame = decode_jpeg(io.BytesIO(source_jpeg))
+    for overlay in overlays:
+        yield overlay.render(frame, mod_time_str, source_jpeg if jpeg_splice else None)
+
+
+def _render_job(name, source_name, source_size, mod_time_str, jpeg_splice):
+    """Worker side: render camera `name`'s frame into shared memory.
+
+    Returns the (name, size) of each feed's block, in the order of the camera's
+    overlays. The caller owns the source block; the output blocks become the
+    caller's to unlink once returned, and are unlinked here if the job fails
+    partway.
+    """
+    source_jpeg = _read_shared(source_name, source_size)
+    outputs = []
+    try:
+        for output in _render_feeds(
+            _overlays[name], source_jpeg, mod_time_str, jpeg_splice
+        ):
+            outputs.append(_to_shared(output.getbuffer()))
+    except BaseException:
+        for block_name, _ in outputs:
+            _unlink_shared(block_name)
+        raise
+    return outputs
+
+
+def _ready():
+    return os.getpid()
+
+
+def _stop(pool):
+    """Shut `pool` down without waiting on its workers, stopping any mid-job."""
+    # The executor has no public way to stop a worker mid-job, and a hung one
+    # would otherwise keep its process forever.
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _discard_outputs(future):
+    """Unlink the blocks of a job finished after its camera stopped waiting."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    for block_name, _ in future.result():
+        _unlink_shared(block_name)
+
+
+class ProcessEngine:
+    """A pool of worker processes that render whole camera frames."""
+
+    def __init__(self, workers=None, overlays=None):
+        self.workers = workers or os.cpu_count() or 1
+        # Each camera's overlays, by camera name; the workers get them once
+        self.overlays = {name: list(group) for name, group in (overlays or {}).items()}
+        self._lock = threading.Lock()
+        # Set when a job found the pool broken or hung; new_round() replaces it
+        self._stale = False
+        # One resource tracker for the main process and its workers, started
+        # before they fork, so a block created in a worker and unlinked here
+        # is registered and released with the same tracker.
+        resource_tracker.ensure_running()
+        self._pool = self._start_pool()
+
+    def _start_pool(self):
+        # Fork where the platform has it: workers start with the config, fonts
+        # and logos the main process has already loaded.
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.overlays,),
+        )
+        # A forking pool starts all its workers on its first job. Do that now,
+        # while the main process has no camera threads to fork in mid-step.
+        pool.submit(_ready).result()
+        return pool
+
+    def new_round(self):
+        """Replace a pool that broke or hung last round; call between rounds.
+
+        Only while no camera thread is running, so the fork copies no lock
+        some thread holds.
+        """
+        with self._lock:
+            if not self._stale:
+                return
+            self._stale = False
+            _stop(self._pool)
+            self._pool = self._start_pool()
+        logger.info(f"Restarted the {self.workers} render worker processes")
+
+    def _render_here(self, name, source_jpeg, mod_time_str, jpeg_splice):
+        return list(
+            _render_feeds(self.overlays[name], source_jpeg, mod_time_str, jpeg_splice)
+        )
+
+    def serves(self, name):
+        """Whether camera `name`'s overlays were handed to the workers."""
+        return name in self.overlays
+
+    def render(self, name, source_jpeg, mod_time_str="", jpeg_splice=False):
+        """Render camera `name`'s frame in a worker; returns a BytesIO per feed.
+
+        Raises whatever the worker raised, e.g. a truncated source's OSError,
+        so the camera's own retry handling still applies. If the pool has
+        broken, or the worker isn't done by the round's deadline, the frame is
+        rendered here instead, as is every frame until `new_round()`.
+        """
+        with self._lock:
+            pool = None if self._stale else self._pool
+        if pool is None:
+            return self._render_here(name, source_jpeg, mod_time_str, jpeg_splice)
+
+        source_name, source_size = _to_shared(source_jpeg)
+        try:
+            future = pool.submit(
+                _render_job, name, source_name, source_size, mod_time_str, jpeg_splice
+            )
+            outputs = future.result(timeout=deadline.remaining())
+        except BrokenProcessPool:
+            logger.warning(
+                f"  {name}: A render worker died; rendering in threads until "
+                "the next round restarts the workers"
+            )
+            with self._lock:
+                self._stale = True
+            return self._render_here(name, source_jpeg, mod_time_str, jpeg_splice)
+        except FutureTimeout:
+            if not future.cancel():
+                # Running, not queued: a worker is stuck on it, or too slow
+                # to trust for the rest of the round.
+                future.add_done_callback(_discard_outputs)
+                with self._lock:
+                    self._stale = True
+            logger.warning(
+                f"  {name}: No render worker finished by the round's deadline; "
+                "rendering this frame here"
+            )
+            return self._render_here(name, source_jpeg, mod_time_str, jpeg_splice)
+        finally:
+            _unlink_shared(source_name)
+        return [
+            io.BytesIO(_read_shared(block_name, size, unlink=True))
+            for block_name, size in outputs
+        ]
+
+    def shutdown(self):
+        if self._stale:
+            _stop(self._pool)  # Waiting could mean waiting on a hung worker
+        else:
+            self._pool.shutdown()
+
+
+def start(workers=None, overlays=None):
+    """Start rendering in worker processes; call before any camera thread runs.
+
+    `overlays` maps each camera's name to its overlays; cameras not in it
+    render in threads as before.
+    """
+    global _engine
+    if _engine is None:
+        _engine = ProcessEngine(workers, overlays)
+        logger.info(f"Rendering in {_engine.workers} worker processes")
+    return _engine
+
+
+def new_round():
+    """Restart the worker processes if last round broke them; between rounds."""
+    if _engine is not None:
+        _engine.new_round()
+
+
+def current():
+    """The running ProcessEngine, or None when rendering in threads."""
+    return _engine
+
+
+def shutdown():
+    """Stop the worker processes, if any were started."""
+    global _engine
+    if _engine is not None:
+        _engine.shutdown()
+        _engine = None
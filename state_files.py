@@ -0,0 +1,45 @@
+"""
+Small JSON records that outlive a run.
+
+Cron starts a fresh process every minute, so anything a camera should remember
+from one run to the next — what it last published, say — lives in a file. The
+records sit in the system temp directory, like HttpWebcam's validators: losing
+one costs a redundant upload, never a wrong one.
+"""
+
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+def state_path(kind, name):
+    """Where the `kind` record of camera `name` is kept."""
+    return os.path.join(tempfile.gettempdir(), f"gnpc-{kind}-{name}.json")
+
+
+def read_state(path):
+    """The record at `path`, or None if it is missing or unreadable."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_state(path, data):
+    """Replace the record at `path`; a failure is logged, not raised."""
+    # Unique temp name so overlapping runs can't read a half-written file.
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not record {os.path.basename(path)}: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
@@ -0,0 +1,48 @@
+"""Fixtures shared by every test module."""
+
+import pytest
+
+import breaker
+import cadence
+import deadline
+import ftp_listing
+import state_files
+from Webcam import Webcam
+
+
+@pytest.fixture(autouse=True)
+def state_in_tmp(monkeypatch, tmp_path):
+    """Keep the records cameras persist between runs out of the real temp dir."""
+    monkeypatch.setattr(state_files.tempfile, "gettempdir", lambda: str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def fresh_ftp_listings():
+    """Every test starts a new round, with no directory listing cached."""
+    ftp_listing.new_round()
+    yield
+    ftp_listing.new_round()
+
+
+@pytest.fixture(autouse=True)
+def fresh_round_counts():
+    """Cadence and breaker stats count from zero in every test."""
+    cadence.new_round()
+    breaker.new_round()
+
+
+@pytest.fixture(autouse=True)
+def no_round_deadline():
+    """Tests run without a deadline unless they set one."""
+    deadline.new_round()
+    yield
+    deadline.new_round()
+
+
+@pytest.fixture(autouse=True)
+def fresh_ftp_pools():
+    """No test borrows a connection a previous test's fake left idle."""
+    Webcam._close_connections()
+    yield
+    Webcam._close_connections()
@@ -0,0 +1,70 @@
+"""
+Benchmark the JPEG encoding profiles a feed's `encoding` block can select.
+
+For each representative frame size the cameras produce (1920x1080, 1280x720,
+1600x1200) it synthesizes a camera-like source at q=85 — or reads the frames
+given on the command line — and reports, per profile, the time to encode the
+overlaid frame and the bytes it comes out at, so Pi CPU can be traded against
+uplink bytes deliberately.
+
+    python tests/manual/bench_encoding.py [frame.jpg ...] [--runs 10]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from Overlays import decode_jpeg, jpeg_save_options  # noqa: E402
+from tests.manual.frames import synthetic_frame  # noqa: E402
+
+SIZES = [(1920, 1080), (1280, 720), (1600, 1200)]
+
+PROFILES = {
+    "default q90": {},
+    "q85": {"quality": 85},
+    "q90 optimize": {"optimize": True},
+    "q90 progressive": {"progressive": True, "optimize": True},
+    "q90 4:4:4": {"subsampling": "4:4:4"},
+    "keep": {"quality": "keep"},
+    "keep optimize": {"quality": "keep", "optimize": True},
+    "q90 restart/row": {"restart_marker_rows": 1},
+}
+
+
+def bench(source_jpeg, runs):
+    frame = decode_jpeg(io.BytesIO(source_jpeg))
+    print(f"\n{frame.width}x{frame.height}, source {len(source_jpeg):,} bytes")
+    for label, encoding in PROFILES.items():
+        options = jpeg_save_options(encoding, frame)
+        start = time.perf_counter()
+        for _ in range(runs):
+            output = io.BytesIO()
+            frame.save(output, format="JPEG", **options)
+        seconds = (time.perf_counter() - start) / runs
+        print(
+            f"  {label:<16} {len(output.getvalue()):>10,} bytes  "
+            f"{seconds * 1000:7.1f} ms/frame"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("frames", nargs="*", help="source JPEGs (default: synthetic)")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.frames:
+        for path in args.frames:
+            with open(path, "rb") as f:
+                bench(f.read(), args.runs)
+    else:
+        for size in SIZES:
+            bench(synthetic_frame(size), args.runs)
+
+
+if __name__ == "__main__":
+    main()
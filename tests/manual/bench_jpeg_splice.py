@@ -0,0 +1,82 @@
+"""
+Benchmark the JPEG splice against the full re-encode in Overlay.add_overlay.
+
+Synthesizes a camera-like 1920x1080 frame (or reads one given on the command
+line), applies the standard GNPC logo both ways, and reports time per frame,
+output bytes, and how far each result drifts from the source outside the logo.
+
+    python tests/manual/bench_jpeg_splice.py [frame.jpg] [--runs 20]
+"""
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from PIL import Image, ImageChops, ImageStat  # noqa: E402
+
+from jpeg_splice import splice_jpeg  # noqa: E402
+from Overlays import Logo  # noqa: E402
+from tests.manual.frames import synthetic_frame  # noqa: E402
+
+
+def drift_outside(source, result, box):
+    """Mean absolute difference from the source above the logo's MCU row."""
+    top = (0, 0, source.width, max(1, box[1] - 16))
+    diff = ImageChops.difference(source.crop(top), result.crop(top))
+    return sum(ImageStat.Stat(diff).mean) / 3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("frame", nargs="?", help="a source JPEG (default: synthetic)")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.frame:
+        with open(args.frame, "rb") as f:
+            source_jpeg = f.read()
+    else:
+        source_jpeg = synthetic_frame()
+    with Image.open(io.BytesIO(source_jpeg)) as image:
+        source = image.convert("RGB")
+    logo = Logo(place=(0, source.height - 136), size=(612, 137))
+    box = (0, source.height - 136, 612, source.height)
+
+    if shutil.which("jpegtran") is None:
+        print("jpegtran is not installed; only the full encode can be measured")
+
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        full = logo.add_overlay(io.BytesIO(source_jpeg)).getvalue()
+    full_seconds = (time.perf_counter() - start) / args.runs
+
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        # Decode included, as add_overlay's timing includes it
+        with Image.open(io.BytesIO(source_jpeg)) as image:
+            before = image.convert("RGB")
+        spliced = splice_jpeg(source_jpeg, before, logo.apply(before.copy()))
+    splice_seconds = (time.perf_counter() - start) / args.runs
+
+    def report(label, output, seconds):
+        drift = drift_outside(source, Image.open(io.BytesIO(output)), box)
+        print(
+            f"{label:<12} {len(output):>9,} bytes  "
+            f"{seconds * 1000:7.1f} ms/frame  drift {drift:.3f}"
+        )
+
+    print(f"{'source':<12} {len(source_jpeg):>9,} bytes  {source.size}")
+    report("full encode", full, full_seconds)
+    if spliced is None:
+        print("splice       unavailable (see log for the reason)")
+    else:
+        report("splice", spliced, splice_seconds)
+
+
+if __name__ == "__main__":
+    main()
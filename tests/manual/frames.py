@@ -0,0 +1,14 @@
+"""Source frames shared by the manual benchmarks in this directory."""
+
+import io
+
+from PIL import Image, ImageFilter
+
+
+def synthetic_frame(size=(1920, 1080)):
+    """Noise blurred into something with camera-like texture, saved at q=85."""
+    noise = Image.effect_noise(size, 60).convert("RGB")
+    frame = noise.filter(ImageFilter.GaussianBlur(2))
+    buffer = io.BytesIO()
+    frame.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
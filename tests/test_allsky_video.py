@@ -2,14 +2,16 @@
 
 import io
 import socket
-from datetime import datetime
+from datetime import datetime, timezone
 from ftplib import error_perm
 from zoneinfo import ZoneInfo
 
 import pytest
 
 import AllskyVideo
+import ftp_listing
 from AllskyVideo import AllskyVideo as AllskyVideoClass
+from ftp_listing import DirectoryEntry
 
 
 def make_video():
@@ -23,7 +25,17 @@ def make_video():
     )
 
 
-class FakeFTP:
+class NlstOnlyFTP:
+    """A server that lists names with NLST but knows neither MLSD nor LIST."""
+
+    def mlsd(self, facts=None):
+        raise error_perm("500 Unknown command")
+
+    def retrlines(self, cmd, callback):
+        raise error_perm("500 Unknown command")
+
+
+class FakeFTP(NlstOnlyFTP):
     """Minimal FTP stub whose RETR fails as if the file vanished mid-run."""
 
     def __init__(self, files):
@@ -39,8 +51,8 @@ class FakeFTP:
         pass
 
 
-def test_get_does_not_crash_when_file_vanishes_after_nlst(monkeypatch):
-    """File present at nlst() but gone at RETR should not raise or set available."""
+def test_get_does_not_crash_when_file_vanishes_after_listing(monkeypatch):
+    """File listed but gone at RETR should not raise or set available."""
     monkeypatch.setattr(
         AllskyVideo, "connect_ftp", lambda *a, **k: FakeFTP(["allsky.mp4"])
     )
@@ -51,7 +63,7 @@ def test_get_does_not_crash_when_file_vanishes_after_nlst(monkeypatch):
     assert vid.available is False
 
 
-class FlakyConnectFTP:
+class FlakyConnectFTP(NlstOnlyFTP):
     """FTP stub that serves a video, after connect_ftp fails a few times."""
 
     def __init__(self, files):
@@ -122,7 +134,7 @@ def test_upload_image_skips_when_logoed_is_not_a_path():
     vid.upload_image()  # Must return cleanly, not TypeError on open(BytesIO)
 
 
-class PublishedFTP:
+class PublishedFTP(NlstOnlyFTP):
     """Upload-server stub that already holds today's video."""
 
     def __init__(self, mdtm_utc):
@@ -159,3 +171,154 @@ def test_yesterdays_video_does_not_count_as_processed(monkeypatch):
     now = datetime(2026, 8, 21, 20, 0, tzinfo=ZoneInfo("America/Denver"))
 
     assert make_video().check_if_processed_today(now=now) is False
+
+
+def test_processed_yesterday_is_not_processed_today(monkeypatch):
+    """A daemon lives through midnight; yesterday's answer must not carry over."""
+    servers = [PublishedFTP("20260822013000")]
+    monkeypatch.setattr(AllskyVideo, "connect_ftp", lambda *a, **k: servers[-1])
+    video = make_video()
+    evening = datetime(2026, 8, 21, 20, 0, tzinfo=ZoneInfo("America/Denver"))
+    assert video.check_if_processed_today(now=evening) is True
+
+    # Next morning last night's video has been taken down
+    servers.append(FakeFTP([]))
+    ftp_listing.new_round()
+    morning = datetime(2026, 8, 22, 6, 0, tzinfo=ZoneInfo("America/Denver"))
+
+    assert video.check_if_processed_today(now=morning) is False
+
+
+class ListingFTP:
+    """A server with MLSD, recording what it is asked."""
+
+    def __init__(self, listing, log):
+        self.listing = listing
+        self.log = log
+
+    def mlsd(self, facts=None):
+        self.log.append("MLSD")
+        return self.listing
+
+    def retrbinary(self, cmd, callback):
+        self.log.append(cmd)
+        callback(b"mp4-bytes")
+
+    def voidcmd(self, cmd):
+        raise AssertionError(f"asked {cmd} with the listing in hand")
+
+    sendcmd = voidcmd
+
+    def quit(self):
+        pass
+
+
+def test_processed_today_reads_the_time_from_the_listing(monkeypatch):
+    log = []
+    listing = [("allsky.mp4", {"type": "file", "modify": "20260822013000.123"})]
+    monkeypatch.setattr(
+        AllskyVideo, "connect_ftp", lambda *a, **k: ListingFTP(listing, log)
+    )
+    now = datetime(2026, 8, 21, 20, 0, tzinfo=ZoneInfo("America/Denver"))
+
+    assert make_video().check_if_processed_today(now=now) is True
+    assert log == ["MLSD"]
+
+
+def test_no_video_waiting_means_no_download_connection(monkeypatch):
+    """Most rounds there's no video; the listing says so, and that's all."""
+    log = []
+    connects = []
+
+    def connect(*args, **kwargs):
+        connects.append(args)
+        return ListingFTP([("lpp.jpg", {"type": "file"})], log)
+
+    monkeypatch.setattr(AllskyVideo, "connect_ftp", connect)
+
+    vid = make_video()
+    vid.get(retry_delay=0)
+
+    assert vid.available is False
+    assert log == ["MLSD"]
+    assert len(connects) == 1  # The listing's own, and no second for a RETR
+
+
+def test_the_video_shares_the_cameras_listing(monkeypatch, tmp_path):
+    """The cameras list the same account first; the video reads their listing."""
+    log = []
+    connects = []
+
+    def connect(*args, **kwargs):
+        connects.append(args)
+        return ListingFTP([], log)
+
+    monkeypatch.setattr(AllskyVideo, "connect_ftp", connect)
+    monkeypatch.setenv("server", "ftp.example.org")
+    listed = {"allsky.mp4": DirectoryEntry("allsky.mp4", 9, "20260822013000")}
+    ftp_listing.snapshot(("ftp.example.org", "user"), lambda: listed)
+
+    vid = make_video()
+    vid.raw_video_path = str(tmp_path / "allsky-raw.mp4")
+    vid.get(retry_delay=0)
+
+    assert vid.available is True
+    assert log == ["RETR allsky.mp4"]  # One connection, for the download only
+    assert len(connects) == 1
+    assert vid.mod_time_str == "7:30 pm Aug. 21, 2026"
+
+
+class VideoServer:
+    """An FTP account whose files change as commands arrive."""
+
+    def __init__(self, files, log):
+        self.files = set(files)
+        self.log = log
+
+    def mlsd(self, facts=None):
+        modify = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        return [(name, {"type": "file", "modify": modify}) for name in self.files]
+
+    def retrbinary(self, cmd, callback):
+        self.log.append(cmd)
+        callback(b"mp4-bytes")
+
+    def storbinary(self, cmd, file):
+        self.log.append(cmd.split(".")[0])
+
+    def rename(self, old, new):
+        self.files.add(new)
+
+    def delete(self, name):
+        self.log.append(f"DELE {name}")
+        self.files.discard(name)
+
+    def quit(self):
+        pass
+
+
+def test_a_later_round_does_not_upload_the_same_video_again(monkeypatch, tmp_path):
+    """A daemon keeps one video object; round two has nothing new to send."""
+    log = []
+    accounts = {"user": VideoServer(["allsky.mp4"], log), "web": VideoServer([], log)}
+    monkeypatch.setenv("username", "web")
+    monkeypatch.setattr(
+        AllskyVideo, "connect_ftp", lambda server, user, password: accounts[user]
+    )
+    vid = make_video()
+    vid.raw_video_path = str(tmp_path / "allsky-raw.mp4")
+    vid.logoed_video_path = str(tmp_path / "allsky-logo.mp4")
+
+    def add_logo():
+        with open(vid.logoed_video_path, "wb") as f:
+            f.write(b"logoed")
+        vid.logoed = vid.logoed_video_path
+
+    monkeypatch.setattr(vid, "add_logo", add_logo)
+
+    for _ in range(2):
+        ftp_listing.new_round()
+        vid.process()
+        vid.upload_image()
+
+    assert log == ["RETR allsky.mp4", "STOR allsky", "DELE allsky.mp4"]
@@ -0,0 +1,127 @@
+"""Unit tests for the shared overlay asset cache (no network)."""
+
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import asset_cache
+from asset_cache import LRUCache, load_font, load_image
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    asset_cache.image_cache.clear()
+    asset_cache.font_cache.clear()
+    yield
+    asset_cache.image_cache.clear()
+    asset_cache.font_cache.clear()
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache(max_entries=4)
+    assert cache.get_or_create("a", lambda: 1) == 1
+    assert cache.get_or_create("a", lambda: 2) == 1  # Cached, factory not run
+
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_lru_cache_counts_each_round_afresh_but_keeps_its_entries():
+    cache = LRUCache(max_entries=4)
+    cache.get_or_create("a", lambda: 1)
+    cache.get_or_create("a", lambda: 1)
+
+    cache.new_round()
+    assert cache.get_or_create("a", lambda: 2) == 1
+
+    assert cache.stats() == {"hits": 1, "misses": 0, "entries": 1}
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.get_or_create("a", lambda: 1)
+    cache.get_or_create("b", lambda: 2)
+    cache.get_or_create("a", lambda: 1)  # "a" is now the most recent
+    cache.get_or_create("c", lambda: 3)
+
+    assert len(cache) == 2
+    assert cache.get_or_create("b", lambda: "rebuilt") == "rebuilt"
+
+
+def test_concurrent_misses_build_once():
+    """Every camera thread asks for the logo at the start of a round."""
+    cache = LRUCache(max_entries=4)
+    builds = []
+
+    def slow_build():
+        builds.append(1)
+        time.sleep(0.05)
+        return "logo"
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(cache.get_or_create("k", slow_build))
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert builds == [1]
+    assert results == ["logo"] * 8
+
+
+def test_a_failed_build_is_not_cached():
+    cache = LRUCache(max_entries=4)
+
+    def broken():
+        raise OSError("truncated PNG")
+
+    with pytest.raises(OSError):
+        cache.get_or_create("k", broken)
+    assert cache.get_or_create("k", lambda: "ok") == "ok"
+
+
+def test_load_image_shares_one_decoded_copy():
+    first = load_image("overlays/logo-shaded.png", (612, 137))
+    second = load_image("overlays/logo-shaded.png", [612, 137])  # YAML gives lists
+
+    assert first is second
+    assert first.size == (612, 137)
+    assert first.mode == "RGBA"
+    assert asset_cache.image_cache.stats()["misses"] == 1
+
+
+def test_load_image_keys_on_size():
+    full = load_image("overlays/logo-shaded.png", (612, 137))
+    small = load_image("overlays/logo-shaded.png", (408, 91))
+    assert full is not small
+    assert small.size == (408, 91)
+
+
+def test_load_image_reloads_a_replaced_file(tmp_path):
+    path = tmp_path / "logo.png"
+    Image.new("RGBA", (4, 4), (255, 0, 0, 255)).save(path)
+    assert load_image(str(path)).getpixel((0, 0)) == (255, 0, 0, 255)
+
+    Image.new("RGBA", (4, 4), (0, 0, 255, 255)).save(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert load_image(str(path)).getpixel((0, 0)) == (0, 0, 255, 255)
+
+
+def test_load_font_parses_each_face_and_size_once():
+    first = load_font("fonts/SourceSansVariable-Bold.ttf", 176)
+    again = load_font("fonts/SourceSansVariable-Bold.ttf", 176.0)
+    other = load_font("fonts/SourceSansVariable-Bold.ttf", 84)
+
+    assert first is again
+    assert other is not first
+    assert other.size == 84
+    assert asset_cache.font_cache.stats()["misses"] == 2
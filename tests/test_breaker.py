@@ -0,0 +1,106 @@
+"""Tests for leaving persistently failing sources out of the round."""
+
+from ftplib import error_perm, error_temp
+from time import time
+
+import requests
+
+import breaker
+from breaker import CircuitBreaker
+from HttpWebcam import HttpWebcam
+from Webcam import Webcam
+
+
+def tripped(now):
+    """A camera that has failed often enough at `now` to open its breaker."""
+    source = CircuitBreaker("tm")
+    for _ in range(breaker.FAILURES_TO_OPEN):
+        source.record_failure(now)
+    return source
+
+
+def test_a_few_failures_leave_the_breaker_closed():
+    now = time()
+    source = CircuitBreaker("tm")
+    for _ in range(breaker.FAILURES_TO_OPEN - 1):
+        assert source.record_failure(now)  # Reported as usual
+
+    assert not source.open
+    assert source.allows(now + 1)
+
+
+def test_enough_failures_in_a_row_open_it(caplog):
+    now = time()
+    source = tripped(now)
+
+    assert source.open
+    assert not source.allows(now + 1)
+    assert breaker.stats()["skipped"] == 1
+    assert caplog.text.count("not polling it") == 1
+
+
+def test_a_success_in_between_starts_the_count_again():
+    now = time()
+    source = CircuitBreaker("tm")
+    for _ in range(breaker.FAILURES_TO_OPEN - 1):
+        source.record_failure(now)
+    source.record_success()
+    source.record_failure(now)
+
+    assert not source.open
+
+
+def test_the_probe_waits_double_after_each_failed_probe():
+    now = time()
+    source = tripped(now)
+    wait = breaker.FIRST_PROBE
+    for _ in range(3):
+        assert not source.allows(now + wait - 1)
+        now += wait
+        assert source.allows(now)
+        assert not source.record_failure(now)  # Expected: not reported
+        wait *= 2
+
+    assert breaker.stats()["probes"] == 3
+
+
+def test_the_probe_wait_is_capped():
+    source = tripped(time())
+    for _ in range(20):
+        now = source.next_probe
+        source.record_failure(now)
+
+    assert source.next_probe - now == breaker.MAX_PROBE_INTERVAL
+
+
+def test_a_successful_probe_closes_it(caplog):
+    now = time()
+    source = tripped(now)
+    source.allows(source.next_probe)
+    source.record_success()
+
+    assert not source.open
+    assert CircuitBreaker("tm").allows(now)
+    assert "Source is back" in caplog.text
+
+
+def test_the_state_outlives_the_process():
+    now = time()
+    tripped(now)
+    assert not CircuitBreaker("tm").allows(now + 1)
+
+
+def test_a_foreign_record_leaves_it_closed(state_in_tmp):
+    (state_in_tmp / "gnpc-breaker-tm.json").write_text('{"failures": "many"}')
+    assert CircuitBreaker("tm").allows(time())
+
+
+def test_only_the_sources_own_faults_count():
+    ftp_cam = Webcam(name="tm", file_name_on_server="tm.jpg")
+    http_cam = HttpWebcam(name="nps", url="https://example.org/nps.jpg")
+
+    assert ftp_cam.is_source_error(FileNotFoundError("tm wasn't found"))
+    assert ftp_cam.is_source_error(error_perm("550 No such file"))
+    assert not ftp_cam.is_source_error(error_temp("421 Too many connections"))
+    assert not ftp_cam.is_source_error(ConnectionRefusedError())
+    assert http_cam.is_source_error(requests.Timeout("read timed out"))
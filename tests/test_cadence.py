@@ -0,0 +1,168 @@
+"""Tests for learning each camera's polling cadence from its source's changes."""
+
+from datetime import datetime, timezone
+
+import pytest
+
+import cadence
+from cadence import Cadence
+
+START = 1_780_000_000.0  # Any fixed epoch second
+
+
+def at(seconds):
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+def learned(every, changes=4, max_staleness=None):
+    """A camera whose source has changed every `every` seconds, just polled."""
+    schedule = Cadence("tm", max_staleness=max_staleness)
+    for number in range(changes):
+        changed = START + number * every
+        schedule.record_poll(changed + 5, at(changed), seconds=0.8)
+    return schedule
+
+
+def test_a_new_camera_is_polled():
+    assert Cadence("tm").due(START)
+
+
+def test_a_slow_source_is_not_polled_until_its_next_change():
+    schedule = learned(every=600, max_staleness=3600)
+    last_change = START + 3 * 600
+
+    assert schedule.interval() == 600
+    assert not schedule.due(last_change + 60)
+    assert not schedule.due(last_change + 600 - cadence.EARLY_POLL - 1)
+    assert schedule.due(last_change + 600 - cadence.EARLY_POLL)
+
+
+def test_a_late_change_is_polled_for_every_round():
+    schedule = learned(every=600)
+    overdue = START + 3 * 600 + 700
+
+    schedule.record_poll(overdue, at(START + 3 * 600), seconds=0.8)  # No change yet
+
+    assert schedule.due(overdue + 30)
+
+
+def test_no_camera_goes_unpolled_past_the_max_staleness():
+    schedule = learned(every=3 * 3600)  # The every-few-hours source
+    last_poll = schedule.last_poll
+
+    assert not schedule.due(last_poll + cadence.MAX_STALENESS - 1)
+    assert schedule.due(last_poll + cadence.MAX_STALENESS)
+
+
+def test_a_fast_source_is_polled_every_round():
+    schedule = learned(every=30)
+    assert schedule.due(schedule.last_poll + 1)
+
+
+def test_a_source_without_times_is_polled_every_round():
+    schedule = Cadence("tm")
+    for number in range(4):
+        schedule.record_poll(START + number * 30, None, seconds=0.8)
+
+    assert schedule.interval() is None
+    assert schedule.due(schedule.last_poll + 1)
+
+
+def test_the_history_outlives_the_process():
+    learned(every=600)
+    assert Cadence("tm").interval() == 600
+
+
+def test_one_outlier_gap_does_not_move_the_interval():
+    """An outage upstream looks like one long gap; the median ignores it."""
+    schedule = learned(every=600)
+    resumed = START + 3 * 600 + 4 * 3600
+    schedule.record_poll(resumed + 5, at(resumed), seconds=0.8)
+
+    assert schedule.interval() == 600
+
+
+def test_skipped_polls_and_their_time_are_counted():
+    schedule = learned(every=600)
+    for _ in range(3):
+        schedule.due(schedule.last_poll + 1)
+
+    counts = cadence.stats()
+    assert counts["polls"] == 3
+    assert counts["seconds"] == pytest.approx(2.4)
+
+
+def test_a_foreign_record_is_ignored(state_in_tmp):
+    (state_in_tmp / "gnpc-cadence-tm.json").write_text('{"changes": ["soon"]}')
+    assert Cadence("tm").due(START)
+
+
+def swapping_at(offset, period=30, changes=8):
+    """A source that swaps its frame `offset` seconds into every period.
+
+    Returns its Cadence, just polled, and the time of its last swap.
+    """
+    schedule = Cadence("tm")
+    base = START - START % period + offset
+    for number in range(changes):
+        changed = base + number * period
+        schedule.record_poll(changed + 5, at(changed), seconds=0.8)
+    return schedule, changed
+
+
+def test_a_steady_source_locks_to_its_swap_phase():
+    schedule, _ = swapping_at(offset=7)
+    assert schedule.phase() == pytest.approx(7)
+
+
+def test_the_fetch_lands_just_after_the_next_swap():
+    schedule, last_swap = swapping_at(offset=7)
+    now = last_swap + 25  # Next swap 5s away
+
+    assert schedule.fetch_delay(now) == pytest.approx(5 + cadence.SWAP_GUARD)
+    assert cadence.stats()["waited"] == pytest.approx(5 + cadence.SWAP_GUARD)
+
+
+def test_a_swap_beyond_the_callers_limit_is_not_waited_for():
+    schedule, last_swap = swapping_at(offset=7)
+    now = last_swap + 25  # Next swap 5s away, fetched 7s from now
+
+    assert schedule.fetch_delay(now, limit=6) == 0
+    assert cadence.stats()["waited"] == 0
+    assert schedule.fetch_delay(now, limit=8) == pytest.approx(7)
+
+
+def test_a_swap_too_far_off_is_not_waited_for():
+    schedule, last_swap = swapping_at(offset=7)
+    assert schedule.fetch_delay(last_swap + cadence.SWAP_GUARD + 1) == 0
+
+
+def test_phases_either_side_of_the_wrap_average_across_it():
+    """Swaps at 29s and 1s past the period are both close to 0s, not 15s."""
+    schedule = Cadence("tm")
+    for number, offset in enumerate([1, -1, -1, 1, 1, -1, -1, 1]):
+        changed = START - START % 30 + number * 30 + offset
+        schedule.record_poll(changed + 5, at(changed), seconds=0.8)
+
+    phase = schedule.phase()
+    assert min(phase, 30 - phase) < 0.5
+
+
+def test_a_source_without_a_steady_phase_is_fetched_at_once():
+    schedule = Cadence("tm")
+    changed = START
+    for gap in (30, 41, 23, 36, 27, 33, 19):
+        changed += gap
+        schedule.record_poll(changed + 5, at(changed), seconds=0.8)
+
+    assert schedule.phase() is None
+    assert schedule.fetch_delay(changed + 20) == 0
+
+
+def test_the_age_of_each_new_frame_is_reported():
+    schedule = Cadence("tm")
+    schedule.record_poll(START + 100, at(START), seconds=0.8)  # First sight
+    schedule.record_poll(START + 130, at(START + 30), seconds=0.8)  # 100s late
+    schedule.record_poll(START + 160, at(START + 30), seconds=0.8)  # No change
+
+    assert cadence.stats()["median_age"] == 100
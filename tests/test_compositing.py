@@ -0,0 +1,71 @@
+"""Pixel-equality tests for trimmed-layer compositing."""
+
+import pytest
+from PIL import Image, ImageChops
+
+import compositing
+from asset_cache import load_image
+from compositing import Layer
+
+
+def noisy_frame(size=(640, 480)):
+    return Image.effect_noise(size, 60).convert("RGB")
+
+
+def margined_layer():
+    """A half-transparent square inside a fully transparent margin."""
+    layer = Image.new("RGBA", (120, 80), (0, 0, 0, 0))
+    inner = Image.linear_gradient("L").resize((60, 40))
+    square = Image.merge("RGBA", (inner, inner.rotate(90), inner, inner))
+    layer.paste(square, (30, 20))
+    return layer
+
+
+def pillow_paste(frame, layer, place):
+    expected = frame.copy()
+    expected.paste(layer, place, layer)
+    return expected
+
+
+def same_pixels(a, b):
+    return ImageChops.difference(a, b).getbbox() is None
+
+
+def test_layers_are_trimmed_to_their_visible_pixels():
+    layer = Layer(margined_layer())
+    assert layer.offset == (30, 20)
+    assert layer.image.size == (60, 40)
+
+
+def test_a_fully_transparent_layer_draws_nothing():
+    frame = noisy_frame()
+    before = frame.copy()
+    compositing.paste(frame, Image.new("RGBA", (10, 10)), (5, 5))
+    assert same_pixels(frame, before)
+
+
+@pytest.mark.parametrize("place", [(100, 100), (580, 440), (-40, -30)])
+def test_a_trimmed_paste_matches_pillows_paste(place):
+    frame = noisy_frame()
+    layer = margined_layer()
+
+    expected = pillow_paste(frame, layer, place)
+    compositing.paste(frame, layer, place)
+
+    assert same_pixels(frame, expected)
+
+
+def test_the_real_logo_matches_including_its_overhang():
+    """The 1080p logo is 137px tall at y=944, one row past the frame."""
+    frame = noisy_frame((1920, 1080))
+    logo = load_image("overlays/logo-shaded.png", (612, 137))
+
+    expected = pillow_paste(frame, logo, (0, 944))
+    compositing.paste(frame, logo, (0, 944))
+
+    assert same_pixels(frame, expected)
+
+
+def test_prepared_layers_are_reused_for_shared_images():
+    logo = load_image("overlays/logo-shaded.png", (612, 137))
+    assert compositing.prepare(logo) is compositing.prepare(logo)
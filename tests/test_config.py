@@ -2,17 +2,22 @@
 
 import pytest
 
+import asset_cache
 from config import (
     AirQualityConfig,
+    EncodingConfig,
     LogoConfig,
     WebcamConfig,
+    create_allsky_video_from_config,
     create_overlay_from_config,
     create_webcam_from_config,
     load_config,
     parse_overlay,
+    preload_overlay_assets,
 )
 from HttpWebcam import HttpWebcam
 from Overlays import AirQuality, CompositeOverlay, Logo
+from paths import resolve_path
 from Webcam import Webcam
 
 
@@ -139,7 +144,7 @@ def test_nps_cameras_are_fetched_over_http(name, url, sensor_index):
     composite = webcam.overlays[0]
     assert isinstance(composite, CompositeOverlay)
     assert [type(o) for o in composite.overlays] == [Logo, AirQuality]
-    assert composite.get_overlayed_img(name)[1] == f"{name}.jpg"
+    assert composite.file_name(name) == f"{name}.jpg"
     assert composite.overlays[1].sensor_index == sensor_index
 
 
@@ -167,6 +172,102 @@ def test_unknown_overlay_type_is_rejected():
         parse_overlay({"type": "sparkles", "place": [0, 0], "size": [1, 1]})
 
 
+def test_an_encoding_block_reaches_the_overlay():
+    config = parse_overlay(
+        {
+            "type": "logo",
+            "place": [0, 944],
+            "size": [612, 137],
+            "encoding": {"quality": "keep", "optimize": True},
+        }
+    )
+
+    assert isinstance(config.encoding, EncodingConfig)
+    overlay = create_overlay_from_config(config)
+    assert overlay.encoding["quality"] == "keep"
+    assert overlay.encoding["optimize"] is True
+
+
+@pytest.mark.parametrize(
+    "encoding",
+    [
+        {"quality": 0},
+        {"quality": "best"},
+        # An unquoted 4:2:0 is YAML 1.1 sexagesimal for 14520
+        {"subsampling": 14520},
+        {"restart_marker_blocks": 4, "restart_marker_rows": 1},
+    ],
+)
+def test_bad_encoding_blocks_are_rejected(encoding):
+    with pytest.raises(ValueError):
+        EncodingConfig(**encoding)
+
+
+def test_a_feed_priority_overrides_its_camera():
+    webcam = create_webcam_from_config(
+        WebcamConfig(
+            name="lpp",
+            file_name_on_server="lpp.jpg",
+            priority="high",
+            logo_placements=[
+                [
+                    LogoConfig(
+                        place=(185, 944), size=(612, 137), subname="nps", priority="low"
+                    )
+                ],
+                [
+                    LogoConfig(place=(0, 944), size=(612, 137)),
+                    AirQualityConfig(sensor_index=192039),
+                ],
+            ],
+        )
+    )
+
+    assert webcam.priority_rank() == 0
+    assert webcam.priority_rank("lpp_nps.jpg") == 2
+    assert webcam.priority_rank("lpp.jpg") == 0  # The camera's
+
+
+@pytest.mark.parametrize(
+    "key,value",
+    [("subname", "gnpc"), ("priority", "low"), ("encoding", EncodingConfig())],
+)
+def test_feed_keys_on_a_later_overlay_of_a_group_are_rejected(key, value):
+    with pytest.raises(ValueError, match=key):
+        WebcamConfig(
+            name="lpp",
+            file_name_on_server="lpp.jpg",
+            logo_placements=[
+                [
+                    LogoConfig(place=(0, 944), size=(612, 137)),
+                    AirQualityConfig(sensor_index=192039, **{key: value}),
+                ],
+            ],
+        )
+
+
+def test_the_nps_feeds_upload_last():
+    webcams = [
+        create_webcam_from_config(w) for w in load_config("webcams.yaml").webcams
+    ]
+    for webcam in webcams:
+        for overlay in webcam.overlays:
+            file_name = overlay.file_name(webcam.name)
+            if overlay.subname == "nps":
+                assert webcam.priority_rank(file_name) == 2, file_name
+
+
+def test_an_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        WebcamConfig(
+            name="tm", file_name_on_server="tm.jpg", logo_placements=[], priority="top"
+        )
+    with pytest.raises(ValueError):
+        parse_overlay(
+            {"type": "logo", "place": [0, 0], "size": [1, 1], "priority": "urgent"}
+        )
+
+
 def test_st_mary_badge_does_not_buy_the_dead_temperature_field():
     """Sensor 83937 reports no temperature, so the field is not paid for."""
     config = load_config("webcams.yaml")
@@ -234,7 +335,7 @@ def test_a_composite_is_built_for_the_gnpc_feed_only():
     by_name = {w.name: w for w in config.webcams}
 
     webcam = create_webcam_from_config(by_name["mg"])
-    by_file = {o.get_overlayed_img("mg")[1]: o for o in webcam.overlays}
+    by_file = {o.file_name("mg"): o for o in webcam.overlays}
 
     assert isinstance(by_file["mg_nps.jpg"], Logo)
     composite = by_file["mg.jpg"]
@@ -252,7 +353,7 @@ def test_the_allsky_feed_carries_no_badge():
 
     webcam = create_webcam_from_config(by_name["dark_sky"])
     assert all(isinstance(o, Logo) for o in webcam.overlays)
-    assert {o.get_overlayed_img("dark_sky")[1] for o in webcam.overlays} == {
+    assert {o.file_name("dark_sky") for o in webcam.overlays} == {
         "dark_sky_nps.jpg",
         "dark_sky.jpg",
     }
@@ -279,3 +380,34 @@ def test_nps_logos_stay_inside_the_nps_index_crop():
     assert wide_nps_logos
     for logo in wide_nps_logos:
         assert logo.place[0] <= 189, f"logo at x={logo.place[0]} leaves a gap"
+
+
+def test_preloading_warms_the_caches_for_the_overlays_that_render():
+    """Fonts and logos are parsed on the main thread, not in the camera threads."""
+    config = load_config("webcams.yaml")
+    cams = [create_webcam_from_config(w) for w in config.webcams] + [
+        create_allsky_video_from_config(v) for v in config.allsky_videos
+    ]
+    asset_cache.font_cache.clear()
+    asset_cache.image_cache.clear()
+
+    preload_overlay_assets(cams)
+
+    # The badge's three sizes of its face, and the dark_sky cover date's font
+    fonts = {key[:2] for key in asset_cache.font_cache._entries}
+    assert (resolve_path("fonts/SourceSansVariable-Bold.ttf"), 44 * 4) in fonts
+    assert (resolve_path("fonts/OpenSans-Bold.ttf"), 16) in fonts
+    images = {key[:2] for key in asset_cache.image_cache._entries}
+    assert (resolve_path("overlays/logo-shaded.png"), (612, 137)) in images
+    assert (resolve_path("overlays/logo-shaded.png"), (408, 91)) in images
+
+
+def test_a_missing_video_logo_is_only_logged_at_preload(monkeypatch, caplog):
+    video = create_allsky_video_from_config(
+        load_config("webcams.yaml").allsky_videos[0]
+    )
+    monkeypatch.setattr("AllskyVideo.LOGO_PATH", "overlays/no-such-logo.png")
+
+    preload_overlay_assets([video])
+
+    assert "Could not preload overlay assets" in caplog.text
@@ -0,0 +1,112 @@
+"""Tests for the resident daemon's round schedule and shutdown."""
+
+import os
+import signal
+import threading
+
+import pytest
+
+import daemon
+
+
+class FakeClock:
+    """Wall clock that moves only when a round runs or the loop waits."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeStop:
+    """A stop event whose waits advance the fake clock instead of sleeping."""
+
+    def __init__(self, clock, after_rounds):
+        self.clock = clock
+        self.after_rounds = after_rounds
+        self.waits = []
+
+    def is_set(self):
+        return len(self.waits) >= self.after_rounds
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        self.clock.now += timeout
+        return self.is_set()
+
+
+@pytest.mark.parametrize(
+    "now, period, start",
+    [(0, 30, 30), (29.9, 30, 30), (30, 30, 60), (1000000015.5, 10, 1000000020)],
+)
+def test_rounds_start_on_period_boundaries(now, period, start):
+    assert daemon.next_start(now, period) == start
+
+
+def test_rounds_keep_to_the_wall_clock():
+    clock = FakeClock(100.0)
+    starts = []
+
+    def round_fn():
+        starts.append(clock.now)
+        clock.now += 7  # Each round takes a while
+
+    daemon.run_forever(round_fn, 30, FakeStop(clock, after_rounds=3), clock=clock)
+
+    assert starts == [100.0, 120.0, 150.0]
+
+
+def test_an_overrunning_round_skips_to_the_next_boundary(caplog):
+    clock = FakeClock(0.0)
+    starts = []
+
+    def round_fn():
+        starts.append(clock.now)
+        clock.now += 45 if len(starts) == 1 else 1
+
+    daemon.run_forever(round_fn, 30, FakeStop(clock, after_rounds=2), clock=clock)
+
+    assert starts == [0.0, 60.0]  # No catch-up round at 45
+    assert "skipping 1 round(s)" in caplog.text
+
+
+def test_a_failed_round_does_not_stop_the_daemon(caplog):
+    clock = FakeClock(0.0)
+    rounds, cleanups = [], []
+
+    def round_fn():
+        rounds.append(clock.now)
+        if len(rounds) == 1:
+            raise RuntimeError("config went missing")
+
+    daemon.run_forever(
+        round_fn,
+        30,
+        FakeStop(clock, after_rounds=2),
+        between_rounds=lambda: cleanups.append(1),
+        clock=clock,
+    )
+
+    assert len(rounds) == 2
+    assert cleanups == [1, 1]  # Connections are closed after a failure too
+    assert "Round failed" in caplog.text
+
+
+def test_sigterm_stops_the_loop_after_the_round_in_progress():
+    stop = threading.Event()
+    previous = signal.getsignal(signal.SIGTERM)
+    finished = []
+    try:
+        daemon.stop_on_signals(stop, signals=(signal.SIGTERM,))
+
+        def round_fn():
+            os.kill(os.getpid(), signal.SIGTERM)  # Arrives mid-round
+            finished.append(1)
+
+        daemon.run_forever(round_fn, 3600, stop)
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+    assert finished == [1]
+    assert stop.is_set()
@@ -0,0 +1,142 @@
+"""Tests for the round deadline every retry loop consults (no network)."""
+
+import io
+from ftplib import error_temp
+
+import pytest
+import requests
+
+import deadline
+import HttpWebcam
+import Webcam
+from ftp_pool import FTPPool
+from Webcam import RETRYABLE_FTP_ERRORS
+from Webcam import Webcam as WebcamClass
+
+
+def test_without_a_deadline_every_wait_is_allowed():
+    deadline.check("download", wait=3600)
+    assert deadline.remaining() is None
+
+
+def test_a_wait_that_reaches_the_deadline_gives_up():
+    deadline.new_round(5)
+
+    deadline.check("download", wait=1)
+    with pytest.raises(deadline.DeadlineExceeded):
+        deadline.check("download", wait=10)
+
+
+def test_giving_up_is_not_retried_as_a_network_fault():
+    assert not issubclass(deadline.DeadlineExceeded, RETRYABLE_FTP_ERRORS)
+
+
+def test_rounds_that_hit_the_deadline_are_counted():
+    before = deadline.stats()
+    deadline.new_round(0)
+    for _ in range(2):
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.check("upload")
+    deadline.new_round(30)
+    deadline.check("upload")
+
+    after = deadline.stats()
+    assert after["hits"] == 0  # This round's
+    assert after["rounds"] - before["rounds"] == 2
+    assert after["rounds_hit"] - before["rounds_hit"] == 1
+
+
+class RefusingFTP:
+    """Every RETR and STOR is refused, as by a server that is out of slots."""
+
+    def __init__(self):
+        self.attempts = 0
+
+    def retrbinary(self, cmd, callback):
+        self.attempts += 1
+        raise error_temp("421 Too many connections from this IP")
+
+    storbinary = retrbinary
+
+    def sendcmd(self, cmd):
+        return "213 20240101120000"
+
+    def mlsd(self, facts=None):
+        return [("hlt.jpg", {"type": "file", "size": "10", "modify": "20240101120000"})]
+
+
+@pytest.fixture
+def refusing(monkeypatch):
+    ftp = RefusingFTP()
+    monkeypatch.setattr(Webcam, "connect_ftp", lambda *a, **k: ftp)
+    monkeypatch.setattr(Webcam, "sleep", lambda delay: pytest.fail("slept"))
+    return ftp
+
+
+def test_a_download_retry_gives_up_instead_of_sleeping_past_the_deadline(refusing):
+    deadline.new_round(1)
+    cam = WebcamClass(name="hlt", file_name_on_server="hlt.jpg")
+
+    with pytest.raises(deadline.DeadlineExceeded):
+        cam._download_image(retry_delay=2)
+
+    assert refusing.attempts == 1
+
+
+def test_an_upload_retry_gives_up_instead_of_sleeping_past_the_deadline(refusing):
+    deadline.new_round(1)
+    cam = WebcamClass(name="hlt", file_name_on_server="hlt.jpg")
+    cam.begin_upload()
+
+    with pytest.raises(deadline.DeadlineExceeded):
+        cam._upload_file(io.BytesIO(b"jpeg"), "hlt.jpg", max_retries=3, retry_delay=2)
+
+    assert refusing.attempts == 1
+
+
+def test_no_connection_slot_before_the_deadline_gives_up(monkeypatch):
+    """Out of round, not a server fault: not reported, not retried."""
+    budget = Webcam.connection_budget
+    monkeypatch.setattr(Webcam, "_open_ftp", lambda *a: pytest.fail("connected"))
+    for _ in range(budget.limit):
+        budget.acquire()
+    try:
+        deadline.new_round(0.05)
+        with pytest.raises(deadline.DeadlineExceeded):
+            Webcam._connect_download()
+    finally:
+        for _ in range(budget.limit):
+            budget.release()
+
+    assert deadline.stats()["hits"] == 1
+
+
+def test_a_wait_for_a_pooled_connection_gives_up_at_the_deadline():
+    pool = FTPPool(object, lambda ftp: None, max_connections=1)
+    deadline.new_round(0.05)
+
+    with pool.connection():
+        with pytest.raises(deadline.DeadlineExceeded):
+            with pool.connection():
+                pytest.fail("got a second connection")
+
+    assert deadline.stats()["hits"] == 1
+
+
+def test_an_http_fetch_waits_no_longer_than_the_round_has_left(monkeypatch):
+    timeouts = []
+
+    def stalled(url, headers=None, timeout=None):
+        timeouts.append(timeout)
+        raise requests.Timeout("read timed out")
+
+    monkeypatch.setattr(HttpWebcam.requests, "get", stalled)
+    monkeypatch.setattr(HttpWebcam, "sleep", lambda delay: pytest.fail("slept"))
+    deadline.new_round(1)
+    cam = HttpWebcam.HttpWebcam(name="tm", url="https://example.org/tm.jpg")
+
+    with pytest.raises(deadline.DeadlineExceeded):
+        cam._download_image(retry_delay=0)
+
+    assert len(timeouts) == 1
+    assert timeouts[0] <= 1 < cam.timeout
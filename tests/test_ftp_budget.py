@@ -0,0 +1,207 @@
+"""Tests for the process-wide FTP connection budget."""
+
+import gc
+import threading
+import time
+
+import pytest
+
+import Webcam
+from ftp_budget import ConnectionBudget
+from ftp_pool import FTPPool
+
+
+class Session:
+    """Stands in for an FTP session; only needs to be weak-referenceable."""
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:  # pragma: no cover - a hang, not a result
+            raise AssertionError("timed out")
+        time.sleep(0.001)
+
+
+def test_no_more_than_the_limit_are_open_at_once():
+    budget = ConnectionBudget(limit=2)
+    in_use, peak = [0], [0]
+    count_lock = threading.Lock()
+
+    def connect():
+        budget.acquire()
+        with count_lock:
+            in_use[0] += 1
+            peak[0] = max(peak[0], in_use[0])
+        time.sleep(0.01)
+        with count_lock:
+            in_use[0] -= 1
+        budget.release()
+
+    threads = [threading.Thread(target=connect) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+    assert budget.usage() == {"open": 0, "waiting": 0, "peak": 2, "limit": 2}
+
+
+def test_each_round_reports_its_own_peak():
+    budget = ConnectionBudget(limit=3)
+    for _ in range(3):
+        budget.acquire()
+    for _ in range(2):
+        budget.release()
+
+    budget.new_round()  # One session kept open across the rounds
+
+    assert budget.usage()["peak"] == 1
+    budget.acquire()
+    assert budget.usage()["peak"] == 2
+
+
+def test_waiters_are_served_in_arrival_order():
+    budget = ConnectionBudget(limit=1)
+    budget.acquire()
+    served = []
+
+    def wait_in_line(name):
+        budget.acquire()
+        served.append(name)
+        budget.release()
+
+    threads = []
+    for number, name in enumerate("abc", start=1):
+        thread = threading.Thread(target=wait_in_line, args=(name,))
+        thread.start()
+        wait_until(lambda: budget.waiting == number)
+        threads.append(thread)
+    budget.release()
+    for thread in threads:
+        thread.join()
+
+    assert served == ["a", "b", "c"]
+
+
+def test_a_waiter_gives_up_after_its_timeout():
+    budget = ConnectionBudget(limit=1)
+    budget.acquire()
+
+    with pytest.raises(ConnectionError, match="1 of 1 open"):
+        budget.acquire(timeout=0.01)
+
+    assert budget.usage()["waiting"] == 0
+    budget.release()
+    budget.acquire(timeout=0.01)  # The abandoned ticket doesn't block the line
+
+
+def test_closing_a_session_returns_its_slot():
+    budget = ConnectionBudget(limit=1)
+    session = Session()
+    budget.acquire()
+    budget.hold(session)
+
+    budget.detach(session)
+    budget.detach(session)  # Closing twice gives back one slot, not two
+    budget.detach(Session())  # Never held one
+
+    assert budget.usage()["open"] == 0
+
+
+def test_a_dropped_session_returns_its_slot():
+    """A session lost without close_ftp hangs up when collected; so does its slot."""
+    budget = ConnectionBudget(limit=1)
+    budget.acquire()
+    budget.hold(Session())
+    gc.collect()
+
+    assert budget.usage()["open"] == 0
+
+
+def make_pool(budget, closed):
+    def connect():
+        budget.acquire()
+        session = Session()
+        budget.hold(session)
+        return session
+
+    def close(session):
+        closed.append(session)
+        budget.detach(session)
+
+    return FTPPool(connect, close, max_connections=2, budget=budget)
+
+
+def test_an_idle_pooled_session_is_closed_for_a_waiter():
+    budget = ConnectionBudget(limit=1)
+    closed = []
+    pool = make_pool(budget, closed)
+    with pool.connection() as idle:
+        pass
+
+    budget.acquire(timeout=1)  # Would time out if the pool kept its session
+
+    assert closed == [idle]
+    assert pool.open_connections == 0
+
+
+def test_a_returned_session_is_closed_while_someone_waits():
+    budget = ConnectionBudget(limit=1)
+    closed = []
+    pool = make_pool(budget, closed)
+    got_slot = threading.Event()
+
+    def waiter():
+        budget.acquire()
+        got_slot.set()
+
+    with pool.connection() as session:
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        wait_until(lambda: budget.waiting == 1)
+    thread.join(timeout=5)
+
+    assert got_slot.is_set()
+    assert closed == [session]
+
+
+class PlainFTP:
+    def __init__(self, server, timeout=None):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def quit(self):
+        pass
+
+
+def test_connect_ftp_holds_a_slot_until_close_ftp(monkeypatch):
+    budget = ConnectionBudget(limit=4)
+    monkeypatch.setattr(Webcam, "connection_budget", budget)
+    monkeypatch.setattr(Webcam, "_ftps_supported", False)
+    monkeypatch.setattr(Webcam, "FTP", PlainFTP)
+
+    ftp = Webcam.connect_ftp("host", "user", "pwd")
+    assert budget.usage()["open"] == 1
+
+    Webcam.close_ftp(ftp)
+    assert budget.usage()["open"] == 0
+
+
+def test_a_failed_connect_returns_its_slot(monkeypatch):
+    class RefusingFTP(PlainFTP):
+        def login(self, user, password):
+            raise EOFError
+
+    budget = ConnectionBudget(limit=1)
+    monkeypatch.setattr(Webcam, "connection_budget", budget)
+    monkeypatch.setattr(Webcam, "_ftps_supported", False)
+    monkeypatch.setattr(Webcam, "FTP", RefusingFTP)
+
+    with pytest.raises(EOFError):
+        Webcam.connect_ftp("host", "user", "pwd")
+
+    assert budget.usage()["open"] == 0
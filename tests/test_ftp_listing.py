@@ -0,0 +1,110 @@
+"""Tests for the per-round FTP directory snapshot."""
+
+from ftplib import error_perm
+
+import pytest
+
+import ftp_listing
+from ftp_listing import DirectoryEntry, list_directory, parse_list, snapshot
+
+LIST_LINES = [
+    "total 2048",
+    "-rw-r--r--   1 gnpc  gnpc    412873 Aug 10 19:17 lpp.jpg",
+    "-rw-r--r--   1 gnpc  gnpc    398112 Aug 10 19:17 dark sky.jpg",
+    "drwxr-xr-x   2 gnpc  gnpc      4096 Jan  3  2025 archive",
+]
+
+
+class ScriptedFTP:
+    """A server that knows only the listing commands it is given."""
+
+    def __init__(self, mlsd=None, list_lines=None, names=None):
+        self._mlsd = mlsd
+        self._list_lines = list_lines
+        self._names = names
+
+    def mlsd(self, facts=None):
+        if self._mlsd is None:
+            raise error_perm("500 MLSD not understood")
+        return self._mlsd
+
+    def retrlines(self, cmd, callback):
+        if self._list_lines is None:
+            raise error_perm("500 LIST not understood")
+        for line in self._list_lines:
+            callback(line)
+
+    def nlst(self):
+        if self._names is None:
+            raise error_perm("550 No files found")
+        return self._names
+
+
+def test_mlsd_gives_name_size_and_time():
+    ftp = ScriptedFTP(
+        mlsd=[
+            (".", {"type": "cdir"}),
+            ("archive", {"type": "dir"}),
+            ("lpp.jpg", {"type": "file", "size": "412873", "modify": "20260810191709"}),
+            ("mg.jpg", {"type": "file", "modify": "20260810191712.250"}),
+        ]
+    )
+
+    assert list_directory(ftp) == {
+        "lpp.jpg": DirectoryEntry("lpp.jpg", 412873, "20260810191709"),
+        "mg.jpg": DirectoryEntry("mg.jpg", None, "20260810191712"),
+    }
+
+
+def test_list_is_parsed_without_mlsd():
+    listing = list_directory(ScriptedFTP(list_lines=LIST_LINES))
+
+    assert listing == {
+        "lpp.jpg": DirectoryEntry("lpp.jpg", 412873, None),
+        "dark sky.jpg": DirectoryEntry("dark sky.jpg", 398112, None),
+    }
+
+
+def test_an_unfamiliar_list_format_falls_back_to_names():
+    ftp = ScriptedFTP(
+        list_lines=["08-10-26  07:17PM               412873 lpp.jpg"],
+        names=["lpp.jpg"],
+    )
+
+    assert list_directory(ftp) == {"lpp.jpg": DirectoryEntry("lpp.jpg", None, None)}
+
+
+def test_no_listing_at_all_is_none():
+    assert list_directory(ScriptedFTP()) is None
+
+
+def test_parse_list_rejects_what_it_cannot_read():
+    assert parse_list(["lpp.jpg"]) is None
+
+
+def test_one_fetch_per_account_per_round():
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return {}
+
+    snapshot(("ftp.example.org", "cams"), fetch)
+    snapshot(("ftp.example.org", "cams"), fetch)
+    snapshot(("ftp.example.org", "web"), fetch)
+    assert len(fetches) == 2
+    assert ftp_listing.stats() == {"fetched": 2, "served": 1}
+
+    ftp_listing.new_round()
+    snapshot(("ftp.example.org", "cams"), fetch)
+    assert len(fetches) == 3
+
+
+def test_a_failed_fetch_is_not_cached():
+    def broken():
+        raise EOFError("server hung up")
+
+    with pytest.raises(EOFError):
+        snapshot(("ftp.example.org", "cams"), broken)
+
+    assert snapshot(("ftp.example.org", "cams"), lambda: {"ok": 1}) == {"ok": 1}
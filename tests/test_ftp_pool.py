@@ -0,0 +1,222 @@
+"""Tests for the pools of FTP connections shared by the camera threads."""
+
+import io
+import threading
+from ftplib import error_perm
+
+import pytest
+
+import Webcam
+from ftp_pool import FTPPool
+from Webcam import Webcam as WebcamClass
+
+
+class FakeFTP:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+
+
+class Server:
+    """Hands out numbered FakeFTPs and records which were closed."""
+
+    def __init__(self):
+        self.opened = []
+        self.closed = []
+
+    def connect(self):
+        ftp = FakeFTP(len(self.opened))
+        self.opened.append(ftp)
+        return ftp
+
+    def close(self, ftp):
+        ftp.closed = True
+        self.closed.append(ftp)
+
+
+@pytest.fixture
+def server():
+    return Server()
+
+
+def test_a_returned_connection_is_reused(server):
+    pool = FTPPool(server.connect, server.close, max_connections=2)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert len(server.opened) == 1
+
+
+def test_no_more_than_max_connections_are_opened(server):
+    pool = FTPPool(server.connect, server.close, max_connections=2)
+    in_use, peak = [0], [0]
+    count_lock = threading.Lock()
+
+    def borrow():
+        with pool.connection():
+            with count_lock:
+                in_use[0] += 1
+                peak[0] = max(peak[0], in_use[0])
+            threading.Event().wait(0.01)
+            with count_lock:
+                in_use[0] -= 1
+
+    threads = [threading.Thread(target=borrow) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+    assert len(server.opened) == 2
+    assert pool.open_connections == 2
+
+
+def test_a_network_error_evicts_the_connection(server):
+    pool = FTPPool(server.connect, server.close, max_connections=1)
+
+    with pytest.raises(EOFError):
+        with pool.connection():
+            raise EOFError
+
+    assert server.closed == server.opened
+    assert pool.open_connections == 0
+    with pool.connection() as fresh:
+        assert fresh is server.opened[1]
+
+
+def test_a_permanent_reply_keeps_the_connection(server):
+    """A 550 is about the file, not the session."""
+    pool = FTPPool(server.connect, server.close, max_connections=1)
+
+    with pytest.raises(error_perm):
+        with pool.connection():
+            raise error_perm("550 No such file")
+
+    assert server.closed == []
+    with pool.connection() as ftp:
+        assert ftp is server.opened[0]
+
+
+def test_a_failed_connect_gives_its_slot_back(server):
+    attempts = []
+
+    def refuse():
+        attempts.append(1)
+        raise ConnectionError("421 Too many connections")
+
+    pool = FTPPool(refuse, server.close, max_connections=1)
+
+    for _ in range(2):  # The second would wait forever if the slot were lost
+        with pytest.raises(ConnectionError):
+            with pool.connection():
+                pass
+
+    assert len(attempts) == 2
+    assert pool.open_connections == 0
+
+
+def test_close_all_quits_every_idle_connection(server):
+    pool = FTPPool(server.connect, server.close, max_connections=2)
+    with pool.connection(), pool.connection():
+        pass
+
+    pool.close_all()
+
+    assert len(server.closed) == 2
+    assert pool.open_connections == 0
+
+
+class MeetingFTP:
+    """RETR blocks until the other camera's RETR is in flight as well."""
+
+    def __init__(self, barrier):
+        self.barrier = barrier
+
+    def mlsd(self, facts=None):
+        return []
+
+    def sendcmd(self, cmd):
+        return "213 20260810191709"
+
+    def retrbinary(self, cmd, callback):
+        self.barrier.wait(timeout=5)
+        callback(b"jpeg-bytes")
+
+    def quit(self):
+        pass
+
+
+def test_cameras_download_side_by_side(monkeypatch):
+    barrier = threading.Barrier(2)
+    monkeypatch.setattr(
+        WebcamClass,
+        "_download_pool",
+        FTPPool(Webcam._connect_download, Webcam.close_ftp, max_connections=2),
+    )
+    monkeypatch.setattr(Webcam, "connect_ftp", lambda *a, **k: MeetingFTP(barrier))
+    cams = [
+        WebcamClass(name=name, file_name_on_server=f"{name}.jpg")
+        for name in ("lpp", "hlt")
+    ]
+
+    threads = [
+        threading.Thread(target=cam._download_image, kwargs={"max_retries": 1})
+        for cam in cams
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not barrier.broken
+    assert [cam.file_buffer.getvalue() for cam in cams] == [b"jpeg-bytes"] * 2
+
+
+class UploadFTP:
+    """Hangs up on the first STOR the server sees, then stores."""
+
+    def __init__(self, stored, hangups):
+        self.stored = stored
+        self.hangups = hangups
+
+    def storbinary(self, cmd, fp):
+        if self.hangups:
+            self.hangups.pop()
+            raise EOFError("server hung up")
+        self.stored.append(cmd)
+
+    def rename(self, src, dst):
+        pass
+
+    def quit(self):
+        pass
+
+
+def test_an_upload_retry_sleeps_without_holding_a_connection(monkeypatch):
+    """Another camera uploads while the first waits out its retry delay."""
+    stored, hangups = [], [1]
+    monkeypatch.setattr(
+        WebcamClass,
+        "_upload_pool",
+        FTPPool(Webcam._connect_upload, Webcam.close_ftp, max_connections=1),
+    )
+    monkeypatch.setattr(
+        Webcam, "connect_ftp", lambda *a, **k: UploadFTP(stored, hangups)
+    )
+    retrying = WebcamClass(name="lpp", file_name_on_server="lpp.jpg")
+    retrying.outputs = [("lpp.jpg", io.BytesIO(b"lpp"))]
+    other = WebcamClass(name="hlt", file_name_on_server="hlt.jpg")
+    other.outputs = [("hlt.jpg", io.BytesIO(b"hlt"))]
+
+    # With a pool of one, this would wait forever on a connection held
+    # through the sleep.
+    monkeypatch.setattr(Webcam, "sleep", lambda delay: other.upload_image())
+    retrying.upload_image()
+
+    assert [cmd.split(".")[0] for cmd in stored] == ["STOR hlt", "STOR lpp"]
+    assert retrying.upload == ["https://glacier.org/webcam/lpp.jpg"]
@@ -0,0 +1,102 @@
+"""Tests for resuming TLS sessions on FTPS data channels and reconnects."""
+
+import ftplib
+
+import pytest
+
+import ftp_tls
+from ftp_tls import ResumingFTP_TLS
+
+
+class FakeTLSSocket:
+    def __init__(self, session):
+        # A real socket reports whether the server accepted the offered session
+        self.session_reused = session is not None
+        self.session = session or object()
+
+    def makefile(self, mode="r", encoding=None):
+        return None
+
+
+class FakeContext:
+    """Records the session offered with each handshake."""
+
+    def __init__(self):
+        self.offered = []
+
+    def wrap_socket(self, sock, server_hostname=None, session=None):
+        self.offered.append(session)
+        return FakeTLSSocket(session)
+
+
+@pytest.fixture
+def context(monkeypatch):
+    context = FakeContext()
+    monkeypatch.setattr(ftp_tls, "_context", context)
+    monkeypatch.setattr(ftp_tls, "_sessions", {})
+    monkeypatch.setattr(ftplib.FTP, "voidcmd", lambda self, cmd: "234 AUTH TLS OK")
+    monkeypatch.setattr(ftplib.FTP, "login", lambda self, *a, **k: "230 Logged in")
+    monkeypatch.setattr(
+        ftplib.FTP, "ntransfercmd", lambda self, cmd, rest=None: (object(), None)
+    )
+    ftp_tls.new_round()
+    return context
+
+
+def logged_in(host="ftp.example.org"):
+    """A connection that has been through AUTH TLS and USER/PASS."""
+    ftp = ResumingFTP_TLS()
+    ftp.host = host
+    ftp.sock = object()  # The plain control socket before AUTH
+    ftp.auth()
+    ftp.login("user", "pwd", secure=False)  # AUTH already done above
+    return ftp
+
+
+def test_data_connections_resume_the_control_session(context):
+    ftp = logged_in()
+    ftp._prot_p = True  # The state prot_p() leaves behind
+
+    for _ in range(3):
+        ftp.ntransfercmd("RETR lpp.jpg")
+
+    assert context.offered[1:] == [ftp.sock.session] * 3
+    assert ftp_tls.stats() == {"full": 1, "resumed": 3}
+
+
+def test_a_clear_data_channel_is_not_wrapped(context):
+    ftp = logged_in()
+
+    ftp.ntransfercmd("RETR lpp.jpg")
+
+    assert len(context.offered) == 1  # The control handshake only
+
+
+def test_a_reconnect_resumes_the_last_session_with_that_server(context):
+    first = logged_in()
+    logged_in()
+    logged_in(host="other.example.org")
+
+    assert context.offered == [None, first.sock.session, None]
+    assert ftp_tls.stats() == {"full": 2, "resumed": 1}
+
+
+def test_a_connection_with_its_own_context_starts_fresh(context):
+    logged_in()
+    own = FakeContext()
+    ftp = ResumingFTP_TLS(context=own)
+    ftp.host = "ftp.example.org"
+    ftp.sock = object()
+
+    ftp.auth()
+
+    assert own.offered == [None]
+
+
+def test_each_round_counts_afresh(context):
+    logged_in()
+
+    ftp_tls.new_round()
+    logged_in()
+
+    assert ftp_tls.stats() == {"full": 0, "resumed": 1}
@@ -1,5 +1,6 @@
 """Tests for the HTTP-sourced webcam (no network)."""
 
+import io
 import json
 
 import pytest
@@ -110,16 +111,26 @@ def test_unparseable_last_modified_is_survivable(monkeypatch):
 def test_upload_connection_is_shared_with_the_ftp_cameras(monkeypatch):
     """The pool lives on Webcam, so _close_connections() releases it.
 
-    Assigning through `cls` instead would give the subclass its own attribute:
-    an extra session against a server that counts them, held open until it
-    times out because main.py only ever closes Webcam's.
+    A pool on the subclass would mean extra sessions against a server that
+    counts them, held open until they time out because main.py only ever
+    closes Webcam's.
     """
-    monkeypatch.setattr(Webcam, "_upload_ftp", None)
-    monkeypatch.setattr("Webcam.connect_ftp", lambda *a, **k: "connection")
 
-    assert HttpWebcam._get_upload_connection() == "connection"
-    assert Webcam._upload_ftp == "connection"
-    assert "_upload_ftp" not in HttpWebcam.__dict__
+    class UploadFTP:
+        def storbinary(self, cmd, fp):
+            pass
+
+        def rename(self, src, dst):
+            pass
+
+    monkeypatch.setattr("Webcam.connect_ftp", lambda *a, **k: UploadFTP())
+    cam = HttpWebcam(name="tm", url="https://example.org/TwoMedicine.jpg")
+    cam.outputs = [("tm.jpg", io.BytesIO(b"jpeg-bytes"))]
+
+    cam.upload_image(retry_delay=0)
+
+    assert Webcam._upload_pool.open_connections == 1
+    assert "_upload_pool" not in HttpWebcam.__dict__
 
 
 URL = "https://example.org/TwoMedicine.jpg"
@@ -0,0 +1,49 @@
+"""Tests for reading JPEG dimensions from the frame header."""
+
+import io
+
+import pytest
+from PIL import Image
+
+from jpeg_header import jpeg_size
+
+
+def encode(size=(1920, 1080), **options):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (10, 60, 40)).save(buffer, format="JPEG", **options)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {},
+        {"progressive": True},
+        {"optimize": True, "subsampling": "4:4:4"},
+        # An APP1 segment ahead of the frame header, as the cameras send
+        {"exif": b"Exif\x00\x00" + b"\x00" * 4000},
+        {"restart_marker_rows": 1},
+    ],
+)
+def test_size_matches_pillows(options):
+    data = encode(size=(1600, 1200), **options)
+    with Image.open(io.BytesIO(data)) as image:
+        assert jpeg_size(data) == image.size == (1600, 1200)
+
+
+def test_reads_from_a_buffer_without_copying():
+    buffer = io.BytesIO(encode())
+    assert jpeg_size(buffer.getbuffer()) == (1920, 1080)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"GIF89a",
+        encode()[:20],  # Cut off before the frame header
+    ],
+)
+def test_non_jpegs_and_truncated_headers_raise(data):
+    with pytest.raises(ValueError):
+        jpeg_size(data)
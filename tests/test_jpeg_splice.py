@@ -0,0 +1,152 @@
+"""Tests for splicing overlays into the source JPEG (jpegtran optional)."""
+
+import io
+import shutil
+import subprocess
+
+import pytest
+from PIL import Image, ImageChops
+
+import jpeg_splice
+from jpeg_splice import align_to_mcu, mcu_size, splice_jpeg
+from Overlays import Logo
+
+
+def make_jpeg(size=(640, 480), subsampling=2, progressive=False):
+    noisy = Image.effect_noise(size, 40).convert("RGB")
+    buffer = io.BytesIO()
+    noisy.save(
+        buffer,
+        format="JPEG",
+        quality=85,
+        subsampling=subsampling,
+        progressive=progressive,
+    )
+    return buffer.getvalue()
+
+
+def decode(jpeg):
+    with Image.open(io.BytesIO(jpeg)) as image:
+        return image.convert("RGB")
+
+
+@pytest.fixture
+def jpegtran_on_path(monkeypatch):
+    """Pretend jpegtran is installed; the test supplies subprocess.run."""
+    monkeypatch.setattr(jpeg_splice.shutil, "which", lambda name: f"/usr/bin/{name}")
+
+
+def test_mcu_size_follows_the_chroma_subsampling():
+    with Image.open(io.BytesIO(make_jpeg(subsampling=2))) as image:
+        assert mcu_size(image) == (16, 16)  # 4:2:0
+    with Image.open(io.BytesIO(make_jpeg(subsampling=0))) as image:
+        assert mcu_size(image) == (8, 8)  # 4:4:4
+
+
+def test_align_to_mcu_grows_outward_and_stops_at_the_frame():
+    frame = (1920, 1080)
+    # The standard 1080p logo; 1080 is not a whole number of 16px MCU rows
+    assert align_to_mcu((0, 944, 612, 1080), (16, 16), frame) == (0, 944, 624, 1080)
+    assert align_to_mcu((185, 950, 797, 1079), (16, 16), frame) == (176, 944, 800, 1080)
+
+
+def test_progressive_sources_fall_back(jpegtran_on_path):
+    source = make_jpeg(progressive=True)
+    before = decode(source)
+    after = before.copy()
+    after.paste((255, 0, 0), (0, 0, 32, 32))
+
+    assert splice_jpeg(source, before, after) is None
+
+
+def test_without_jpegtran_the_splice_falls_back(monkeypatch):
+    monkeypatch.setattr(jpeg_splice.shutil, "which", lambda name: None)
+    source = make_jpeg()
+    before = decode(source)
+
+    assert splice_jpeg(source, before, before.copy()) is None
+
+
+def test_an_untouched_frame_is_published_as_the_source_bytes(jpegtran_on_path):
+    source = make_jpeg()
+    before = decode(source)
+
+    assert splice_jpeg(source, before, before.copy()) == source
+
+
+def test_only_the_mcu_aligned_change_is_handed_to_jpegtran(
+    monkeypatch, jpegtran_on_path
+):
+    calls = []
+
+    def fake_run(args, input=None, **kwargs):
+        with open(args[-1], "rb") as f:
+            strip = Image.open(io.BytesIO(f.read()))
+            strip.load()
+        calls.append((args, strip, input))
+        return subprocess.CompletedProcess(args, 0, stdout=b"spliced", stderr=b"")
+
+    monkeypatch.setattr(jpeg_splice.subprocess, "run", fake_run)
+    source = make_jpeg()
+    before = decode(source)
+    after = before.copy()
+    after.paste((255, 0, 0), (20, 300, 100, 330))
+
+    assert splice_jpeg(source, before, after) == b"spliced"
+
+    args, strip, piped = calls[0]
+    assert args[args.index("-drop") + 1] == "+16+288"
+    assert strip.size == (96, 48)  # 16..112 by 288..336
+    assert piped == source
+    with Image.open(io.BytesIO(source)) as original:
+        # Same tables, so jpegtran has nothing to requantize
+        assert strip.quantization == original.quantization
+
+
+def test_a_failing_jpegtran_falls_back(monkeypatch, jpegtran_on_path):
+    monkeypatch.setattr(
+        jpeg_splice.subprocess,
+        "run",
+        lambda args, **kw: subprocess.CompletedProcess(
+            args, 1, stdout=b"", stderr=b"jpegtran: unknown option -drop"
+        ),
+    )
+    source = make_jpeg()
+    before = decode(source)
+    after = before.copy()
+    after.paste((255, 0, 0), (0, 0, 32, 32))
+
+    assert splice_jpeg(source, before, after) is None
+
+
+def test_render_falls_back_to_a_full_encode(monkeypatch):
+    monkeypatch.setattr(jpeg_splice.shutil, "which", lambda name: None)
+    source = make_jpeg(size=(1200, 1100))
+    logo = Logo(place=(0, 944), size=(612, 137))
+
+    output = logo.render(decode(source), "", source_jpeg=source)
+
+    assert Image.open(output).size == (1200, 1100)
+
+
+@pytest.mark.skipif(shutil.which("jpegtran") is None, reason="needs jpegtran")
+def test_blocks_outside_the_overlay_survive_bit_for_bit():
+    source = make_jpeg(size=(1200, 1100))
+    before = decode(source)
+    logo = Logo(place=(0, 944), size=(612, 137))
+    after = logo.apply(before.copy())
+
+    spliced = splice_jpeg(source, before, after)
+    if spliced is None:
+        pytest.skip("this jpegtran has no -drop")
+
+    result = decode(spliced)
+    # One MCU row of slack: the decoder's chroma upsampling reads a row of
+    # neighbours, so the row touching the strip may shift by a level.
+    above_logo = (0, 0, 1200, 944 - 16)
+    assert (
+        ImageChops.difference(
+            before.crop(above_logo), result.crop(above_logo)
+        ).getbbox()
+        is None
+    )
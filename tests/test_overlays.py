@@ -6,8 +6,9 @@ import time
 
 import pytest
 import requests
-from PIL import Image, ImageChops
+from PIL import Image, ImageChops, ImageDraw, ImageFont, JpegImagePlugin
 
+import compositing
 import Overlays
 from Overlays import (
     AirQuality,
@@ -19,6 +20,7 @@ from Overlays import (
     epa_correct_pm25,
     pm25_to_aqi,
 )
+from paths import resolve_path
 
 
 def make_image_buffer(size=(1200, 1100), color=(10, 60, 40)):
@@ -30,9 +32,7 @@ def make_image_buffer(size=(1200, 1100), color=(10, 60, 40)):
 
 def test_logo_overlay_produces_image_of_same_size():
     logo = Logo(place=(0, 944), size=(612, 137))
-    logo.add_overlay(make_image_buffer(), "9:15 am Jul. 02, 2026")
-
-    result = Image.open(logo.overlayed)
+    result = Image.open(logo.add_overlay(make_image_buffer(), "9:15 am Jul. 02, 2026"))
     assert result.size == (1200, 1100)
 
 
@@ -44,9 +44,7 @@ def test_logo_overlay_with_cover_date():
         cover_date_bg_color=(0, 0, 0, 255),
         cover_date_size=(300, 30),
     )
-    logo.add_overlay(make_image_buffer(), "9:15 am Jul. 02, 2026")
-
-    result = Image.open(logo.overlayed)
+    result = Image.open(logo.add_overlay(make_image_buffer(), "9:15 am Jul. 02, 2026"))
     assert result.size == (1200, 1100)
 
 
@@ -54,13 +52,10 @@ def test_repeated_add_overlay_does_not_grow_buffer():
     logo = Logo(place=(0, 944), size=(612, 137))
 
     source = make_image_buffer()
-    logo.add_overlay(source, "")
-    first = logo.overlayed.getvalue()
-    logo.overlayed.read()  # Simulate an upload consuming the buffer
+    first = logo.add_overlay(source, "").getvalue()
 
     source.seek(0)
-    logo.add_overlay(source, "")
-    second = logo.overlayed.getvalue()
+    second = logo.add_overlay(source, "").getvalue()
 
     assert len(first) == len(second)
 
@@ -74,14 +69,11 @@ def test_composite_overlay_applies_all_and_does_not_grow_buffer():
     )
 
     source = make_image_buffer()
-    composite.add_overlay(source, "")
-    first = composite.overlayed.getvalue()
+    first = composite.add_overlay(source, "").getvalue()
     assert Image.open(io.BytesIO(first)).size == (1200, 1100)
 
-    composite.overlayed.read()
     source.seek(0)
-    composite.add_overlay(source, "")
-    assert len(composite.overlayed.getvalue()) == len(first)
+    assert len(composite.add_overlay(source, "").getvalue()) == len(first)
 
 
 def test_composite_overlay_uses_first_subname():
@@ -91,8 +83,7 @@ def test_composite_overlay_uses_first_subname():
             Logo(place=(140, 944), size=(612, 137)),
         ]
     )
-    _, file_name = composite.get_overlayed_img("smv")
-    assert file_name == "smv_nps.jpg"
+    assert composite.file_name("smv") == "smv_nps.jpg"
 
 
 class RecordingOverlay(Overlays.Overlay):
@@ -114,14 +105,15 @@ def test_composite_overlay_chains_decoded_images_and_encodes_once():
     feed, which all carry a logo and a badge.
     """
     first, second = RecordingOverlay(), RecordingOverlay()
+    for child in (first, second):  # Only the composite encodes
+        child.encode = lambda result: pytest.fail("a group member encoded")
     composite = CompositeOverlay([first, second])
 
-    composite.add_overlay(make_image_buffer(), "")
+    output = composite.add_overlay(make_image_buffer(), "")
 
     assert all(isinstance(i, Image.Image) for i in first.inputs + second.inputs)
     assert second.inputs[0] is first.inputs[0]  # Same canvas, no round-trip
-    assert first.overlayed.getvalue() == b""  # Only the composite encodes
-    assert Image.open(composite.overlayed).size == (1200, 1100)
+    assert Image.open(output).size == (1200, 1100)
 
 
 def test_overlays_encode_above_pillows_default_quality():
@@ -135,10 +127,78 @@ def test_overlays_encode_above_pillows_default_quality():
     noisy.save(baseline, format="JPEG", quality=75)
 
     logo = Logo(place=(0, 0), size=(1, 1))
-    logo.add_overlay(source, "")
+    output = logo.add_overlay(source, "")
 
     assert Overlays.JPEG_QUALITY >= 90
-    assert len(logo.overlayed.getvalue()) > 1.3 * len(baseline.getvalue())
+    assert len(output.getvalue()) > 1.3 * len(baseline.getvalue())
+
+
+def make_source_jpeg(quality=80, subsampling=0):
+    noisy = Image.effect_noise((320, 240), 40).convert("RGB")
+    source = io.BytesIO()
+    noisy.save(source, format="JPEG", quality=quality, subsampling=subsampling)
+    source.seek(0)
+    return source
+
+
+def test_no_encoding_block_encodes_as_before():
+    source = make_source_jpeg()
+    logo = Logo(place=(0, 0), size=(1, 1))
+    output = logo.add_overlay(source, "")
+
+    expected = io.BytesIO()
+    source.seek(0)
+    with Image.open(source) as image:
+        logo.apply(image.convert("RGB")).save(
+            expected, format="JPEG", quality=Overlays.JPEG_QUALITY
+        )
+    assert output.getvalue() == expected.getvalue()
+
+
+def test_keep_quality_reuses_the_source_tables_and_subsampling():
+    source = make_source_jpeg(quality=70, subsampling=0)
+    logo = Logo(place=(0, 0), size=(1, 1), encoding={"quality": "keep"})
+
+    output = logo.add_overlay(source, "")
+
+    source.seek(0)
+    with Image.open(source) as original, Image.open(output) as result:
+        assert result.quantization == original.quantization
+        assert JpegImagePlugin.get_sampling(result) == 0
+
+
+def test_keep_quality_of_an_unknown_source_falls_back_to_the_default():
+    frame = Image.new("RGB", (64, 64), (10, 60, 40))
+    assert Overlays.jpeg_save_options({"quality": "keep"}, frame) == {
+        "quality": Overlays.JPEG_QUALITY
+    }
+
+
+def test_encoding_flags_reach_the_encoder():
+    logo = Logo(
+        place=(0, 0),
+        size=(1, 1),
+        encoding={
+            "quality": 80,
+            "subsampling": "4:4:4",
+            "optimize": True,
+            "progressive": True,
+            "restart_marker_rows": 1,
+        },
+    )
+
+    encoded = logo.add_overlay(make_source_jpeg(), "").getvalue()
+    with Image.open(io.BytesIO(encoded)) as result:
+        assert result.info.get("progressive")
+        assert JpegImagePlugin.get_sampling(result) == 0
+    assert b"\xff\xdd" in encoded  # DRI: restart interval defined
+
+
+def test_a_composite_is_encoded_like_its_first_overlay():
+    first = Logo(place=(0, 0), size=(1, 1), encoding={"quality": 60})
+    second = Logo(place=(0, 0), size=(1, 1))
+
+    assert CompositeOverlay([first, second]).encoding == {"quality": 60}
 
 
 def test_air_quality_fetches_the_sensor_once_per_frame(monkeypatch):
@@ -151,17 +211,16 @@ def test_air_quality_fetches_the_sensor_once_per_frame(monkeypatch):
         return {"pm25": 10.0, "humidity": 40, "temperature": 71, "cf1_ratio": 1.0}
 
     monkeypatch.setattr(air_quality, "fetch_reading", fetch_reading)
-    air_quality.add_overlay(make_image_buffer(), "")
+    badge = drawn_badge(monkeypatch, air_quality)
 
     assert len(calls) == 1
-    assert air_quality.size != (0, 0)  # The badge was drawn with both values
+    assert badge is not None  # The badge was drawn with both values
 
 
-def test_get_overlayed_img_naming():
-    assert Logo(place=(0, 0), size=(1, 1)).get_overlayed_img("mg")[1] == "mg.jpg"
-    assert (
-        Logo(place=(0, 0), size=(1, 1), subname="nps").get_overlayed_img("mg")[1]
-        == "mg_nps.jpg"
+def test_file_name_naming():
+    assert Logo(place=(0, 0), size=(1, 1)).file_name("mg") == "mg.jpg"
+    assert Logo(place=(0, 0), size=(1, 1), subname="nps").file_name("mg") == (
+        "mg_nps.jpg"
     )
 
 
@@ -254,15 +313,39 @@ def stub_readings(monkeypatch, overlay, pm25=12.0, temperature=None):
     return overlay
 
 
+def drawn_badge(monkeypatch, overlay):
+    """The (size, place) the overlay pastes its badge at, or None if it doesn't."""
+    pasted = []
+    paste = compositing.paste
+
+    def recording_paste(image, widget, place):
+        pasted.append((widget.size, tuple(place)))
+        return paste(image, widget, place)
+
+    monkeypatch.setattr(compositing, "paste", recording_paste)
+    overlay.add_overlay(make_image_buffer(), "")
+    monkeypatch.setattr(compositing, "paste", paste)
+    return pasted[-1] if pasted else None
+
+
 def test_air_quality_overlay_anchors_bottom_right_by_default(monkeypatch):
     air_quality = stub_readings(monkeypatch, AirQuality(sensor_index=1))
 
-    air_quality.add_overlay(make_image_buffer(), "")
-    result = Image.open(air_quality.overlayed)
+    result = Image.open(air_quality.add_overlay(make_image_buffer(), ""))
     assert result.size == (1200, 1100)
 
-    width, height = air_quality.size
-    assert air_quality.place == (1200 - width - 20, 1100 - height - 20)
+    (width, height), place = drawn_badge(monkeypatch, air_quality)
+    assert place == (1200 - width - 20, 1100 - height - 20)
+
+
+def test_air_quality_overlay_keeps_no_state_from_a_render(monkeypatch):
+    """Feeds render on several threads at once, each working out its own place."""
+    air_quality = stub_readings(monkeypatch, AirQuality(sensor_index=1))
+
+    air_quality.add_overlay(make_image_buffer(), "")
+
+    assert air_quality.size == (0, 0)
+    assert air_quality.place == (0, 0)
 
 
 @pytest.mark.parametrize(
@@ -276,10 +359,8 @@ def test_air_quality_overlay_anchors_bottom_right_by_default(monkeypatch):
 )
 def test_air_quality_overlay_honours_every_anchor(monkeypatch, anchor, expected):
     air_quality = stub_readings(monkeypatch, AirQuality(sensor_index=1, anchor=anchor))
-    air_quality.add_overlay(make_image_buffer(), "")
 
-    x, y = air_quality.place
-    width, height = air_quality.size
+    (width, height), (x, y) = drawn_badge(monkeypatch, air_quality)
     horizontal = "left" if x == 20 else "right"
     vertical = "top" if y == 20 else "bottom"
     assert f"{horizontal}-{vertical}" == expected
@@ -292,8 +373,7 @@ def test_air_quality_overlay_honours_every_anchor(monkeypatch, anchor, expected)
 def test_air_quality_widget_grows_when_the_category_is_shown(monkeypatch):
     def widget_size(**kwargs):
         overlay = stub_readings(monkeypatch, AirQuality(sensor_index=1, **kwargs))
-        overlay.add_overlay(make_image_buffer(), "")
-        return overlay.size
+        return drawn_badge(monkeypatch, overlay)[0]
 
     with_category = widget_size(show_category=True)
     without_category = widget_size(show_category=False)
@@ -305,8 +385,7 @@ def test_air_quality_scale_shrinks_the_badge_and_its_margin(monkeypatch):
 
     def badge(**kwargs):
         overlay = stub_readings(monkeypatch, AirQuality(sensor_index=1, **kwargs))
-        overlay.add_overlay(make_image_buffer(), "")
-        return overlay.size, overlay.place
+        return drawn_badge(monkeypatch, overlay)
 
     (full_width, full_height), _ = badge()
     (half_width, half_height), half_place = badge(scale=0.5)
@@ -366,37 +445,36 @@ def test_air_quality_overlay_without_data_passes_image_through(monkeypatch):
     )
 
     source = make_image_buffer()
-    air_quality.add_overlay(source, "")
+    output = air_quality.add_overlay(source, "")
 
     source.seek(0)
     before = Image.open(source).convert("RGB")
-    after = Image.open(air_quality.overlayed).convert("RGB")
+    after = Image.open(output).convert("RGB")
     assert after.size == (1200, 1100)
     # Not just the same size — the same pixels, with nothing drawn on top
     assert ImageChops.difference(before, after).getbbox() is None
-    assert air_quality.size == (0, 0)
+    assert drawn_badge(monkeypatch, air_quality) is None
 
 
 def test_air_quality_badge_is_square_when_both_readings_are_present(monkeypatch):
     air_quality = stub_readings(
         monkeypatch, AirQuality(sensor_index=1), pm25=45.0, temperature=61.0
     )
-    air_quality.add_overlay(make_image_buffer(), "")
-    width, height = air_quality.size
+    width, height = drawn_badge(monkeypatch, air_quality)[0]
     assert width == height
 
 
 def test_air_quality_badge_collapses_when_only_one_reading_survives(monkeypatch):
     """A square with an empty half would read as broken."""
     aqi_only = stub_readings(monkeypatch, AirQuality(sensor_index=1), pm25=45.0)
-    aqi_only.add_overlay(make_image_buffer(), "")
-    assert aqi_only.size[0] > aqi_only.size[1]
+    width, height = drawn_badge(monkeypatch, aqi_only)[0]
+    assert width > height
 
     temp_only = stub_readings(
         monkeypatch, AirQuality(sensor_index=1), pm25=None, temperature=61.0
     )
-    temp_only.add_overlay(make_image_buffer(), "")
-    assert temp_only.size[0] > temp_only.size[1]
+    width, height = drawn_badge(monkeypatch, temp_only)[0]
+    assert width > height
 
 
 def test_air_quality_badge_omits_the_dot_when_only_temperature_survives(monkeypatch):
@@ -407,9 +485,9 @@ def test_air_quality_badge_omits_the_dot_when_only_temperature_survives(monkeypa
     both = stub_readings(
         monkeypatch, AirQuality(sensor_index=1), pm25=45.0, temperature=61.0
     )
-    temp_only.add_overlay(make_image_buffer(), "")
-    both.add_overlay(make_image_buffer(), "")
-    assert temp_only.size[0] < both.size[0]
+    assert (
+        drawn_badge(monkeypatch, temp_only)[0][0] < drawn_badge(monkeypatch, both)[0][0]
+    )
 
 
 class FakeResponse:
@@ -676,3 +754,98 @@ def test_pm25_can_publish_the_uncorrected_reading(purple_air):
 def test_pm25_without_a_reading(purple_air):
     purple_air.fetch_reading = lambda: None
     assert purple_air.pm25() is None
+
+
+def test_identical_badges_are_drawn_once_and_shared(monkeypatch):
+    """Eight west-side cameras on one sensor show the same badge twice a run."""
+    Overlays.badge_cache.clear()
+    draws = []
+    original = AirQuality._draw_widget
+
+    def counting_draw(self, *args):
+        draws.append(args)
+        return original(self, *args)
+
+    monkeypatch.setattr(AirQuality, "_draw_widget", counting_draw)
+
+    cameras = [
+        stub_readings(
+            monkeypatch, AirQuality(sensor_index=1), pm25=45.0, temperature=61
+        )
+        for _ in range(3)
+    ]
+    for camera in cameras:
+        camera.add_overlay(make_image_buffer(), "")
+
+    assert len(draws) == 1
+    assert Overlays.badge_cache.stats()["hits"] == 2
+    assert len({camera.size for camera in cameras}) == 1
+
+
+def test_badges_that_differ_in_content_or_style_are_drawn_separately(monkeypatch):
+    Overlays.badge_cache.clear()
+
+    for overlay, pm25 in [
+        (AirQuality(sensor_index=1), 45.0),
+        (AirQuality(sensor_index=1), 12.0),  # Another reading
+        (AirQuality(sensor_index=1, scale=0.67), 45.0),  # Another frame size
+    ]:
+        stub_readings(monkeypatch, overlay, pm25=pm25)
+        overlay.add_overlay(make_image_buffer(), "")
+
+    assert Overlays.badge_cache.stats() == {"hits": 0, "misses": 3, "entries": 3}
+
+
+def test_cover_date_patch_is_drawn_once_per_timestamp(monkeypatch):
+    """Both dark_sky feeds, and every repeat of the same minute, share one stamp."""
+    Overlays.cover_date_cache.clear()
+    draws = []
+    original = Logo._draw_cover_date_patch
+
+    def counting_draw(self, mod_time_str):
+        draws.append(mod_time_str)
+        return original(self, mod_time_str)
+
+    monkeypatch.setattr(Logo, "_draw_cover_date_patch", counting_draw)
+    feeds = [
+        Logo(place=(0, 604), size=(299, 68), subname="nps", cover_date=True),
+        Logo(place=(0, 619), size=(299, 68), cover_date=True),
+    ]
+
+    for minute in ("9:15 am Jul. 02, 2026", "9:15 am Jul. 02, 2026", "9:16 am"):
+        for feed in feeds:
+            feed.add_overlay(make_image_buffer(), minute)
+
+    assert draws == ["9:15 am Jul. 02, 2026", "9:16 am"]
+
+
+def test_old_cover_date_patches_are_evicted():
+    Overlays.cover_date_cache.clear()
+    logo = Logo(place=(0, 619), size=(299, 68), cover_date=True)
+    for minute in range(Overlays.cover_date_cache.max_entries + 5):
+        logo._cover_date_patch(f"9:{minute:02d} am")
+
+    assert len(Overlays.cover_date_cache) == Overlays.cover_date_cache.max_entries
+
+
+def test_cached_cover_date_matches_drawing_on_the_frame():
+    """The opaque default cover gives exactly the pixels of the direct draw."""
+    frame = Image.effect_noise((1021, 687), 60).convert("RGB")
+    stamp = "12:15 am Jul. 02, 2026"
+
+    expected = frame.copy()
+    with Image.open(resolve_path("overlays/corner-rectangle.png")) as cover_file:
+        cover = cover_file.convert("RGBA")
+    expected.paste(cover, (0, 0), cover)
+    ImageDraw.Draw(expected).text(
+        (4, 3),
+        stamp,
+        font=ImageFont.truetype(resolve_path("fonts/OpenSans-Bold.ttf"), 16),
+        fill=(255, 255, 255),
+    )
+
+    # A logo far off-frame, so only the cover date lands
+    logo = Logo(place=(5000, 5000), size=(299, 68), cover_date=True)
+    result = logo.apply(frame.copy(), stamp)
+
+    assert ImageChops.difference(result, expected).getbbox() is None
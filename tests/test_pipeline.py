@@ -0,0 +1,353 @@
+"""Tests for the download, render and upload stages of a round (no network)."""
+
+import threading
+from datetime import datetime, timezone
+from time import time
+
+import pytest
+
+import breaker
+import cadence
+import deadline
+import pipeline
+from pipeline import Pipeline
+from Webcam import PRIORITIES
+
+
+class FakeCam:
+    """Just the parts of a Webcam the pipeline calls."""
+
+    def __init__(self, name, feeds=("a.jpg",), unchanged=False, priorities=None):
+        self.name = name
+        self.feeds = feeds
+        # Feed file name to priority; the camera's is under None
+        self.priorities = priorities or {}
+        self.source_unchanged = unchanged
+        self.mod_time = None
+        self.uploads_sent = self.uploads_skipped = self.not_found_retries = 9
+        self.calls = []
+        self.uploaded = []
+        self.finished = None
+
+    def priority_rank(self, file_name=None):
+        priority = self.priorities.get(file_name) or self.priorities.get(None)
+        return PRIORITIES.index(priority or "normal")
+
+    def is_source_error(self, error):
+        return isinstance(error, FileNotFoundError)
+
+    def begin_upload(self):
+        self.calls.append("begin")
+
+    def fetch(self, max_retries=3):
+        self.calls.append("fetch")
+        self.fetch_retries = max_retries
+
+    def render(self, on_output=None):
+        self.calls.append("render")
+        for file_name in self.feeds:
+            on_output(file_name, f"{file_name} bytes")
+
+    def upload_output(self, output, file_name):
+        self.uploaded.append(file_name)
+
+    def finish_upload(self, succeeded=True):
+        self.finished = succeeded
+
+
+class FakeSchedule:
+    def __init__(self, due=True, delay=0.0):
+        self._due = due
+        self.delay = delay
+        self.poll_seconds = 0.0
+        self.polls = []
+
+    def due(self, now):
+        return self._due
+
+    def fetch_delay(self, now, limit=None):
+        return self.delay
+
+    def record_poll(self, now, mod_time, seconds):
+        self.polls.append(mod_time)
+
+
+def at(seconds):
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+def run(*cams, schedules=None, breakers=None, workers=2):
+    return Pipeline(workers, workers, workers).run(cams, schedules, breakers)
+
+
+def test_every_feed_is_uploaded_and_the_camera_finished():
+    cam = FakeCam("lpp", feeds=("lpp.jpg", "lpp_nps.jpg"))
+
+    assert run(cam) == []
+    assert sorted(cam.uploaded) == ["lpp.jpg", "lpp_nps.jpg"]
+    assert cam.finished is True
+
+
+def test_a_feed_uploads_while_the_next_is_still_rendering():
+    uploaded_first = threading.Event()
+
+    class SlowRender(FakeCam):
+        def render(self, on_output=None):
+            on_output("first.jpg", "first")
+            # Serial download-render-upload would never get here in time
+            assert uploaded_first.wait(timeout=5)
+            on_output("second.jpg", "second")
+
+        def upload_output(self, output, file_name):
+            super().upload_output(output, file_name)
+            uploaded_first.set()
+
+    cam = SlowRender("lpp")
+
+    assert run(cam) == []
+    assert cam.uploaded == ["first.jpg", "second.jpg"]
+
+
+def test_an_unchanged_source_is_not_rendered_or_uploaded():
+    cam = FakeCam("lpp", unchanged=True)
+
+    assert run(cam) == []
+    assert cam.calls == ["begin", "fetch"]
+    assert cam.uploaded == []
+    assert cam.finished is True
+
+
+def test_a_camera_not_due_never_enters_the_pipeline():
+    cam = FakeCam("lpp")
+    pipeline = Pipeline(1, 1, 1)
+
+    assert pipeline.run([cam], {"lpp": FakeSchedule(due=False)}) == []
+    assert cam.calls == []
+    assert cam.uploads_sent == cam.uploads_skipped == cam.not_found_retries == 0
+    assert pipeline.download.stats()["items"] == 0
+
+
+def test_a_completed_poll_is_recorded_with_its_schedule():
+    cam = FakeCam("lpp")
+    schedule = FakeSchedule(delay=0.01)
+
+    run(cam, schedules={"lpp": schedule})
+
+    assert schedule.polls == [None]
+
+
+@pytest.mark.parametrize("stage", ["fetch", "render", "upload_output"])
+def test_a_failure_is_reported_and_the_rest_of_the_round_goes_on(stage):
+    def boom(*args, **kwargs):
+        raise OSError(f"{stage} failed")
+
+    broken, healthy = FakeCam("broken"), FakeCam("healthy")
+    setattr(broken, stage, boom)
+
+    errors = run(broken, healthy)
+
+    assert len(errors) == 1
+    assert errors[0].startswith("broken failed.")
+    assert f"{stage} failed" in errors[0]
+    assert broken.finished is False  # Its source stamp isn't promoted
+    assert healthy.finished is True
+    assert healthy.uploaded == ["a.jpg"]
+
+
+def test_each_stage_counts_its_items():
+    cams = [FakeCam(f"cam{n}", feeds=("x.jpg", "y.jpg")) for n in range(3)]
+    pipeline = Pipeline(2, 2, 2)
+
+    pipeline.run(cams)
+
+    assert pipeline.download.stats()["items"] == 3
+    assert pipeline.render.stats()["items"] == 3
+    upload = pipeline.upload.stats()
+    assert upload["items"] == 6
+    assert 1 <= upload["max_depth"] <= 4  # Bounded at two per upload worker
+
+
+def test_higher_priority_feeds_upload_first():
+    """Feeds queued behind a busy upload worker go out highest priority first."""
+    release = threading.Event()
+    order = []
+
+    class Recording(FakeCam):
+        def upload_output(self, output, file_name):
+            if file_name == "busy.jpg":
+                assert release.wait(timeout=5)
+            order.append(file_name)
+
+        def render(self, on_output=None):
+            for file_name in self.feeds:
+                on_output(file_name, file_name)
+            release.set()
+
+    cam = Recording(
+        "lpp",
+        feeds=("busy.jpg", "lpp_nps.jpg", "lpp_hd.jpg"),
+        priorities={"lpp_nps.jpg": "low", "lpp_hd.jpg": "high"},
+    )
+
+    # One upload worker, whose queue holds the two feeds behind the busy one
+    assert Pipeline(1, 1, 1).run([cam]) == []
+    assert order == ["busy.jpg", "lpp_hd.jpg", "lpp_nps.jpg"]
+
+
+def test_low_priority_feeds_slip_first_near_the_deadline(monkeypatch):
+    monkeypatch.setattr(pipeline, "_SLIP_SLACK", (None, 0.0, 5.0))
+    cam = FakeCam(
+        "lpp",
+        feeds=("lpp.jpg", "lpp_nps.jpg"),
+        priorities={"lpp_nps.jpg": "low"},
+    )
+    round_ = Pipeline(1, 1, 1)
+    deadline.new_round(3)
+
+    errors = round_.run([cam])
+
+    assert errors == []
+    assert cam.uploaded == ["lpp.jpg"]
+    assert round_.slipped == 1
+    # Not published in full, so next round renders it again
+    assert cam.finished is False
+
+
+def test_only_high_priority_feeds_go_past_the_deadline():
+    cam = FakeCam(
+        "lpp",
+        feeds=("lpp.jpg", "lpp_hd.jpg"),
+        priorities={"lpp_hd.jpg": "high"},
+    )
+
+    deadline.new_round(0)
+
+    Pipeline(1, 1, 1).run([cam])
+
+    assert cam.uploaded == ["lpp_hd.jpg"]
+
+
+def test_a_camera_with_a_slipped_feed_is_due_again_next_round():
+    now = time()
+    schedule = cadence.Cadence("lpp")
+    for ago in (1800, 1200, 600):  # A source that changes every ten minutes
+        schedule.record_poll(now - ago + 5, at(now - ago), seconds=0.8)
+    cam = FakeCam("lpp", feeds=("lpp.jpg", "lpp_nps.jpg"), priorities={None: "low"})
+    cam.mod_time = at(now - 2)  # Its next frame, just in
+    deadline.new_round(0)
+
+    run(cam, schedules={"lpp": schedule})
+
+    assert cam.uploaded == []
+    assert cadence.Cadence("lpp").due(time())
+
+
+def test_a_camera_out_of_time_is_left_for_the_next_round():
+    class OutOfTime(FakeCam):
+        def fetch(self):
+            deadline.check("late download", wait=60)
+
+    deadline.new_round(30)
+    late, healthy = OutOfTime("late"), FakeCam("healthy")
+    schedule = FakeSchedule()
+
+    errors = run(late, healthy, schedules={"late": schedule})
+
+    assert errors == []  # Not a failure to email about
+    assert late.finished is False
+    assert schedule.polls == []
+    assert healthy.uploaded == ["a.jpg"]
+    assert deadline.stats()["hits"] == 1
+
+
+def failing_fetch(max_retries=3):
+    raise FileNotFoundError("lpp wasn't found in the folder.")
+
+
+def test_a_camera_with_an_open_breaker_is_left_out():
+    cam = FakeCam("lpp")
+    source = breaker.CircuitBreaker("lpp")
+    for _ in range(breaker.FAILURES_TO_OPEN):
+        source.record_failure(time())
+
+    assert run(cam, breakers={"lpp": source}) == []
+    assert cam.calls == []
+
+
+def test_the_failure_that_opens_the_breaker_is_reported_but_not_probes():
+    cam = FakeCam("lpp")
+    cam.fetch = failing_fetch
+    source = breaker.CircuitBreaker("lpp")
+    for _ in range(breaker.FAILURES_TO_OPEN - 1):
+        source.record_failure(time())
+
+    assert len(run(cam, breakers={"lpp": source})) == 1
+    assert source.open
+
+    source.next_probe = time()  # Probe due
+    assert run(cam, breakers={"lpp": source}) == []
+    assert cam.finished is False
+
+
+def test_a_tripped_source_that_is_not_due_uses_no_probe():
+    cam = FakeCam("lpp")
+    source = breaker.CircuitBreaker("lpp")
+    for _ in range(breaker.FAILURES_TO_OPEN):
+        source.record_failure(time() - breaker.FIRST_PROBE)  # Probe due
+    breaker.new_round()
+
+    run(cam, schedules={"lpp": FakeSchedule(due=False)}, breakers={"lpp": source})
+
+    assert cam.calls == []
+    assert breaker.stats() == {"skipped": 0, "probes": 0}
+
+
+def test_a_probe_is_a_single_attempt_and_closes_the_breaker_on_success():
+    cam = FakeCam("lpp")
+    source = breaker.CircuitBreaker("lpp")
+    for _ in range(breaker.FAILURES_TO_OPEN):
+        source.record_failure(time() - breaker.FIRST_PROBE)
+
+    run(cam, breakers={"lpp": source})
+
+    assert cam.fetch_retries == 1
+    assert cam.uploaded == ["a.jpg"]
+    assert not source.open
+
+
+def test_a_server_wide_fault_does_not_count_against_the_source():
+    def refused(max_retries=3):
+        raise EOFError("server hung up")
+
+    cam = FakeCam("lpp")
+    cam.fetch = refused
+    source = breaker.CircuitBreaker("lpp")
+
+    for _ in range(breaker.FAILURES_TO_OPEN):
+        assert len(run(cam, breakers={"lpp": source})) == 1  # Still reported
+
+    assert source.failures == 0
+    assert not source.open
+
+
+def test_a_phase_wait_that_would_slip_the_low_feeds_is_skipped():
+    """A cron round's 17.5s can't hold a 9s wait plus 5s of slack and the poll."""
+    now = time()
+    schedule = cadence.Cadence("lpp")
+    last_swap = now - 30 + 7  # Swaps every 30s, the next one 7s from now
+    for number in range(8):
+        changed = last_swap - (7 - number) * 30
+        schedule.record_poll(changed + 5, at(changed), seconds=4.0)
+    cam = FakeCam(
+        "lpp", feeds=("lpp.jpg", "lpp_nps.jpg"), priorities={"lpp_nps.jpg": "low"}
+    )
+    deadline.new_round(17.5)
+    started = time()
+
+    round_ = Pipeline(1, 1, 1)
+    assert round_.run([cam], {"lpp": schedule}) == []
+
+    assert time() - started < 2  # Fetched at once, not after the swap
+    assert sorted(cam.uploaded) == ["lpp.jpg", "lpp_nps.jpg"]
+    assert round_.slipped == 0
+    assert cadence.stats()["waited"] == 0
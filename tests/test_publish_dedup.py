@@ -0,0 +1,101 @@
+"""Tests for not re-uploading feeds glacier.org already has byte for byte."""
+
+import io
+import json
+
+import pytest
+
+from Overlays import Logo
+from Webcam import Webcam
+
+
+class RecordingFTP:
+    def __init__(self, fail_stor=False):
+        self.stored = []
+        self.fail_stor = fail_stor
+
+    def storbinary(self, cmd, fp):
+        if self.fail_stor:
+            raise EOFError("server hung up")
+        self.stored.append(cmd.split()[1].split(".")[0])
+
+    def rename(self, src, dst):
+        pass
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def ftp(monkeypatch):
+    ftp = RecordingFTP()
+    monkeypatch.setattr("Webcam.connect_ftp", lambda *a, **k: ftp)
+    return ftp
+
+
+def make_camera(nps=b"nps-frame", gnpc=b"gnpc-frame"):
+    cam = Webcam(name="lpp", file_name_on_server="lpp.jpg")
+    cam.outputs = [("lpp_nps.jpg", io.BytesIO(nps)), ("lpp.jpg", io.BytesIO(gnpc))]
+    return cam
+
+
+def test_identical_outputs_are_not_sent_again(ftp):
+    make_camera().upload_image(retry_delay=0)
+    assert ftp.stored == ["lpp_nps", "lpp"]
+
+    cam = make_camera()  # The next round, or the next cron run
+    cam.upload_image(retry_delay=0)
+
+    assert ftp.stored == ["lpp_nps", "lpp"]
+    assert (cam.uploads_sent, cam.uploads_skipped) == (0, 2)
+    assert cam.upload == []
+
+
+def test_only_the_changed_feed_is_sent(ftp):
+    make_camera().upload_image(retry_delay=0)
+
+    cam = make_camera(gnpc=b"new-gnpc-frame")
+    cam.upload_image(retry_delay=0)
+
+    assert ftp.stored == ["lpp_nps", "lpp", "lpp"]
+    assert (cam.uploads_sent, cam.uploads_skipped) == (1, 1)
+    assert cam.upload == ["https://glacier.org/webcam/lpp.jpg"]
+
+
+def test_a_failed_upload_is_not_recorded(monkeypatch, state_in_tmp):
+    failing = RecordingFTP(fail_stor=True)
+    monkeypatch.setattr("Webcam.connect_ftp", lambda *a, **k: failing)
+
+    with pytest.raises(EOFError):
+        make_camera().upload_image(max_retries=1, retry_delay=0)
+
+    assert not (state_in_tmp / "gnpc-published-lpp.json").exists()
+
+
+def test_feeds_sent_before_a_failure_are_recorded(monkeypatch, state_in_tmp):
+    class FailsSecondFTP(RecordingFTP):
+        def storbinary(self, cmd, fp):
+            if self.stored:
+                raise EOFError("server hung up")
+            super().storbinary(cmd, fp)
+
+    ftp = FailsSecondFTP()
+    monkeypatch.setattr("Webcam.connect_ftp", lambda *a, **k: ftp)
+
+    with pytest.raises(EOFError):
+        make_camera().upload_image(max_retries=1, retry_delay=0)
+
+    record = json.loads((state_in_tmp / "gnpc-published-lpp.json").read_text())
+    assert list(record) == ["lpp_nps.jpg"]
+
+
+def test_the_camera_uploads_its_feeds_highest_priority_first(ftp):
+    cam = make_camera()
+    cam.overlays = [
+        Logo(place=(185, 944), size=(612, 137), subname="nps", priority="low"),
+        Logo(place=(0, 944), size=(612, 137)),
+    ]
+
+    cam.upload_image(retry_delay=0)
+
+    assert ftp.stored == ["lpp", "lpp_nps"]
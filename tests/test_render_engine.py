@@ -0,0 +1,176 @@
+"""Tests for rendering frames in worker processes (RENDER_ENGINE=processes)."""
+
+import fcntl
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PIL import Image
+
+import deadline
+import render_engine
+from Overlays import Logo, _purple_air_cache_locked
+from Webcam import Webcam
+
+
+def make_frame_jpeg(size=(1200, 1100)):
+    buffer = io.BytesIO()
+    Image.effect_noise(size, 40).convert("RGB").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def shared_blocks():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+def a_logo():
+    return [Logo(place=(0, 944), size=(612, 137))]
+
+
+def start_engine():
+    return render_engine.ProcessEngine(
+        workers=1, overlays={"lpp": make_camera(b"").overlays, "logo": a_logo()}
+    )
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = start_engine()
+    yield engine
+    engine.shutdown()
+
+
+@pytest.fixture
+def running_engine(engine, monkeypatch):
+    monkeypatch.setattr(render_engine, "_engine", engine)
+    return engine
+
+
+def make_camera(source):
+    cam = Webcam(
+        name="lpp",
+        file_name_on_server="lpp.jpg",
+        logo_placements=[
+            (Logo(place=(185, 944), size=(612, 137), subname="nps"),),
+            (Logo(place=(0, 944), size=(612, 137)),),
+        ],
+    )
+    cam.file_buffer = io.BytesIO(source)
+    return cam
+
+
+def test_a_worker_renders_the_same_feeds_as_the_camera_thread(running_engine):
+    source = make_frame_jpeg()
+    in_worker = make_camera(source)
+    in_worker._apply_overlays()
+
+    render_engine._engine = None  # Back to rendering in threads
+    in_thread = make_camera(source)
+    in_thread._apply_overlays()
+
+    assert [name for name, _ in in_worker.outputs] == ["lpp_nps.jpg", "lpp.jpg"]
+    assert [out.getvalue() for _, out in in_worker.outputs] == [
+        out.getvalue() for _, out in in_thread.outputs
+    ]
+    assert in_worker.frames_decoded == 1
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs /dev/shm")
+def test_shared_memory_is_released_after_each_frame(engine):
+    before = shared_blocks()
+
+    outputs = engine.render("logo", make_frame_jpeg())
+
+    assert Image.open(outputs[0]).size == (1200, 1100)
+    assert shared_blocks() == before
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs /dev/shm")
+def test_a_broken_source_raises_in_the_camera_and_leaks_nothing(engine):
+    """The worker's error reaches process()'s truncated-image retry as is."""
+    before = shared_blocks()
+    truncated = make_frame_jpeg()[:2000]
+
+    with pytest.raises(OSError, match="truncated|broken data stream"):
+        engine.render("logo", truncated)
+
+    assert shared_blocks() == before
+
+
+def test_a_camera_the_workers_were_not_given_renders_in_its_thread(running_engine):
+    cam = make_camera(make_frame_jpeg())
+    cam.name = "unregistered"
+
+    cam._apply_overlays()
+
+    assert [name for name, _ in cam.outputs] == [
+        "unregistered_nps.jpg",
+        "unregistered.jpg",
+    ]
+
+
+def test_a_dead_worker_falls_back_to_this_process_until_the_next_round():
+    engine = start_engine()
+    try:
+        source = make_frame_jpeg()
+        expected = [out.getvalue() for out in engine.render("logo", source)]
+        broken = engine._pool
+        with pytest.raises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()  # The worker dies mid-job
+
+        rendered_here = engine.render("logo", source)
+
+        assert [out.getvalue() for out in rendered_here] == expected
+        assert engine._pool is broken  # No fork in the middle of a round
+
+        engine.new_round()
+        assert engine._pool is not broken
+        assert [out.getvalue() for out in engine.render("logo", source)] == expected
+    finally:
+        engine.shutdown()
+
+
+class HungLogo(Logo):
+    """A logo whose worker never finishes; the main process draws it as usual."""
+
+    def render(self, frame, mod_time_str="", source_jpeg=None):
+        if multiprocessing.parent_process() is not None:
+            time.sleep(60)
+        return super().render(frame, mod_time_str, source_jpeg)
+
+
+def test_a_hung_worker_is_waited_on_only_until_the_deadline():
+    engine = render_engine.ProcessEngine(
+        workers=1, overlays={"hung": [HungLogo(place=(0, 944), size=(612, 137))]}
+    )
+    try:
+        hung = engine._pool
+        deadline.new_round(0.5)
+        started = time.perf_counter()
+
+        outputs = engine.render("hung", make_frame_jpeg())
+
+        assert time.perf_counter() - started < 5
+        assert Image.open(outputs[0]).size == (1200, 1100)
+
+        deadline.new_round(None)
+        engine.new_round()  # Stops the stuck worker and forks a fresh one
+        assert engine._pool is not hung
+    finally:
+        engine.shutdown()
+
+
+def test_the_purpleair_cache_is_locked_across_processes():
+    """Another open of the lock file, as a second process makes, must wait."""
+    lock_path = os.path.join(tempfile.gettempdir(), "gnpc-purpleair.lock")
+    with _purple_air_cache_locked():
+        fd = os.open(lock_path, os.O_RDWR)
+        try:
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        finally:
+            os.close(fd)
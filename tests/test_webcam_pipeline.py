@@ -0,0 +1,209 @@
+"""Tests for how a Webcam turns one downloaded frame into its feeds (no network)."""
+
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import Webcam
+from Overlays import Logo, Overlay
+from Webcam import Webcam as WebcamClass
+
+
+def make_frame_buffer(size=(1200, 1100), color=(10, 60, 40)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    buffer.seek(0)
+    return buffer
+
+
+def looks_like_background(pixel, background=(10, 60, 40)):
+    """Within JPEG noise of the plain source frame."""
+    return max(abs(a - b) for a, b in zip(pixel, background)) < 8
+
+
+def make_camera(*overlays):
+    cam = WebcamClass(name="lpp", file_name_on_server="lpp.jpg")
+    cam.overlays = list(overlays)
+    cam.file_buffer = make_frame_buffer()
+    return cam
+
+
+def test_one_decode_serves_every_feed(monkeypatch):
+    """An NPS and a GNPC feed of one camera share a single JPEG decode."""
+    opened = []
+    real_open = Image.open
+
+    def counting_open(fp, *args, **kwargs):
+        if not isinstance(fp, str):  # Overlay PNGs are opened by path
+            opened.append(fp)
+        return real_open(fp, *args, **kwargs)
+
+    monkeypatch.setattr(Webcam.Image, "open", counting_open)
+    cam = make_camera(
+        Logo(place=(185, 944), size=(612, 137), subname="nps"),
+        Logo(place=(0, 944), size=(612, 137)),
+    )
+
+    cam._apply_overlays()
+
+    assert cam.frames_decoded == 1
+    assert len(opened) == 1
+    for _, output in cam.outputs:
+        assert Image.open(output).size == (1200, 1100)
+
+
+def test_feeds_do_not_see_each_others_overlays():
+    """Each feed draws on its own copy of the shared decode."""
+    nps = Logo(place=(600, 944), size=(400, 137), subname="nps")
+    gnpc = Logo(place=(0, 944), size=(400, 137))
+    cam = make_camera(nps, gnpc)
+
+    cam._apply_overlays()
+
+    outputs = dict(cam.outputs)
+    nps_frame = Image.open(outputs["lpp_nps.jpg"]).convert("RGB")
+    gnpc_frame = Image.open(outputs["lpp.jpg"]).convert("RGB")
+    inside_nps_logo, inside_gnpc_logo = (800, 1050), (200, 1050)
+
+    assert not looks_like_background(nps_frame.getpixel(inside_nps_logo))
+    assert not looks_like_background(gnpc_frame.getpixel(inside_gnpc_logo))
+    assert looks_like_background(gnpc_frame.getpixel(inside_nps_logo))
+    assert looks_like_background(nps_frame.getpixel(inside_gnpc_logo))
+
+
+def test_decode_count_restarts_each_round(monkeypatch):
+    cam = make_camera(Logo(place=(0, 944), size=(612, 137)))
+    source = cam.file_buffer.getvalue()
+
+    def download(*args, **kwargs):
+        cam.file_buffer = io.BytesIO(source)
+
+    monkeypatch.setattr(cam, "_download_image", download)
+
+    cam.process()
+    cam.process()
+    assert cam.frames_decoded == 1
+
+
+class BarrierOverlay(Overlay):
+    """Draws nothing, but only once the other feed is rendering too."""
+
+    def __init__(self, barrier, subname=None):
+        super().__init__(place=(0, 0), size=(0, 0), subname=subname)
+        self.barrier = barrier
+
+    def apply(self, image, mod_time_str=""):
+        self.barrier.wait()  # Breaks (and fails the test) if run one at a time
+        return image
+
+
+def test_a_cameras_feeds_render_side_by_side(monkeypatch):
+    monkeypatch.setattr(Webcam, "_render_pool", ThreadPoolExecutor(max_workers=2))
+    barrier = threading.Barrier(2, timeout=5)
+    cam = make_camera(BarrierOverlay(barrier, "nps"), BarrierOverlay(barrier))
+
+    cam._apply_overlays()
+
+    assert [name for name, _ in cam.outputs] == ["lpp_nps.jpg", "lpp.jpg"]
+    assert cam.render_seconds > 0
+
+
+def test_rendering_leaves_the_overlay_unchanged():
+    """The encoded feed is returned, not stashed, so renders can overlap."""
+    logo = Logo(place=(0, 944), size=(612, 137))
+    before = dict(vars(logo))
+    frame = Image.open(make_frame_buffer()).convert("RGB")
+
+    first = logo.render(frame)
+    second = logo.render(frame)
+
+    assert vars(logo) == before
+    assert first is not second
+    assert first.getvalue() == second.getvalue()
+
+
+def test_blackout_publishes_the_black_frame_to_every_feed():
+    cam = make_camera(
+        Logo(place=(185, 944), size=(612, 137), subname="nps"),
+        Logo(place=(0, 944), size=(612, 137)),
+    )
+    cam.blackout = True
+    cam._apply_blackout()
+
+    cam._apply_overlays()
+
+    black = cam.file_buffer.getvalue()
+    assert [(name, out.getvalue()) for name, out in cam.outputs] == [
+        ("lpp_nps.jpg", black),
+        ("lpp.jpg", black),
+    ]
+
+
+def test_blackout_reads_the_size_without_decoding(monkeypatch):
+    monkeypatch.setattr(
+        Webcam.Image, "open", lambda *a, **k: pytest.fail("source was decoded")
+    )
+    cam = make_camera(Logo(place=(0, 944), size=(612, 137)))
+
+    cam._apply_blackout()
+
+    assert cam.file_buffer.getvalue() == Webcam.black_frame((1200, 1100))
+
+
+def test_black_frames_are_encoded_once_per_size_and_quality():
+    assert Webcam.black_frame((1200, 1100)) is Webcam.black_frame((1200, 1100))
+    assert Webcam.black_frame((1200, 1100)) != Webcam.black_frame((1200, 1100), 90)
+    with Image.open(io.BytesIO(Webcam.black_frame((640, 480)))) as frame:
+        assert frame.size == (640, 480)
+        assert frame.convert("RGB").getextrema() == ((0, 0), (0, 0), (0, 0))
+
+
+class RecordingFTP:
+    def __init__(self):
+        self.stored = []
+
+    def storbinary(self, cmd, fp):
+        self.stored.append(cmd)
+
+    def rename(self, src, dst):
+        pass
+
+    def quit(self):
+        pass
+
+
+def blacked_out_round(cam):
+    cam.file_buffer = make_frame_buffer()
+    cam._apply_blackout()
+    cam._apply_overlays()
+    cam.upload_image(retry_delay=0)
+
+
+def test_a_published_black_frame_is_not_sent_again(monkeypatch):
+    ftp = RecordingFTP()
+    monkeypatch.setattr(Webcam, "connect_ftp", lambda *a, **k: ftp)
+    cam = make_camera(
+        Logo(place=(185, 944), size=(612, 137), subname="nps"),
+        Logo(place=(0, 944), size=(612, 137)),
+    )
+    cam.blackout = True
+
+    blacked_out_round(cam)
+    assert len(ftp.stored) == 2
+    assert len(cam.upload) == 2
+
+    blacked_out_round(cam)  # The next round, or the next cron run
+    assert len(ftp.stored) == 2
+    assert cam.upload == []
+
+    # Live frames go out in between; blacking out again must re-send
+    cam.blackout = False
+    cam.file_buffer = make_frame_buffer()
+    cam._apply_overlays()
+    cam.upload_image(retry_delay=0)
+    cam.blackout = True
+    blacked_out_round(cam)
+    assert len(ftp.stored) == 6
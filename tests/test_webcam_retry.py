@@ -27,10 +27,12 @@ class FlakyDownloadFTP:
     def sendcmd(self, cmd):
         return "213 20240101120000"
 
+    def mlsd(self, facts=None):
+        return [("hlt.jpg", {"type": "file", "size": "10", "modify": "20240101120000"})]
+
 
 def test_download_retries_on_transient_425(monkeypatch):
     """A 425 error_temp must be retried, not propagate and kill the camera."""
-    WebcamClass._download_ftp = None
     counter = [0]
     monkeypatch.setattr(
         Webcam, "connect_ftp", lambda *a, **k: FlakyDownloadFTP(counter, fail_times=1)
@@ -42,8 +44,6 @@ def test_download_retries_on_transient_425(monkeypatch):
     assert cam.file_buffer.getvalue() == b"jpeg-bytes"
     assert counter[0] == 1  # Failed once, then succeeded on retry
 
-    WebcamClass._download_ftp = None
-
 
 class VanishingFileFTP:
     """FTP stub whose RETR 550s while the frame is being replaced upstream.
@@ -66,10 +66,12 @@ class VanishingFileFTP:
     def sendcmd(self, cmd):
         return "213 20240101120000"
 
+    def mlsd(self, facts=None):
+        return []  # Listed mid-swap, so the stamp falls back to MDTM
+
 
 def test_missing_file_is_retried_for_every_attempt(monkeypatch):
     """The frame is swapped in place, so a 550 is usually gone a second later."""
-    WebcamClass._download_ftp = None
     counter = [0]
     monkeypatch.setattr(
         Webcam,
@@ -81,16 +83,14 @@ def test_missing_file_is_retried_for_every_attempt(monkeypatch):
     cam._download_image(retry_delay=0)  # Must not raise FileNotFoundError
 
     assert counter[0] == 2  # Two 550s ridden out, not just one
+    assert cam.not_found_retries == 2  # Reported in the round summary
     # The bytes from the failed attempts are dropped instead of being prepended
     # to the frame that finally arrives.
     assert cam.file_buffer.getvalue() == b"jpeg-bytes"
 
-    WebcamClass._download_ftp = None
-
 
 def test_a_file_that_never_appears_still_fails(monkeypatch):
     """A source that is genuinely gone has to reach the cron email."""
-    WebcamClass._download_ftp = None
     counter = [0]
     monkeypatch.setattr(
         Webcam,
@@ -104,10 +104,8 @@ def test_a_file_that_never_appears_still_fails(monkeypatch):
 
     assert counter[0] == 3  # Every attempt used before giving up
 
-    WebcamClass._download_ftp = None
 
-
-def test_download_closes_stale_connection_before_reconnecting():
+def test_download_closes_stale_connection_before_reconnecting(monkeypatch):
     """A dead shared connection must be QUIT, not just dropped.
 
     The server counts sessions, not sockets: an abandoned connection keeps its
@@ -117,13 +115,16 @@ def test_download_closes_stale_connection_before_reconnecting():
     quit_calls = []
 
     class DeadFTP:
+        def mlsd(self, facts=None):
+            raise BrokenPipeError("connection lost")
+
         def retrbinary(self, cmd, callback):
             raise BrokenPipeError("connection lost")
 
         def quit(self):
             quit_calls.append(self)
 
-    WebcamClass._download_ftp = DeadFTP()
+    monkeypatch.setattr(Webcam, "connect_ftp", lambda *a, **k: DeadFTP())
     cam = WebcamClass(name="hlt", file_name_on_server="hlt.jpg")
 
     try:
@@ -134,7 +135,7 @@ def test_download_closes_stale_connection_before_reconnecting():
         raise AssertionError("expected the download to fail")
 
     assert len(quit_calls) == 1
-    assert WebcamClass._download_ftp is None
+    assert WebcamClass._download_pool.open_connections == 0
 
 
 class RefusingFTPS:
@@ -160,7 +161,7 @@ def test_connection_limit_does_not_trigger_plain_ftp_fallback(monkeypatch):
         raise AssertionError("plain FTP must not be attempted after a 421")
 
     monkeypatch.setattr(Webcam, "_ftps_supported", None)
-    monkeypatch.setattr(Webcam, "FTP_TLS", RefusingFTPS)
+    monkeypatch.setattr(Webcam, "ResumingFTP_TLS", RefusingFTPS)
     monkeypatch.setattr(Webcam, "FTP", unexpected_plain_ftp)
     RefusingFTPS.instances.clear()
 
@@ -193,7 +194,7 @@ def test_ftps_failure_closes_socket_and_is_only_probed_once(monkeypatch):
             pass
 
     monkeypatch.setattr(Webcam, "_ftps_supported", None)
-    monkeypatch.setattr(Webcam, "FTP_TLS", NoTLSFTPS)
+    monkeypatch.setattr(Webcam, "ResumingFTP_TLS", NoTLSFTPS)
     monkeypatch.setattr(Webcam, "FTP", PlainFTP)
 
     for _ in range(3):
@@ -228,34 +229,24 @@ class HangingUpFTP:
         pass
 
 
-class SingleOverlay:
-    """Stands in for a Logo/overlay that already has its rendered image."""
-
-    def get_overlayed_img(self, name):
-        return io.BytesIO(b"jpeg-bytes"), f"{name}.jpg"
-
-
 def test_upload_retries_when_the_server_hangs_up(monkeypatch):
     """EOFError is not an OSError, so it needs naming to reach the retry path.
 
     A dropped control connection is the ordinary way a pooled session dies
     between uses; reconnecting is exactly what the retry loop is for.
     """
-    WebcamClass._upload_ftp = None
     counter = [0]
     monkeypatch.setattr(
         Webcam, "connect_ftp", lambda *a, **k: HangingUpFTP(counter, fail_times=1)
     )
 
     cam = WebcamClass(name="lpp", file_name_on_server="lpp.jpg")
-    cam.overlays = [SingleOverlay()]
+    cam.outputs = [("lpp.jpg", io.BytesIO(b"jpeg-bytes"))]  # One rendered feed
     cam.upload_image(retry_delay=0)  # Must not raise EOFError
 
     assert counter[0] == 1  # Hung up once, then succeeded on a fresh connection
     assert cam.upload == ["https://glacier.org/webcam/lpp.jpg"]
 
-    WebcamClass._upload_ftp = None
-
 
 def test_download_retries_when_the_server_hangs_up(monkeypatch):
     """The same dropped-session EOFError on the download pool."""
@@ -274,10 +265,12 @@ def test_download_retries_when_the_server_hangs_up(monkeypatch):
         def sendcmd(self, cmd):
             return "213 20240101120000"
 
+        def mlsd(self, facts=None):
+            return [("lpp.jpg", {"type": "file", "modify": "20240101120000"})]
+
         def quit(self):
             pass
 
-    WebcamClass._download_ftp = None
     counter = [0]
     monkeypatch.setattr(
         Webcam,
@@ -291,8 +284,6 @@ def test_download_retries_when_the_server_hangs_up(monkeypatch):
     assert cam.file_buffer.getvalue() == b"jpeg-bytes"
     assert counter[0] == 1
 
-    WebcamClass._download_ftp = None
-
 
 def test_a_hangup_does_not_downgrade_the_run_to_plain_ftp(monkeypatch):
     """A dropped socket is not a verdict on TLS support.
@@ -309,7 +300,7 @@ def test_a_hangup_does_not_downgrade_the_run_to_plain_ftp(monkeypatch):
         raise AssertionError("plain FTP must not be attempted after a hangup")
 
     monkeypatch.setattr(Webcam, "_ftps_supported", None)
-    monkeypatch.setattr(Webcam, "FTP_TLS", HangingUpFTPS)
+    monkeypatch.setattr(Webcam, "ResumingFTP_TLS", HangingUpFTPS)
     monkeypatch.setattr(Webcam, "FTP", unexpected_plain_ftp)
 
     with pytest.raises(EOFError):
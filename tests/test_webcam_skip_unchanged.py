@@ -0,0 +1,245 @@
+"""Tests for skipping FTP frames that haven't changed since they were published."""
+
+import json
+from ftplib import error_perm
+
+import pytest
+
+import ftp_listing
+import Webcam
+from Webcam import Webcam as WebcamClass
+
+
+class StampedFTP:
+    """Serves one source file whose MDTM and SIZE the test can change.
+
+    With `listing` off the server refuses MLSD, LIST and NLST alike, and only
+    answers per-file commands.
+    """
+
+    def __init__(
+        self, mdtm="20260810191709", size=10, size_supported=True, listing=True
+    ):
+        self.mdtm = mdtm
+        self.size = size
+        self.size_supported = size_supported
+        self.listing = listing
+        self.commands = []
+        self.retrieved = 0
+
+    def mlsd(self, facts=None):
+        self.commands.append("MLSD")
+        if not self.listing:
+            raise error_perm("500 Unknown command")
+        return [
+            ("lpp.jpg", {"type": "file", "size": str(self.size), "modify": self.mdtm}),
+            (".", {"type": "cdir"}),
+        ]
+
+    def retrlines(self, cmd, callback):
+        raise error_perm("500 Unknown command")
+
+    def nlst(self):
+        raise error_perm("500 Unknown command")
+
+    def sendcmd(self, cmd):
+        self.commands.append(cmd)
+        if cmd.startswith("MDTM"):
+            return f"213 {self.mdtm}"
+        if cmd.startswith("SIZE"):
+            if not self.size_supported:
+                raise error_perm("500 Unknown command")
+            return f"213 {self.size}"
+        return "200 OK"
+
+    def retrbinary(self, cmd, callback):
+        self.commands.append(cmd)
+        self.retrieved += 1
+        callback(b"jpeg-bytes")
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def ftp(monkeypatch):
+    ftp = StampedFTP()
+    monkeypatch.setattr(Webcam, "connect_ftp", lambda *a, **k: ftp)
+    return ftp
+
+
+def publish(cam, monkeypatch):
+    """Download and 'upload' without an upload server, the way a run does."""
+    monkeypatch.setattr(cam, "_process_overlay_files", lambda action: None)
+    cam._download_image()
+    cam.upload_image()
+
+
+def make_camera(name="lpp"):
+    return WebcamClass(name=name, file_name_on_server="lpp.jpg")
+
+
+def next_round(cam):
+    ftp_listing.new_round()
+    cam._download_image()
+
+
+def test_an_unchanged_file_is_not_downloaded_again(ftp, monkeypatch):
+    cam = make_camera()
+    publish(cam, monkeypatch)
+    assert ftp.retrieved == 1
+
+    next_round(cam)
+
+    assert cam.source_unchanged is True
+    assert ftp.retrieved == 1
+
+
+def test_the_listing_replaces_the_per_file_commands(ftp, monkeypatch):
+    cam = make_camera()
+    publish(cam, monkeypatch)
+
+    assert ftp.commands == ["MLSD", "RETR lpp.jpg"]
+    assert cam.mod_time_str == "1:17 pm Aug. 10, 2026"
+
+
+def test_one_listing_serves_every_camera_in_a_round(ftp):
+    for name in ("lpp", "lpp-copy", "lpp-again"):
+        make_camera(name)._download_image()
+
+    assert ftp.commands.count("MLSD") == 1
+    assert ftp.retrieved == 3
+
+
+@pytest.mark.parametrize("listing", [True, False])
+def test_the_stamp_is_taken_before_the_retr(monkeypatch, listing):
+    """A file swapped mid-download must look changed next round, not unchanged."""
+    ftp = StampedFTP(listing=listing)
+    monkeypatch.setattr(Webcam, "connect_ftp", lambda *a, **k: ftp)
+    publish(make_camera(), monkeypatch)
+
+    retr = ftp.commands.index("RETR lpp.jpg")
+    assert ftp.commands.index("MLSD") < retr
+    if not listing:
+        assert ftp.commands.index("MDTM lpp.jpg") < retr
+        assert ftp.commands.index("SIZE lpp.jpg") < retr
+
+
+@pytest.mark.parametrize("change", [{"mdtm": "20260810191739"}, {"size": 11}])
+def test_a_new_time_or_size_is_downloaded(ftp, monkeypatch, change):
+    cam = make_camera()
+    publish(cam, monkeypatch)
+
+    for attribute, value in change.items():
+        setattr(ftp, attribute, value)
+    next_round(cam)
+
+    assert cam.source_unchanged is False
+    assert ftp.retrieved == 2
+
+
+def test_an_unchanged_source_is_neither_processed_nor_uploaded(ftp, monkeypatch):
+    cam = make_camera()
+    publish(cam, monkeypatch)
+
+    applied, uploaded = [], []
+    monkeypatch.setattr(cam, "_apply_overlays", lambda *a: applied.append(1))
+    monkeypatch.setattr(cam, "_process_overlay_files", lambda a: uploaded.append(1))
+    cam.process()
+    cam.upload_image()
+
+    assert applied == [] and uploaded == []
+    assert cam.upload == []
+
+
+def test_the_stamp_is_only_recorded_after_a_successful_upload(
+    ftp, monkeypatch, state_in_tmp
+):
+    """A frame that never reached glacier.org must be fetched again, not skipped."""
+    cam = make_camera()
+    cam._download_image()
+
+    def failing_upload(action):
+        raise EOFError("server hung up")
+
+    monkeypatch.setattr(cam, "_process_overlay_files", failing_upload)
+    with pytest.raises(EOFError):
+        cam.upload_image()
+
+    assert not (state_in_tmp / "gnpc-ftp-source-lpp.json").exists()
+    next_round(cam)
+    assert ftp.retrieved == 2
+
+
+def test_a_stamp_for_another_file_is_ignored(ftp, state_in_tmp):
+    """Re-pointing a camera must not make its first fetch look unchanged."""
+    (state_in_tmp / "gnpc-ftp-source-lpp.json").write_text(
+        json.dumps({"file": "old.jpg", "mdtm": ftp.mdtm, "size": ftp.size})
+    )
+    cam = make_camera()
+
+    cam._download_image()
+
+    assert cam.source_unchanged is False
+    assert ftp.retrieved == 1
+
+
+def test_without_a_listing_mdtm_and_size_decide(monkeypatch):
+    ftp = StampedFTP(listing=False)
+    monkeypatch.setattr(Webcam, "connect_ftp", lambda *a, **k: ftp)
+    cam = make_camera()
+    publish(cam, monkeypatch)
+
+    ftp.size = 11
+    next_round(cam)
+
+    assert cam.source_unchanged is False
+    assert ftp.retrieved == 2
+
+
+def test_without_size_the_modification_time_decides(monkeypatch):
+    ftp = StampedFTP(size_supported=False, listing=False)
+    monkeypatch.setattr(Webcam, "connect_ftp", lambda *a, **k: ftp)
+    cam = make_camera()
+    publish(cam, monkeypatch)
+
+    next_round(cam)
+
+    assert cam.source_unchanged is True
+
+
+def test_without_mdtm_every_round_downloads(monkeypatch):
+    class NoMdtmFTP(StampedFTP):
+        def sendcmd(self, cmd):
+            if cmd.startswith("MDTM"):
+                raise error_perm("550 Not allowed")
+            return super().sendcmd(cmd)
+
+    ftp = NoMdtmFTP(listing=False)
+    monkeypatch.setattr(Webcam, "connect_ftp", lambda *a, **k: ftp)
+    cam = make_camera()
+    publish(cam, monkeypatch)
+
+    next_round(cam)
+
+    assert cam.source_unchanged is False
+    assert ftp.retrieved == 2
+
+
+def test_a_frame_swapped_since_the_listing_is_stamped_with_its_own_time(
+    ftp, monkeypatch
+):
+    """Fetched after a phase wait, the camera asks for the time of what it gets."""
+    clock = [1000.0]
+    monkeypatch.setattr(ftp_listing, "monotonic", lambda: clock[0])
+    make_camera("other")._download_image()  # Lists the directory for the round
+    ftp.mdtm = "20260810191739"  # The upstream swaps in the next frame
+    clock[0] += Webcam.LISTING_MAX_AGE + 5
+    ftp.commands.clear()
+
+    cam = make_camera()
+    cam._download_image()
+
+    assert ftp.commands == ["MDTM lpp.jpg", "TYPE I", "SIZE lpp.jpg", "RETR lpp.jpg"]
+    assert cam._pending_stamp["mdtm"] == "20260810191739"
+    assert cam.mod_time_str.startswith("1:17 pm")